@@ -1,41 +1,196 @@
 from fastapi import APIRouter, Depends, Form, Request
-from fastapi.responses import HTMLResponse, JSONResponse, RedirectResponse, FileResponse
+from typing import Optional
+import datetime
+from fastapi.responses import HTMLResponse, JSONResponse, RedirectResponse, FileResponse, PlainTextResponse, StreamingResponse
 from sqlalchemy.orm import Session
 from sqlalchemy import func
-from app.models.database import get_db
+from app.models.database import get_db, get_read_db
 from app.models.models import CreditApplication, FoundRisk, User, KnowledgeRule
 from app.services.learning_service import learning_service
 from app.services.kb_service import kb_service
-from app.core.deps import logger, require_admin
-from fastapi.templating import Jinja2Templates
+from app.services.analysis_service import analysis_service
+from app.services.export_service import export_service, ExportFilters, EXPORT_FORMATS
+from app.services.backtest_service import backtest_service
+from app.services.dedup_service import dedup_service
+from app.services.comparables_service import comparables_service
+from app.services.archive_service import archive_service
+from app.services.replication_service import replication_service
+from app.services.drift_service import drift_service
+from app.core.utils import FINANCIAL_LABELS
+from app.core.deps import logger, require_admin, read_log_tail, LOG_PATH
+from app.core.templates import templates, cached_fragment, fragment_cache
+from app.core.shared_state import bump, stats_generation
+from app.core.admission import admission_controller
+from app.core.profiling import list_profiles, profile_path, profile_summary
 from pathlib import Path
 import joblib
 import os
+import time
 
 router = APIRouter()
-TEMPLATES_DIR = Path(__file__).resolve().parent.parent / "templates"
-templates = Jinja2Templates(directory=str(TEMPLATES_DIR))
+
+# Записи в БД в обход приложения (generate_data.py и т.п.) счетчик не увеличивают —
+# поэтому фрагменты со статистикой в любом случае обновляются раз в STATS_CACHE_TTL секунд
+STATS_CACHE_TTL = int(os.getenv("STATS_CACHE_TTL", "60"))
+
+ADMIN_PAGE_SIZE = int(os.getenv("ADMIN_PAGE_SIZE", "50"))
+ADMIN_MAX_PAGE_SIZE = 500
+ADMIN_PROFILES_SHOWN = 10
+
+def _stats_version():
+    return stats_generation.value, int(time.time() // STATS_CACHE_TTL)
+
+def _page_bounds(page: int, per_page: int):
+    page = max(1, page)
+    per_page = max(1, min(per_page, ADMIN_MAX_PAGE_SIZE))
+    return page, per_page, (page - 1) * per_page
+
+def _pager(page: int, per_page: int, total: int) -> dict:
+    return {"page": page, "per_page": per_page, "total": total, "pages": max(1, -(-total // per_page))}
+
+def _list_users(db: Session, prefix: Optional[str], role: Optional[str], offset: int, limit: int):
+    query = db.query(User)
+    if prefix:
+        # Диапазон вместо LIKE: так используется индекс по username (LIKE в SQLite регистронезависим и индекс не берет)
+        query = query.filter(User.username >= prefix, User.username < prefix + "\U0010ffff")
+    if role:
+        query = query.filter(User.role == role)
+    total = query.count()
+    return query.order_by(User.id).offset(offset).limit(limit).all(), total
+
+def _rule_json(rule: KnowledgeRule) -> dict:
+    return {
+        "id": rule.id,
+        "risk_type": rule.risk_type,
+        "rule_name": rule.rule_name,
+        "condition": rule.condition_json,
+        "severity": rule.severity,
+        "recommendation": rule.recommendation,
+    }
 
 @router.get("/admin", response_class=HTMLResponse)
-async def admin_panel(request: Request, user = Depends(require_admin), db: Session = Depends(get_db)):
-    users_list = db.query(User).all()
-    rules_list = db.query(KnowledgeRule).all()
-    return templates.TemplateResponse("admin/admin.html", {"request": request, "user": user, "users": users_list, "rules": rules_list})
+async def admin_panel(
+    request: Request,
+    q: Optional[str] = None,
+    role: Optional[str] = None,
+    users_page: int = 1,
+    risk_type: Optional[str] = None,
+    severity: Optional[str] = None,
+    field: Optional[str] = None,
+    rules_page: int = 1,
+    user = Depends(require_admin),
+    db: Session = Depends(get_db)
+):
+    # Обе таблицы постраничные; отрисованная страница кэшируется по версии данных и параметрам запроса
+    query_key = str(request.url.query)
+
+    def users_context():
+        page, per_page, offset = _page_bounds(users_page, ADMIN_PAGE_SIZE)
+        users_list, total = _list_users(db, q, role, offset, per_page)
+        return {
+            "users": users_list,
+            "pager": _pager(page, per_page, total),
+            "page_url": lambda p: str(request.url.include_query_params(users_page=p)),
+        }
+
+    def rules_context():
+        page, per_page, offset = _page_bounds(rules_page, ADMIN_PAGE_SIZE)
+        rules_list, total = kb_service.list_rules(db, risk_type, severity, field, offset, per_page)
+        return {
+            "rules": rules_list,
+            "pager": _pager(page, per_page, total),
+            "page_url": lambda p: str(request.url.include_query_params(rules_page=p)),
+        }
+
+    users_table = cached_fragment("admin/_users_table.html", (_stats_version(), query_key), users_context)
+    rules_table = cached_fragment("admin/_rules_table.html", (kb_service.version, query_key), rules_context)
+    return templates.TemplateResponse("admin/admin.html", {
+        "request": request, "user": user, "users_table": users_table, "rules_table": rules_table,
+        "profiles": list_profiles(ADMIN_PROFILES_SHOWN),
+        "filters": {"q": q or "", "role": role or "", "risk_type": risk_type or "",
+                    "severity": severity or "", "field": field or ""}
+    })
+
+@router.get("/admin/api/users")
+def api_users(
+    q: Optional[str] = None,
+    role: Optional[str] = None,
+    page: int = 1,
+    per_page: int = ADMIN_PAGE_SIZE,
+    user = Depends(require_admin),
+    db: Session = Depends(get_db)
+):
+    """Страница пользователей в JSON (фильтры: префикс логина, роль)"""
+    page, per_page, offset = _page_bounds(page, per_page)
+    users_list, total = _list_users(db, q, role, offset, per_page)
+    return {
+        "items": [{"id": u.id, "username": u.username, "role": u.role} for u in users_list],
+        **_pager(page, per_page, total)
+    }
+
+@router.get("/admin/api/rules")
+def api_rules(
+    risk_type: Optional[str] = None,
+    severity: Optional[str] = None,
+    field: Optional[str] = None,
+    page: int = 1,
+    per_page: int = ADMIN_PAGE_SIZE,
+    user = Depends(require_admin),
+    db: Session = Depends(get_db)
+):
+    """Страница правил в JSON (фильтры: тип риска, серьезность, поле)"""
+    page, per_page, offset = _page_bounds(page, per_page)
+    rules_list, total = kb_service.list_rules(db, risk_type, severity, field, offset, per_page)
+    return {"items": [_rule_json(r) for r in rules_list], **_pager(page, per_page, total)}
 
 @router.post("/admin/delete_user/{user_id}")
 async def delete_user(user_id: int, user = Depends(require_admin), db: Session = Depends(get_db)):
     target = db.query(User).filter(User.id == user_id).first()
     if target and target.role != "admin":
         logger.info(f"Удален юзер: {target.username}")
+        # Архивные заявки удаляются и из файлов архива, а не только заглушки
+        archive_service.purge_user(db, target.id)
         db.delete(target)
         db.commit()
+        bump(stats_generation)
     return RedirectResponse(url="/admin", status_code=302)
 
 @router.get("/admin/download_log")
 async def download_log(user = Depends(require_admin)):
-    log_path = Path("app.log")
+    log_path = Path(LOG_PATH)
     return FileResponse(path=log_path, filename="logs.txt", media_type='text/plain')
 
+@router.get("/admin/log_tail", response_class=PlainTextResponse)
+def log_tail(kb: int = 64, user = Depends(require_admin)):
+    """Последние kb килобайт лога (по умолчанию 64 КБ)"""
+    kb = max(1, min(kb, 4096))
+    return PlainTextResponse(read_log_tail(kb * 1024))
+
+@router.get("/admin/export")
+def export_applications(
+    format: str = "csv",
+    gzip: bool = False,
+    date_from: Optional[datetime.date] = None,
+    date_to: Optional[datetime.date] = None,
+    user_id: Optional[int] = None,
+    industry: Optional[str] = None,
+    archive: bool = True,
+    user = Depends(require_admin)
+):
+    """Выгрузка заявок с рисками (CSV или NDJSON, опционально gzip) потоком; archive=false — без архивных"""
+    if format not in EXPORT_FORMATS:
+        return JSONResponse(content={"status": "error", "message": "Формат: csv или ndjson"}, status_code=400)
+
+    filters = ExportFilters(date_from=date_from, date_to=date_to, user_id=user_id, industry=industry)
+    logger.info(f"Админ {user.username} запустил выгрузку {format}")
+    filename = f"applications_{datetime.date.today():%Y%m%d}.{format}" + (".gz" if gzip else "")
+    media_type = "text/csv" if format == "csv" else "application/x-ndjson"
+    return StreamingResponse(
+        export_service.stream(format, filters, compress=gzip, include_archive=archive),
+        media_type="application/gzip" if gzip else media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
 @router.post("/admin/retrain")
 async def retrain_model(user = Depends(require_admin)):
     """Запуск переобучения модели"""
@@ -51,34 +206,95 @@ async def retrain_model(user = Depends(require_admin)):
             "message": result.get("message", "Ошибка при обучении")
         }, status_code=500)
 
+@router.post("/admin/dedup/rebuild")
+def rebuild_dedup_index(user = Depends(require_admin), db: Session = Depends(get_db)):
+    """Полная перестройка индекса почти-дубликатов заявок"""
+    try:
+        result = dedup_service.rebuild(db)
+    except Exception as e:
+        logger.error(f"Ошибка перестройки индекса дубликатов: {e}")
+        return JSONResponse(content={"status": "error", "message": str(e)}, status_code=500)
+    logger.info(f"Админ {user.username} перестроил индекс дубликатов: {result['indexed']} заявок")
+    return JSONResponse(content={"status": "success", **result})
+
+@router.get("/admin/drift")
+def drift_report(hours: int = 24, user = Depends(require_admin)):
+    """Дрейф входящих заявок относительно обучающей выборки (PSI/KS по признакам и вероятности)"""
+    report = drift_service.report(max(1, min(hours, 24 * 90)))
+    if report is None:
+        return JSONResponse(content={"status": "error", "message": "Нет эталона: переобучите модель"}, status_code=404)
+    return JSONResponse(content=report)
+
+@router.get("/admin/profiles")
+def profiles_list(limit: int = 50, user = Depends(require_admin)):
+    """Сохраненные профили запросов (новые первыми)"""
+    return JSONResponse(content={"items": list_profiles(max(1, min(limit, 500)))})
+
+@router.get("/admin/profiles/{profile_id}")
+def profile_download(profile_id: str, format: str = "raw", user = Depends(require_admin)):
+    """Файл профиля (.prof для pstats/snakeviz, .collapsed для flamegraph) или текстовая сводка (format=text)"""
+    path = profile_path(profile_id)
+    if path is None:
+        return JSONResponse(content={"status": "error", "message": "Профиль не найден"}, status_code=404)
+    if format == "text":
+        return PlainTextResponse(profile_summary(path))
+    return FileResponse(path=path, filename=os.path.basename(path), media_type="application/octet-stream")
+
+@router.get("/admin/cache_stats")
+async def cache_stats(user = Depends(require_admin)):
+    """Статистика кэша предсказаний модели"""
+    return JSONResponse(content={
+        "model_version": analysis_service.model_version,
+        "prediction_cache": analysis_service.prediction_cache.stats(),
+        "fragment_cache": fragment_cache.stats(),
+        "comparables_index": comparables_service.stats(),
+        "dedup_index": dedup_service.stats(),
+        "admission": admission_controller.stats(),
+        "replication": replication_service.stats()
+    })
+
 @router.get("/admin/stats", response_class=HTMLResponse)
-async def admin_stats(request: Request, user = Depends(require_admin), db: Session = Depends(get_db)):
+async def admin_stats(request: Request, user = Depends(require_admin), db: Session = Depends(get_read_db)):
     """Страница аналитики."""
-    
-    # 1. Общая статистика
-    total_apps = db.query(CreditApplication).count()
-    avg_rating = db.query(func.avg(CreditApplication.rating)).scalar() or 0
-    
-    # 2. Топ-5 частых рисков
-    # Группируем риски по названию источника и считаем
-    top_risks = db.query(
-        FoundRisk.source, 
-        func.count(FoundRisk.id).label('count')
-    ).group_by(FoundRisk.source).order_by(func.count(FoundRisk.id).desc()).limit(5).all()
-    
-    # 3. Распределение по отраслям
-    industries = db.query(
-        CreditApplication.industry,
-        func.count(CreditApplication.id).label('count')
-    ).group_by(CreditApplication.industry).all()
+    stats = {}
+
+    def collect():
+        # Запросы выполняются один раз и только если фрагменты устарели
+        if stats:
+            return stats
+
+        # 1. Общая статистика
+        stats["total_apps"] = db.query(CreditApplication).count()
+        stats["avg_rating"] = round(db.query(func.avg(CreditApplication.rating)).scalar() or 0, 2)
+        stats["archive"] = archive_service.stats(db)
+
+        # 2. Топ-5 частых рисков
+        # Группируем риски по названию источника и считаем
+        stats["top_risks"] = db.query(
+            FoundRisk.source,
+            func.count(FoundRisk.id).label('count')
+        ).group_by(FoundRisk.source).order_by(func.count(FoundRisk.id).desc()).limit(5).all()
 
+        # 3. Распределение по отраслям и средние показатели (агрегаты по столбцам, в SQL)
+        stats["industries"] = db.query(
+            CreditApplication.industry,
+            func.count(CreditApplication.id).label('count'),
+            func.avg(CreditApplication.current_ratio),
+            func.avg(CreditApplication.debt_to_equity),
+            func.avg(CreditApplication.net_profit_margin),
+        ).group_by(CreditApplication.industry).all()
+        return stats
+
+    version = _stats_version()
     return templates.TemplateResponse("admin/stats.html", {
         "request": request,
         "user": user,
-        "total_apps": total_apps,
-        "avg_rating": round(avg_rating, 2),
-        "top_risks": top_risks,
-        "industries": industries
+        "stats_summary": cached_fragment("admin/_stats_summary.html", version, collect),
+        "stats_tables": cached_fragment("admin/_stats_tables.html", version, collect),
+        "cache_stats": analysis_service.prediction_cache.stats(),
+        # Дрейф не кэшируется: включает текущее окно счетчиков процесса
+        "drift": drift_service.report(),
+        "labels": {**FINANCIAL_LABELS, "default_probability": "Вероятность дефолта (модель)"}
     })
 
 @router.post("/admin/add_rule")
@@ -115,6 +331,31 @@ async def add_rule(
     
     return RedirectResponse(url="/admin", status_code=302)
 
+@router.post("/admin/backtest_rule")
+def backtest_rule(
+    field: str = Form(...),
+    op: str = Form(...),
+    val: str = Form(...),
+    rule_id: Optional[str] = Form(None),
+    user = Depends(require_admin),
+    db: Session = Depends(get_db),
+    read_db: Session = Depends(get_read_db)
+):
+    """Как правило сработало бы на истории заявок (без сохранения правила)"""
+    condition = {"field": field, "op": op, "val": val}
+    try:
+        condition["val"] = float(val)
+    except ValueError:
+        pass
+
+    try:
+        result = backtest_service.backtest(
+            read_db, condition, kb_service.get_snapshot(db), int(rule_id) if rule_id else None
+        )
+    except ValueError as e:
+        return JSONResponse(content={"status": "error", "message": str(e)}, status_code=400)
+    return JSONResponse(content={"status": "success", **result})
+
 @router.post("/admin/edit_rule/{rule_id}")
 async def edit_rule(
     rule_id: int,
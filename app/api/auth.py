@@ -4,14 +4,12 @@ from sqlalchemy.orm import Session
 from app.models.database import get_db
 from app.models.models import User
 from passlib.context import CryptContext
-from fastapi.templating import Jinja2Templates
-from pathlib import Path
+from app.core.templates import templates
 from app.core.deps import logger
+from app.core.shared_state import bump, stats_generation
 
 router = APIRouter()
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
-TEMPLATES_DIR = Path(__file__).resolve().parent.parent / "templates"
-templates = Jinja2Templates(directory=str(TEMPLATES_DIR))
 
 @router.get("/login", response_class=HTMLResponse)
 async def login_page(request: Request):
@@ -52,6 +50,7 @@ async def register_post(
     new_user = User(username=username, hashed_password=hashed_pw, role="user")
     db.add(new_user)
     db.commit()
+    bump(stats_generation)
     logger.info(f"Новый пользователь: {username}")
     
     response = RedirectResponse(url="/login", status_code=302)
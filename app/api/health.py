@@ -0,0 +1,36 @@
+from fastapi import APIRouter
+from fastapi.responses import JSONResponse
+from sqlalchemy import text
+from app.models.database import ReadSessionLocal, SessionLocal, read_engine, engine
+from app.services.analysis_service import analysis_service
+
+router = APIRouter()
+
+@router.get("/healthz")
+async def healthz():
+    """Процесс жив (liveness)"""
+    return {"status": "ok"}
+
+@router.get("/readyz")
+def readyz():
+    """Готовность принимать заявки (readiness): модель загружена, БД (и реплика для чтения, если задана) доступна"""
+    checks = {"model": analysis_service.ready, "database": False}
+    sessions = {"database": SessionLocal}
+    if read_engine is not engine:
+        checks["read_database"] = False
+        sessions["read_database"] = ReadSessionLocal
+    for name, session_factory in sessions.items():
+        db = session_factory()
+        try:
+            db.execute(text("SELECT 1"))
+            checks[name] = True
+        except Exception:
+            pass
+        finally:
+            db.close()
+
+    ready = all(checks.values())
+    content = {"status": "ready" if ready else "starting", "checks": checks}
+    if analysis_service.model_error:
+        content["model_error"] = analysis_service.model_error
+    return JSONResponse(status_code=200 if ready else 503, content=content)
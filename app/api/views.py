@@ -1,24 +1,34 @@
 from fastapi import APIRouter, Depends, HTTPException, Request, Form, File, UploadFile
-from fastapi.responses import HTMLResponse
-from sqlalchemy.orm import Session
+from fastapi.responses import HTMLResponse, JSONResponse, Response, StreamingResponse
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import func
+from sqlalchemy.orm import Session, joinedload
+from app.core.cache import LRUCache
 from app.core.utils import FINANCIAL_LABELS
-from app.models.database import get_db
-from app.services.analysis_service import AnalysisService
-from app.services.data_service import DataProcessingService
-from app.services.kb_service import KnowledgeBaseService
-from app.models.models import CreditApplication, FoundRisk, ApplicationData
-from fastapi.templating import Jinja2Templates
-from pathlib import Path
+from app.models.database import get_db, get_read_db, SessionLocal
+from app.services.analysis_service import analysis_service
+from app.services.archive_service import archive_service
+from app.services.comparables_service import comparables_service
+from app.services.data_service import data_service as data_processor
+from app.services.job_service import job_queue, QueueFullError
+from app.services.portfolio_service import portfolio_service
+from app.models.models import CreditApplication, ArchivedApplication, FoundRisk, ApplicationData, AnalysisResult, Job, FINANCIAL_COLUMNS
+from app.core.templates import templates, template_version
+import asyncio
 import json
+import os
+import shutil
+import tempfile
 from app.core.deps import logger, require_user
 
 router = APIRouter()
-TEMPLATES_DIR = Path(__file__).resolve().parent.parent / "templates"
-templates = Jinja2Templates(directory=str(TEMPLATES_DIR))
 
-data_processor = DataProcessingService()
-kb_service = KnowledgeBaseService()
-analysis_service = AnalysisService(kb_service, data_processor)
+# Оцененная заявка и ее риски после /submit не меняются — страницу деталей
+# отдаем из кэша, а браузеру — 304 по ETag
+DETAILS_CACHE_SIZE = int(os.getenv("DETAILS_CACHE_SIZE", "2000"))
+DETAILS_MAX_AGE = int(os.getenv("DETAILS_MAX_AGE", "86400"))
+DETAILS_TEMPLATE_VERSION = template_version("base.html", "main/details.html")
+details_cache = LRUCache(DETAILS_CACHE_SIZE)
 
 @router.get("/", response_class=HTMLResponse)
 async def read_root(request: Request, user = Depends(require_user)):
@@ -26,7 +36,7 @@ async def read_root(request: Request, user = Depends(require_user)):
     return templates.TemplateResponse("main/index.html", {"request": request, "user": user})
 
 @router.post("/submit", response_class=HTMLResponse)
-async def submit_application(
+def submit_application(
     request: Request,
     company_name: str = Form(...),
     industry: str = Form(...),
@@ -37,9 +47,12 @@ async def submit_application(
     net_profit_margin: float = Form(None),
     company_age: int = Form(None),
     document: UploadFile = File(None),
+    async_mode: bool = Form(False),
     user = Depends(require_user),
     db: Session = Depends(get_db)
 ):
+    # Обычный def: разбор файла, модель, поиск дубликатов и аналогов и запись в БД идут
+    # в пуле потоков, а не в цикле событий
     user_id = user.id
     logger.info(f"Заявка от {user.username}: {company_name}")
 
@@ -50,8 +63,34 @@ async def submit_application(
         "company_age": company_age if company_age else 0
     }
 
+    if async_mode:
+        # Асинхронный режим: файл разбирает обработчик очереди, клиент получает номер задачи
+        input_data = ApplicationData(
+            company_name=company_name,
+            industry=industry,
+            financial_data=financials,
+            business_description=description
+        )
+        has_document = document is not None and bool(document.filename)
+        try:
+            job = job_queue.enqueue(
+                db, user, input_data,
+                document=document.file.read() if has_document else None,
+                document_name=document.filename if has_document else None
+            )
+        except QueueFullError as e:
+            return HTMLResponse(
+                content=f"<h2>{e}. Повторите попытку позже.</h2>",
+                status_code=503,
+                headers={"Retry-After": str(e.retry_after)}
+            )
+
+        if "application/json" in request.headers.get("accept", ""):
+            return JSONResponse(status_code=202, content={"job_id": job.id, "status_url": f"/result/{job.id}"})
+        return templates.TemplateResponse("main/job.html", {"request": request, "job": job, "user": user}, status_code=202)
+
     if document and document.filename:
-        file_data = await data_processor.parse_financial_document(document)
+        file_data = data_processor.parse_financial_bytes(document.file.read(), document.filename)
         if file_data:
             financials.update(file_data) # Подставляем данные из файла
 
@@ -68,36 +107,259 @@ async def submit_application(
         logger.error(f"Ошибка анализа: {e}")
         return HTMLResponse(content=f"<h2>Ошибка: {e}</h2>", status_code=500)
 
-    return templates.TemplateResponse("main/result.html", {"request": request, "result": result, "user": user})
+    return templates.TemplateResponse("main/result.html", {"request": request, "result": result, "user": user, "labels": FINANCIAL_LABELS})
+
+def _job_status(job: Job) -> dict:
+    return {
+        "job_id": job.id,
+        "status": job.status,
+        "application_id": job.application_id,
+        "error": job.error,
+        "result": job.result if job.status == "done" else None
+    }
+
+def _get_own_job(db: Session, job_id: int, user) -> Job:
+    job = job_queue.get_job(db, job_id)
+    if not job or (user.role != "admin" and job.user_id != user.id):
+        raise HTTPException(status_code=404, detail="Задача не найдена")
+    return job
+
+@router.get("/result/{job_id}", response_class=HTMLResponse)
+async def job_result(request: Request, job_id: int, user = Depends(require_user), db: Session = Depends(get_db)):
+    """Результат асинхронной заявки: JSON-статус (Accept: application/json) или страница"""
+    job = _get_own_job(db, job_id, user)
+
+    if "application/json" in request.headers.get("accept", ""):
+        return JSONResponse(content=_job_status(job))
+    if job.status == "done":
+        result = AnalysisResult(**job.result)
+        return templates.TemplateResponse("main/result.html", {"request": request, "result": result, "user": user, "labels": FINANCIAL_LABELS})
+    return templates.TemplateResponse("main/job.html", {"request": request, "job": job, "user": user})
+
+@router.get("/result/{job_id}/stream")
+async def job_result_stream(job_id: int, user = Depends(require_user), db: Session = Depends(get_db)):
+    """Server-Sent Events: статус задачи до завершения обработки"""
+    _get_own_job(db, job_id, user)
+
+    def load_status():
+        session = SessionLocal()
+        try:
+            job = job_queue.get_job(session, job_id)
+            return _job_status(job) if job else {"job_id": job_id, "status": "error", "error": "Задача удалена"}
+        finally:
+            session.close()
+
+    async def events():
+        last_status = None
+        for _ in range(600):  # не дольше ~5 минут
+            status = await run_in_threadpool(load_status)
+            if status["status"] != last_status:
+                last_status = status["status"]
+                yield f"event: status\ndata: {json.dumps(status, ensure_ascii=False)}\n\n"
+            if last_status in ("done", "error"):
+                return
+            await asyncio.sleep(0.5)
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+@router.get("/portfolio", response_class=HTMLResponse)
+async def portfolio_page(request: Request, user = Depends(require_user)):
+    """Пакетная оценка портфеля из CSV/XLSX."""
+    return templates.TemplateResponse("main/portfolio.html", {"request": request, "user": user})
+
+@router.post("/portfolio/upload")
+def portfolio_upload(
+    file: UploadFile = File(...),
+    user = Depends(require_user),
+    db: Session = Depends(get_db),
+):
+    """
+    Файл читается построчно, в память целиком не загружается. Ответ — CSV с результатами, отдается по мере обработки пачек;
+    прогресс — /portfolio/progress/{id} (id в заголовке X-Portfolio-Run).
+    """
+    name = file.filename or ""
+    if not name.lower().endswith((".csv", ".xlsx")):
+        raise HTTPException(status_code=400, detail="Поддерживаются только CSV и XLSX")
+
+    run = portfolio_service.start_run(db, user.id, name)
+    logger.info(f"Пакетная оценка {run.id}: {name} от {user.username}")
+    # UploadFile закрывается сразу после обработчика, а CSV отдается дольше — копируем в свой временный файл
+    source = tempfile.TemporaryFile()
+    shutil.copyfileobj(file.file, source)
+    source.seek(0)
+    # Слот допуска (AdmissionMiddleware) держится до конца отдачи CSV, а не до выхода из обработчика
+    return StreamingResponse(
+        portfolio_service.process_file(source, name, run.id, user.id),
+        media_type="text/csv",
+        headers={
+            "Content-Disposition": f'attachment; filename="portfolio_{run.id}.csv"',
+            "X-Portfolio-Run": str(run.id),
+        }
+    )
+
+@router.get("/portfolio/progress/{run_id}")
+def portfolio_progress(run_id: int, user = Depends(require_user), db: Session = Depends(get_db)):
+    run = portfolio_service.get_run(db, run_id)
+    if not run or (user.role != "admin" and run.user_id != user.id):
+        raise HTTPException(status_code=404, detail="Обработка не найдена")
+    return portfolio_service.run_progress(run)
 
 @router.get("/profile", response_class=HTMLResponse)
-async def profile(request: Request, user = Depends(require_user), db: Session = Depends(get_db)):
+async def profile(
+    request: Request,
+    user = Depends(require_user),
+    db: Session = Depends(get_read_db),
+    primary: Session = Depends(get_db)
+):
     """Личный кабинет. История заявок."""
     history = db.query(CreditApplication).filter(CreditApplication.user_id == user.id).order_by(CreditApplication.id.desc()).all()
-    return templates.TemplateResponse("main/profile.html", {"request": request, "user": user, "history": history})
+    if db.get_bind() is not primary.get_bind():
+        # Реплика может отставать: заявки новее ее последней (только что поданные) берем из основной БД
+        replica_max_id = db.query(func.max(CreditApplication.id)).scalar() or 0
+        fresh = primary.query(CreditApplication).filter(
+            CreditApplication.id > replica_max_id, CreditApplication.user_id == user.id
+        ).order_by(CreditApplication.id.desc()).all()
+        history = fresh + history
+    # Архивные заявки старше рабочих — идут в конце списка
+    archived = db.query(ArchivedApplication).filter(ArchivedApplication.user_id == user.id).order_by(ArchivedApplication.id.desc()).all()
+    return templates.TemplateResponse("main/profile.html", {"request": request, "user": user, "history": history + archived})
+
+def _details_etag(app_id: int, rating: int, kind: str) -> str:
+    return f'"app-{app_id}-{rating}-{DETAILS_TEMPLATE_VERSION}-{kind}"'
+
+def _etag_matches(request: Request, etag: str) -> bool:
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    candidates = [tag.strip().removeprefix("W/") for tag in header.split(",")]
+    return "*" in candidates or etag in candidates
+
+def _application_json(application: CreditApplication) -> dict:
+    return {
+        "id": application.id,
+        "company_name": application.company_name,
+        "industry": application.industry,
+        "created_at": application.created_at.isoformat() if application.created_at else None,
+        "rating": application.rating,
+        "financial_data": application.full_financial_data,
+        "business_description": application.business_description,
+        "risks": [
+            {
+                "risk_type": r.risk_type,
+                "source": r.source,
+                "severity": r.severity,
+                "recommendation": r.recommendation,
+            }
+            for r in application.risks
+        ],
+    }
+
+def _cached_details(request: Request, app_id: int, user, db: Session, primary: Session, kind: str) -> Response:
+    """
+    Общая логика /history/{id} (kind="html") и /history/{id}/json.
+    Права и ETag проверяются по легкому запросу (user_id, rating); полная загрузка
+    заявки с рисками (одним запросом) — только при промахе кэша.
+    """
+    row = db.query(CreditApplication.user_id, CreditApplication.rating).filter(
+        CreditApplication.id == app_id
+    ).first()
+    if row is None and db.get_bind() is not primary.get_bind():
+        # Реплика для чтения может отставать: только что поданная заявка есть лишь в основной БД
+        row = primary.query(CreditApplication.user_id, CreditApplication.rating).filter(
+            CreditApplication.id == app_id
+        ).first()
+        if row is not None:
+            db = primary
+    archived = row is None
+    if archived:
+        row = db.query(ArchivedApplication.user_id, ArchivedApplication.rating).filter(
+            ArchivedApplication.id == app_id
+        ).first()
+
+    # Проверка прав: админ видит всё, обычный юзер — только свои заявки
+    if not row or (user.role != "admin" and row.user_id != user.id):
+        raise HTTPException(status_code=404, detail="Заявка не найдена")
+
+    etag = _details_etag(app_id, row.rating, kind)
+    headers = {
+        "ETag": etag,
+        "Cache-Control": f"private, max-age={DETAILS_MAX_AGE}, immutable",
+        "Vary": "Cookie",
+    }
+    if _etag_matches(request, etag):
+        return Response(status_code=304, headers=headers)
+
+    key = (app_id, kind)
+    cached = details_cache.get(key)
+    if cached is None or cached[0] != etag:
+        if archived:
+            application = archive_service.get_application(db, app_id)
+            if application is None:
+                raise HTTPException(status_code=404, detail="Заявка не найдена")
+        else:
+            application = db.query(CreditApplication).options(
+                joinedload(CreditApplication.risks)
+            ).filter(CreditApplication.id == app_id).first()
+        if kind == "json":
+            body = json.dumps(_application_json(application), ensure_ascii=False)
+        else:
+            body = templates.get_template("main/details.html").render(
+                app=application, risks=application.risks, labels=FINANCIAL_LABELS
+            )
+        cached = (etag, body)
+        details_cache.set(key, cached)
+
+    media_type = "application/json" if kind == "json" else "text/html"
+    return Response(content=cached[1], media_type=media_type, headers=headers)
 
 @router.get("/history/{app_id}", response_class=HTMLResponse)
-async def application_details(
+def application_details(
     request: Request, 
     app_id: int, 
     user = Depends(require_user), 
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_read_db),
+    primary: Session = Depends(get_db)
 ):
     """Страница детального просмотра заявки."""
-    # Находим заявку
-    application = db.query(CreditApplication).filter(CreditApplication.id == app_id).first()
-    
-    # Проверка прав: админ видит всё, обычный юзер — только свои заявки
-    if not application or (user.role != "admin" and application.user_id != user.id):
+    return _cached_details(request, app_id, user, db, primary, "html")
+
+@router.get("/history/{app_id}/json")
+def application_details_json(
+    request: Request,
+    app_id: int,
+    user = Depends(require_user),
+    db: Session = Depends(get_read_db),
+    primary: Session = Depends(get_db)
+):
+    """Детали заявки в JSON (тот же кэш и ETag, что и у страницы)."""
+    return _cached_details(request, app_id, user, db, primary, "json")
+
+@router.get("/history/{app_id}/comparables")
+def application_comparables(
+    app_id: int,
+    user = Depends(require_user),
+    db: Session = Depends(get_read_db),
+    primary: Session = Depends(get_db)
+):
+    """
+    Аналоги заявки. Отдельный запрос со страницы деталей: набор аналогов меняется
+    с историей, а страница кэшируется по ETag как неизменная.
+    """
+    columns = (CreditApplication.user_id, *(getattr(CreditApplication, name) for name in FINANCIAL_COLUMNS))
+    row = db.query(*columns).filter(CreditApplication.id == app_id).first()
+    if row is None and db.get_bind() is not primary.get_bind():
+        row = primary.query(*columns).filter(CreditApplication.id == app_id).first()
+    if row is None:
+        application = archive_service.get_application(db, app_id)
+        if application is not None:
+            row = (application.user_id, *(getattr(application, name) for name in FINANCIAL_COLUMNS))
+    if not row or (user.role != "admin" and row[0] != user.id):
         raise HTTPException(status_code=404, detail="Заявка не найдена")
-    
-    # Получаем риски, связанные с этой заявкой
-    risks = db.query(FoundRisk).filter(FoundRisk.application_id == app_id).all()
-    
-    return templates.TemplateResponse("main/details.html", {
-        "request": request, 
-        "user": user, 
-        "app": application, 
-        "risks": risks,
-        "labels": FINANCIAL_LABELS
-    })
\ No newline at end of file
+
+    financial_data = {name: value for name, value in zip(FINANCIAL_COLUMNS, row[1:]) if value is not None}
+    return JSONResponse(content={
+        "ready": comparables_service.ready,
+        "comparables": comparables_service.find(
+            db, financial_data, exclude_id=app_id, user_id=user.id, is_admin=user.role == "admin"
+        ),
+    })
@@ -0,0 +1,200 @@
+"""
+Контроль допуска для дорогих эндпоинтов: /login (bcrypt), /submit (разбор файла, модель, запись в БД),
+/portfolio/upload (оценка целого файла в пуле процессов), /admin/retrain (обучение леса).
+
+Два уровня проверки:
+- корзина токенов на пользователя (для /login — на IP-адрес): скорость и запас зависят от роли;
+- ограничение числа одновременных запросов класса в процессе (в pre-fork режиме — в каждом воркере).
+
+Отказ быстрый: 429 (превышена скорость) или 503 (все слоты заняты) с заголовком Retry-After,
+запрос не ждет в очереди, тело запроса не читается и поток обработчика не занимается.
+"""
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+from http.cookies import SimpleCookie
+from typing import Optional
+
+from starlette.concurrency import run_in_threadpool
+from starlette.responses import JSONResponse
+
+from app.core.deps import logger
+
+# Число корзин в памяти; самые давно не использованные вытесняются (полная корзина равносильна новой)
+ADMISSION_MAX_KEYS = int(os.getenv("ADMISSION_MAX_KEYS", "10000"))
+
+# Скорость пополнения у операторов и админов выше, чем у обычных пользователей
+ROLE_RATE_MULTIPLIER = {"admin": 10.0, "operator": 4.0, "user": 1.0}
+
+
+class EndpointLimits:
+    def __init__(self, rate: float, burst: int, concurrency: int, by_ip: bool = False):
+        self.rate = rate  # запросов в секунду на ключ (для роли user)
+        self.burst = burst  # запас корзины: столько запросов подряд проходит без ожидания
+        self.concurrency = concurrency  # одновременных запросов класса на процесс
+        self.by_ip = by_ip  # ключ — IP клиента, а не пользователь
+
+
+def _limits(name: str, rate: float, burst: int, concurrency: int, by_ip: bool = False) -> EndpointLimits:
+    prefix = f"ADMISSION_{name.upper()}_"
+    return EndpointLimits(
+        rate=float(os.getenv(prefix + "RATE", str(rate))),
+        burst=int(os.getenv(prefix + "BURST", str(burst))),
+        concurrency=int(os.getenv(prefix + "CONCURRENCY", str(concurrency))),
+        by_ip=by_ip,
+    )
+
+
+ENDPOINT_LIMITS = {
+    "login": _limits("login", rate=0.2, burst=5, concurrency=4, by_ip=True),
+    "submit": _limits("submit", rate=0.5, burst=10, concurrency=8),
+    "portfolio": _limits("portfolio", rate=1 / 60, burst=3, concurrency=2),
+    "retrain": _limits("retrain", rate=1 / 600, burst=1, concurrency=1),
+}
+
+# (метод, путь) -> класс эндпоинта
+ADMISSION_ROUTES = {
+    ("POST", "/login"): "login",
+    ("POST", "/submit"): "submit",
+    ("POST", "/portfolio/upload"): "portfolio",
+    ("POST", "/admin/retrain"): "retrain",
+}
+
+
+class TokenBucket:
+    __slots__ = ("tokens", "updated")
+
+    def __init__(self, capacity: float, now: float):
+        self.tokens = capacity
+        self.updated = now
+
+    def take(self, rate: float, capacity: float, now: float) -> float:
+        """Берет токен; возвращает 0, если запрос допущен, иначе — сколько секунд ждать"""
+        self.tokens = min(capacity, self.tokens + (now - self.updated) * rate)
+        self.updated = now
+        if self.tokens >= 1.0:
+            self.tokens -= 1.0
+            return 0.0
+        return (1.0 - self.tokens) / rate
+
+
+class AdmissionController:
+    def __init__(self, limits: dict = ENDPOINT_LIMITS, max_keys: int = ADMISSION_MAX_KEYS):
+        self.limits = limits
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()
+        self._in_flight = {name: 0 for name in limits}
+        self._lock = threading.Lock()
+        self.counters = {name: {"admitted": 0, "rate_limited": 0, "overloaded": 0} for name in limits}
+
+    def check_rate(self, endpoint: str, key: str, role: Optional[str]) -> float:
+        """0 — в пределах скорости; иначе Retry-After в секундах"""
+        limits = self.limits[endpoint]
+        multiplier = ROLE_RATE_MULTIPLIER.get(role, 1.0)
+        rate, capacity = limits.rate * multiplier, limits.burst * multiplier
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get((endpoint, key))
+            if bucket is None:
+                bucket = self._buckets[(endpoint, key)] = TokenBucket(capacity, now)
+                if len(self._buckets) > self.max_keys:
+                    self._buckets.popitem(last=False)
+            else:
+                self._buckets.move_to_end((endpoint, key))
+            wait = bucket.take(rate, capacity, now)
+            if wait:
+                self.counters[endpoint]["rate_limited"] += 1
+            return wait
+
+    def acquire(self, endpoint: str) -> bool:
+        with self._lock:
+            if self._in_flight[endpoint] >= self.limits[endpoint].concurrency:
+                self.counters[endpoint]["overloaded"] += 1
+                return False
+            self._in_flight[endpoint] += 1
+            self.counters[endpoint]["admitted"] += 1
+            return True
+
+    def release(self, endpoint: str):
+        with self._lock:
+            self._in_flight[endpoint] -= 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "buckets": len(self._buckets),
+                "endpoints": {
+                    name: {**counters, "in_flight": self._in_flight[name], "concurrency": self.limits[name].concurrency}
+                    for name, counters in self.counters.items()
+                },
+            }
+
+
+admission_controller = AdmissionController()
+
+
+def _cookie_user(scope) -> tuple:
+    """(user_id, role) по cookie; (None, None) — аноним. Синхронный запрос к БД: вызывать через run_in_threadpool"""
+    from app.models.database import SessionLocal
+    from app.models.models import User
+
+    cookie_header = next((v for k, v in scope.get("headers", ()) if k == b"cookie"), b"")
+    cookie = SimpleCookie()
+    cookie.load(cookie_header.decode("latin-1"))
+    user_id = cookie.get("user_id")
+    if user_id is None or not user_id.value.isdigit():
+        return None, None
+    db = SessionLocal()
+    try:
+        role = db.query(User.role).filter(User.id == int(user_id.value)).scalar()
+    finally:
+        db.close()
+    # Несуществующий id в cookie не дает своей корзины — такой запрос ключуется по IP
+    return (int(user_id.value), role) if role is not None else (None, None)
+
+
+class AdmissionMiddleware:
+    """
+    Чистый ASGI middleware: решение принимается до чтения тела запроса (формы, файла),
+    поэтому отказ не тратит ни разбор multipart, ни поток обработчика. Слот класса
+    держится, пока ответ не отправлен целиком — для потоковой отдачи портфеля тоже.
+    """
+
+    def __init__(self, app, routes: dict = ADMISSION_ROUTES, controller: AdmissionController = admission_controller):
+        self.app = app
+        self.routes = routes
+        self.controller = controller
+
+    async def __call__(self, scope, receive, send):
+        endpoint = self.routes.get((scope.get("method"), scope.get("path"))) if scope["type"] == "http" else None
+        if endpoint is None:
+            await self.app(scope, receive, send)
+            return
+
+        client = scope.get("client")
+        client_ip = client[0] if client else "unknown"
+        user_id, role = (None, None) if self.controller.limits[endpoint].by_ip else await run_in_threadpool(_cookie_user, scope)
+        key = f"user:{user_id}" if user_id is not None else f"ip:{client_ip}"
+
+        wait = self.controller.check_rate(endpoint, key, role)
+        if wait:
+            logger.warning(f"Превышена частота запросов {endpoint}: {key}")
+            response = JSONResponse(
+                {"detail": "Слишком много запросов, повторите позже"}, status_code=429,
+                headers={"Retry-After": str(math.ceil(wait))}
+            )
+            await response(scope, receive, send)
+            return
+        if not self.controller.acquire(endpoint):
+            response = JSONResponse(
+                {"detail": "Сервер перегружен, повторите позже"}, status_code=503,
+                headers={"Retry-After": "1"}
+            )
+            await response(scope, receive, send)
+            return
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.controller.release(endpoint)
@@ -1,14 +1,146 @@
+import atexit
+import json
 import logging
+import os
+import queue
+from typing import Optional
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler, WatchedFileHandler
 from fastapi import Depends, Request, HTTPException
 from sqlalchemy.orm import Session
 from app.models.database import get_db
 from app.models.models import User
 
-logging.basicConfig(
-    filename='app.log',
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s'
-)
+LOG_PATH = os.getenv("LOG_PATH", "app.log")
+LOG_MAX_BYTES = int(os.getenv("LOG_MAX_BYTES", str(10 * 1024 * 1024)))
+LOG_BACKUP_COUNT = int(os.getenv("LOG_BACKUP_COUNT", "5"))
+
+
+class JsonFormatter(logging.Formatter):
+    """Одна запись лога = одна строка JSON"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False)
+
+
+# Логирование настраивается явно при старте процесса (setup_logging), импорт модуля потоков не запускает
+log_listener: Optional[QueueListener] = None
+_log_handler: Optional[logging.Handler] = None  # обработчик файла (или stderr) этого процесса
+_root_handler: Optional[logging.Handler] = None  # обработчик, добавленный в корневой логгер
+_log_pid = None
+
+
+def setup_logging(rotate: bool = True, background: bool = True):
+    """
+    background — запросы только кладут записи в очередь (QueueHandler), запись в файл идет
+    в отдельном потоке (QueueListener). Master pre-fork пишет в файл напрямую: в процессе,
+    который делает fork, не должно быть потоков.
+
+    rotate — ротация по размеру. Ротирует файл только один процесс (единственный или master
+    pre-fork, см. rotate_log_if_needed); воркеры пишут без ротации и переоткрывают файл
+    после переименования (WatchedFileHandler). Файл открывается при первой записи.
+    Повторный вызов в том же процессе ничего не делает.
+    """
+    global log_listener, _log_handler, _log_pid
+    if _log_pid == os.getpid():
+        return
+    if rotate:
+        handler = RotatingFileHandler(
+            LOG_PATH, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT, encoding="utf-8", delay=True
+        )
+    else:
+        handler = WatchedFileHandler(LOG_PATH, encoding="utf-8", delay=True)
+    handler.setFormatter(JsonFormatter())
+
+    # Слушатель, унаследованный после fork, в этом процессе не работает: у нас свои очередь и поток
+    listener = None
+    if background:
+        log_queue = queue.SimpleQueue()
+        listener = QueueListener(log_queue, handler, respect_handler_level=True)
+        _set_root_handler(QueueHandler(log_queue))
+        listener.start()
+    else:
+        _set_root_handler(handler)
+    if _log_handler is not None:
+        _log_handler.close()
+    log_listener, _log_handler, _log_pid = listener, handler, os.getpid()
+
+
+def _set_root_handler(handler: logging.Handler):
+    global _root_handler
+    root = logging.getLogger()
+    root.setLevel(logging.INFO)
+    if _root_handler is not None:
+        root.removeHandler(_root_handler)
+    root.addHandler(handler)
+    _root_handler = handler
+
+
+def _stop_log_listener():
+    # Останавливаем только свой слушатель, а не унаследованный от родителя
+    if log_listener is not None and _log_pid == os.getpid():
+        log_listener.stop()
+
+
+atexit.register(_stop_log_listener)
+
+
+def _restart_log_listener():
+    # Поток слушателя не переживает fork: в дочернем процессе — новый слушатель со своей очередью.
+    # Ротацию оставляем родителю, дочерний процесс переоткрывает файл после нее
+    if _log_pid is not None and isinstance(_log_handler, (RotatingFileHandler, WatchedFileHandler)):
+        setup_logging(rotate=False)
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_restart_log_listener)
+
+
+def rotate_log_if_needed():
+    """Ротация по размеру из процесса-владельца, даже если сам он почти не пишет в лог (master pre-fork)"""
+    handler = _log_handler
+    if not isinstance(handler, RotatingFileHandler):
+        return
+    handler.acquire()
+    try:
+        if os.path.isfile(LOG_PATH) and os.path.getsize(LOG_PATH) >= LOG_MAX_BYTES:
+            handler.doRollover()
+    finally:
+        handler.release()
+
+
+def use_stderr_logging(level: int = logging.WARNING):
+    """Для процессов пула (spawn): файл лога не открывается, предупреждения и ошибки — в stderr"""
+    global _log_handler
+    handler = logging.StreamHandler()
+    handler.setFormatter(JsonFormatter())
+    handler.setLevel(level)
+    _set_root_handler(handler)
+    _log_handler = handler
+
+
+def read_log_tail(max_bytes: int) -> str:
+    """Последние max_bytes байт лога без чтения всего файла"""
+    if not os.path.exists(LOG_PATH):
+        return ""
+    with open(LOG_PATH, "rb") as f:
+        f.seek(0, os.SEEK_END)
+        size = f.tell()
+        f.seek(max(0, size - max_bytes))
+        data = f.read()
+    if size > max_bytes:
+        # Отбрасываем обрезанную первую строку
+        data = data.split(b"\n", 1)[-1]
+    return data.decode("utf-8", errors="replace")
+
+
 logger = logging.getLogger(__name__)
 
 # Зависимость для получения текущего пользователя через Cookie
@@ -29,4 +161,4 @@ def require_user(user = Depends(get_current_user)):
 def require_admin(user = Depends(get_current_user)):
     if not user or user.role != "admin":
         raise HTTPException(status_code=403, detail="Доступ запрещен")
-    return user
\ No newline at end of file
+    return user
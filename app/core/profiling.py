@@ -0,0 +1,279 @@
+"""
+Профилирование отдельных запросов по требованию администратора.
+
+Включается заголовком `X-Profile: 1` (детерминированный cProfile) или `X-Profile: sample`
+(семплирование стеков), либо параметром `?profile=1` / `?profile=sample`. Кроме того,
+PROFILE_SAMPLE_EVERY=N профилирует семплированием каждый N-й запрос без участия админа.
+
+Без флага и при PROFILE_SAMPLE_EVERY=0 middleware лишь проверяет заголовки — профилировщики
+не создаются и не включаются. В процессе одновременно снимается один профиль: остальные
+запросы с флагом выполняются без профилирования (заголовок X-Profile-Skipped: busy).
+"""
+import cProfile
+import io
+import itertools
+import json
+import logging
+import os
+import pstats
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from http.cookies import SimpleCookie
+from typing import List, Optional
+
+from starlette.concurrency import run_in_threadpool
+
+logger = logging.getLogger(__name__)
+
+PROFILE_DIR = os.getenv("PROFILE_DIR", os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), "profiles"))
+PROFILE_SAMPLE_EVERY = int(os.getenv("PROFILE_SAMPLE_EVERY", "0"))
+PROFILE_SAMPLE_INTERVAL = float(os.getenv("PROFILE_SAMPLE_INTERVAL", "0.005"))
+PROFILE_KEEP = int(os.getenv("PROFILE_KEEP", "200"))
+PROFILE_ID_RE = re.compile(r"^[0-9A-Za-z_-]+$")
+
+_HEADER = b"x-profile"
+# Листовые кадры ожидания: потоки, которые в них стоят, простаивают и в профиль не попадают
+_IDLE_LEAVES = {"threading:wait", "selectors:select", "queue:get", "logging.handlers:dequeue"}
+_counter = itertools.count(1)
+# Один профиль на процесс: cProfile в цикле событий учитывает все корутины, а не только профилируемый
+# запрос, и с Python 3.12 второй enable() при активном профилировщике падает с ValueError.
+# Запросы, пришедшие во время профилирования, выполняются без него
+_profile_lock = threading.Lock()
+
+
+class StackSampler:
+    """
+    Семплирующий профилировщик: фоновый поток раз в interval снимает стеки всех потоков
+    (sys._current_frames) и считает одинаковые стеки. Результат — collapsed stacks
+    ("поток;модуль:функция;... число"), формат flamegraph.pl и speedscope.
+    """
+
+    def __init__(self, interval: float = PROFILE_SAMPLE_INTERVAL):
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="profile-sampler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        own = threading.get_ident()
+        names = {}
+        while not self._stop.wait(self.interval):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own:
+                    continue
+                if thread_id not in names:
+                    names = {t.ident: t.name for t in threading.enumerate()}
+                stack = []
+                while frame is not None:
+                    stack.append(f"{frame.f_globals.get('__name__', '?')}:{frame.f_code.co_name}")
+                    frame = frame.f_back
+                if not stack or stack[0] in _IDLE_LEAVES:
+                    continue
+                stack.append(names.get(thread_id, str(thread_id)))
+                self.stacks[";".join(reversed(stack))] += 1
+
+    def dump(self, path: str):
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+
+def _requested_mode(scope) -> Optional[str]:
+    """Режим из заголовка X-Profile или параметра profile (None — профилирование не запрошено)"""
+    for name, value in scope.get("headers", ()):
+        if name == _HEADER:
+            return "sample" if value.strip().lower() == b"sample" else "cprofile"
+    query = scope.get("query_string", b"")
+    if b"profile=" in query:
+        for part in query.split(b"&"):
+            if part.startswith(b"profile="):
+                value = part[len(b"profile="):].lower()
+                if value in (b"", b"0", b"false"):
+                    return None
+                return "sample" if value == b"sample" else "cprofile"
+    return None
+
+
+def _is_admin(scope) -> bool:
+    """Синхронный запрос к БД: из цикла событий вызывать через run_in_threadpool"""
+    from app.models.database import SessionLocal
+    from app.models.models import User
+
+    cookie_header = next((v for k, v in scope.get("headers", ()) if k == b"cookie"), b"")
+    cookie = SimpleCookie()
+    cookie.load(cookie_header.decode("latin-1"))
+    user_id = cookie.get("user_id")
+    if user_id is None or not user_id.value.isdigit():
+        return False
+    db = SessionLocal()
+    try:
+        role = db.query(User.role).filter(User.id == int(user_id.value)).scalar()
+    finally:
+        db.close()
+    return role == "admin"
+
+
+def _profile_id(scope) -> str:
+    slug = re.sub(r"[^0-9A-Za-z]+", "_", scope.get("path", "")).strip("_")[:40] or "root"
+    return f"{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}-{next(_counter)}-{slug}"
+
+
+class ProfilingMiddleware:
+    """Чистый ASGI middleware: не буферизует тело ответа и не меняет поток запроса"""
+
+    def __init__(self, app, sample_every: int = PROFILE_SAMPLE_EVERY, profile_dir: str = PROFILE_DIR):
+        self.app = app
+        self.sample_every = sample_every
+        self.profile_dir = profile_dir
+        self._requests = itertools.count(1)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        mode = _requested_mode(scope)
+        trigger = "admin"
+        # Флаг может прислать кто угодно: проверка роли не должна блокировать цикл событий
+        if mode is not None and not await run_in_threadpool(_is_admin, scope):
+            mode = None
+        if mode is None and self.sample_every and next(self._requests) % self.sample_every == 0:
+            mode, trigger = "sample", "auto"
+        if mode is None:
+            await self.app(scope, receive, send)
+            return
+        if not _profile_lock.acquire(blocking=False):
+            await self.app(scope, receive, self._skipped_send(send) if trigger == "admin" else send)
+            return
+        try:
+            await self._profile(scope, receive, send, mode, trigger)
+        finally:
+            _profile_lock.release()
+
+    @staticmethod
+    def _skipped_send(send):
+        """Админ видит, что профиль не снят: другой запрос процесса уже профилируется"""
+        async def send_skipped(message):
+            if message["type"] == "http.response.start":
+                message = {**message, "headers": [*message.get("headers", []), (b"x-profile-skipped", b"busy")]}
+            await send(message)
+        return send_skipped
+
+    async def _profile(self, scope, receive, send, mode: str, trigger: str):
+        profile_id = _profile_id(scope)
+        status = {"code": None}
+
+        async def send_with_id(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+                if trigger == "admin":
+                    message = {**message, "headers": [*message.get("headers", []),
+                                                      (b"x-profile-id", profile_id.encode())]}
+            await send(message)
+
+        profiler = cProfile.Profile() if mode == "cprofile" else StackSampler()
+        started = time.perf_counter()
+        if mode == "cprofile":
+            # cProfile видит только поток цикла событий: для синхронных (def) обработчиков — режим sample
+            profiler.enable()
+        else:
+            profiler.start()
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            if mode == "cprofile":
+                profiler.disable()
+            else:
+                profiler.stop()
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            try:
+                self._save(profile_id, profiler, mode, trigger, scope, status["code"], elapsed_ms)
+            except OSError as e:
+                logger.warning(f"Профиль {profile_id} не сохранен: {e}")
+
+    def _save(self, profile_id: str, profiler, mode: str, trigger: str, scope, status_code, elapsed_ms: float):
+        os.makedirs(self.profile_dir, exist_ok=True)
+        base = os.path.join(self.profile_dir, profile_id)
+        if mode == "cprofile":
+            profiler.dump_stats(base + ".prof")
+        else:
+            profiler.dump(base + ".collapsed")
+        meta = {
+            "id": profile_id,
+            "mode": mode,
+            "trigger": trigger,
+            "method": scope.get("method"),
+            "path": scope.get("path"),
+            "status": status_code,
+            "duration_ms": round(elapsed_ms, 1),
+            "created_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+        }
+        # Метаданные пишем последними: по ним строится список, файл профиля к этому моменту готов
+        with open(base + ".json", "w", encoding="utf-8") as f:
+            json.dump(meta, f, ensure_ascii=False)
+        logger.info(f"Профиль запроса {meta['method']} {meta['path']} сохранен: {profile_id} ({elapsed_ms:.0f} мс)")
+        prune_profiles(self.profile_dir)
+
+
+def prune_profiles(profile_dir: str = PROFILE_DIR, keep: int = PROFILE_KEEP):
+    """Удаляет самые старые профили сверх keep"""
+    metas = sorted(
+        (e for e in os.scandir(profile_dir) if e.name.endswith(".json")),
+        key=lambda e: e.stat().st_mtime, reverse=True
+    )
+    for entry in metas[keep:]:
+        profile_id = entry.name[:-len(".json")]
+        for ext in (".json", ".prof", ".collapsed"):
+            try:
+                os.remove(os.path.join(profile_dir, profile_id + ext))
+            except FileNotFoundError:
+                pass
+
+
+def list_profiles(limit: int = 50, profile_dir: str = PROFILE_DIR) -> List[dict]:
+    """Последние профили (новые первыми) по файлам метаданных"""
+    if not os.path.isdir(profile_dir):
+        return []
+    metas = sorted(
+        (e for e in os.scandir(profile_dir) if e.name.endswith(".json")),
+        key=lambda e: e.stat().st_mtime, reverse=True
+    )[:limit]
+    result = []
+    for entry in metas:
+        try:
+            with open(entry.path, encoding="utf-8") as f:
+                result.append(json.load(f))
+        except (OSError, ValueError):
+            continue
+    return result
+
+
+def profile_path(profile_id: str, profile_dir: str = PROFILE_DIR) -> Optional[str]:
+    """Путь к файлу профиля (.prof или .collapsed); None — нет такого или недопустимый id"""
+    if not PROFILE_ID_RE.match(profile_id):
+        return None
+    for ext in (".prof", ".collapsed"):
+        path = os.path.join(profile_dir, profile_id + ext)
+        if os.path.exists(path):
+            return path
+    return None
+
+
+def profile_summary(path: str, limit: int = 40) -> str:
+    """Текстовая сводка: для cProfile — топ по накопленному времени, для семплов — самые частые стеки"""
+    if path.endswith(".prof"):
+        out = io.StringIO()
+        pstats.Stats(path, stream=out).sort_stats("cumulative").print_stats(limit)
+        return out.getvalue()
+    with open(path, encoding="utf-8") as f:
+        return "".join(itertools.islice(f, limit))
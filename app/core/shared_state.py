@@ -0,0 +1,15 @@
+import multiprocessing
+
+# Счетчики поколений в разделяемой памяти. Создаются при импорте в master-процессе
+# и наследуются воркерами при fork, поэтому изменение в одном воркере видят все остальные.
+# В однопроцессном режиме это обычные счетчики.
+model_generation = multiprocessing.Value("q", 0)
+rules_generation = multiprocessing.Value("q", 0)
+# Заявки и пользователи: версия данных для кэша фрагментов админки и аналитики
+stats_generation = multiprocessing.Value("q", 0)
+
+
+def bump(counter) -> int:
+    with counter.get_lock():
+        counter.value += 1
+        return counter.value
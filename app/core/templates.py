@@ -0,0 +1,45 @@
+import os
+import tempfile
+import zlib
+from pathlib import Path
+from typing import Callable
+
+from fastapi.templating import Jinja2Templates
+from jinja2 import FileSystemBytecodeCache
+from markupsafe import Markup
+
+from app.core.cache import LRUCache
+
+TEMPLATES_DIR = Path(__file__).resolve().parent.parent / "templates"
+# Скомпилированные шаблоны переживают перезапуск и общие для всех воркеров
+TEMPLATE_CACHE_DIR = os.getenv("TEMPLATE_CACHE_DIR", os.path.join(tempfile.gettempdir(), "credit_ai_jinja_cache"))
+os.makedirs(TEMPLATE_CACHE_DIR, exist_ok=True)
+
+# Единое окружение Jinja для всех роутеров
+templates = Jinja2Templates(
+    directory=str(TEMPLATES_DIR),
+    bytecode_cache=FileSystemBytecodeCache(TEMPLATE_CACHE_DIR),
+)
+
+fragment_cache = LRUCache(int(os.getenv("FRAGMENT_CACHE_SIZE", "256")))
+
+def cached_fragment(name: str, version, context: Callable[[], dict]) -> Markup:
+    """
+    Отрендеренный фрагмент шаблона из кэша. Ключ — имя шаблона и версия данных,
+    context вызывается (и делает запросы к БД) только при промахе.
+    """
+    key = (name, version)
+    html = fragment_cache.get(key)
+    if html is None:
+        html = Markup(templates.get_template(name).render(**context()))
+        fragment_cache.set(key, html)
+    return html
+
+
+def template_version(*names: str) -> str:
+    """Контрольная сумма исходников шаблонов — меняется при их правке (для ETag)"""
+    checksum = 0
+    for name in names:
+        source, _, _ = templates.env.loader.get_source(templates.env, name)
+        checksum = zlib.crc32(source.encode("utf-8"), checksum)
+    return f"{checksum:08x}"
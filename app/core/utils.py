@@ -7,4 +7,42 @@ FINANCIAL_LABELS = {
 }
 
 def get_label(key):
-    return FINANCIAL_LABELS.get(key, key)
\ No newline at end of file
+    return FINANCIAL_LABELS.get(key, key)
+
+# Синонимы колонок в загружаемых таблицах (CSV/XLSX): поле -> подстроки в названии колонки
+FIELD_ALIASES = {
+    "current_ratio": ["current_ratio", "liquidity", "ликвидность", "current"],
+    "debt_to_equity": ["debt_to_equity", "leverage", "леверидж", "debt", "задолженност"],
+    "net_profit_margin": ["net_profit_margin", "profit", "рентабельность", "margin", "чистая_прибыль"],
+    "company_age": ["company_age", "age", "возраст", "лет", "years"]
+}
+
+# Описательные колонки портфеля заявок
+META_ALIASES = {
+    "company_name": ["company_name", "company", "name", "компания", "наименование", "название"],
+    "industry": ["industry", "sector", "отрасль"],
+    "business_description": ["business_description", "description", "описание"]
+}
+
+def normalize_column(name) -> str:
+    """Убираем пробелы, приводим к нижнему регистру"""
+    return str(name).strip().lower().replace(' ', '_').replace('-', '_')
+
+def match_columns(columns, aliases: dict, exact_first: bool = True) -> dict:
+    """
+    Поле -> список подходящих колонок (в порядке приоритета).
+    exact_first — сначала точное совпадение с синонимом, затем колонки, содержащие синоним:
+    в портфеле много колонок, и "net_profit_margin" не должна уступать стоящей левее "profit_before_tax".
+    exact_first=False — колонки в порядке файла (так parse_financial_document разбирал отчеты всегда).
+    """
+    columns = [normalize_column(c) for c in columns]
+    result = {}
+    for field, names in aliases.items():
+        if exact_first:
+            exact = [c for c in columns if c in names]
+            matched = exact + [c for c in columns if c not in exact and any(alias in c for alias in names)]
+        else:
+            matched = [c for c in columns if any(alias in c for alias in names)]
+        if matched:
+            result[field] = matched
+    return result
@@ -2,25 +2,35 @@
 from fastapi import FastAPI
 from contextlib import asynccontextmanager
 from app.models.database import engine, Base, get_db
+from app.models.migrations import run_migrations
 from app.models.models import User, KnowledgeRule
-from passlib.context import CryptContext
 
 # Импорт роутеров
-from app.api import auth, views, admin
+from app.api import auth, views, admin, health
+from app.api.auth import pwd_context
+from app.core.profiling import ProfilingMiddleware
+from app.core.admission import AdmissionMiddleware
+from app.core.deps import setup_logging
 
 # Импорт сервисов
 from app.services.kb_service import KnowledgeBaseService
 from app.services.learning_service import LearningService
+from app.services.analysis_service import analysis_service
+from app.services.comparables_service import comparables_service
+from app.services.dedup_service import dedup_service
+from app.services.job_service import job_queue
+from app.services.replication_service import replication_service
+from app.services.drift_service import drift_service
+from app.services.portfolio_service import portfolio_service
 
 kb_service = KnowledgeBaseService()
 learning_service = LearningService(kb_service)
 
 # Инициализация БД
-@asynccontextmanager
-async def lifespan(app: FastAPI):
+def init_db():
     Base.metadata.create_all(bind=engine)
+    run_migrations(engine)
     db = next(get_db())
-    pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
     
     # Создаем админа
     if not db.query(User).filter(User.username == "admin").first():
@@ -59,14 +69,45 @@ async def lifespan(app: FastAPI):
             kb_service.add_rule(db, rule_data)
             
     db.close()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # В режиме pre-fork базу уже подготовил master-процесс (app.server), он же ротирует лог
+    prefork_worker = getattr(app.state, "db_initialized", False)
+    setup_logging(rotate=not prefork_worker)
+    if not prefork_worker:
+        init_db()
+        # Копию SQLite для чтения обновляет один процесс: здесь или master pre-fork сервера
+        replication_service.start_periodic()
+
+    # Модель грузится в фоне, готовность — /readyz
+    analysis_service.start_background_load()
+    # Индекс аналогов (KD-дерево по истории) — тоже в фоне
+    comparables_service.start_background_build()
+    # Индекс дубликатов — тоже в фоне: до готовности проверка пропускается
+    dedup_service.start_background_build()
+
+    # Обработчики асинхронной очереди заявок
+    job_queue.start()
+    # Снимки счетчиков дрейфа (свои в каждом воркере)
+    drift_service.start()
     yield
+    job_queue.stop()
+    drift_service.stop()
+    portfolio_service.shutdown()
+    dedup_service.stop()
 
 app = FastAPI(lifespan=lifespan)
+# Профилирование запросов по флагу администратора (без флага — только проверка заголовков)
+app.add_middleware(ProfilingMiddleware)
+# Контроль допуска — внешний слой: отказ до чтения тела запроса и до профилирования
+app.add_middleware(AdmissionMiddleware)
 
 # Подключение роутеров
 app.include_router(auth.router)
 app.include_router(views.router)
 app.include_router(admin.router)
+app.include_router(health.router)
 
 if __name__ == "__main__":
     import uvicorn
@@ -1,6 +1,7 @@
 from sqlalchemy import create_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import NullPool
 import os
 
 SQLALCHEMY_DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./credit_system.db")
@@ -9,8 +10,31 @@ SQLALCHEMY_DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./credit_system.d
 engine = create_engine(
     SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
 )
+# Соединения пула нельзя делить между процессами: после fork дочерний процесс открывает свои
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=lambda: engine.dispose(close=False))
+
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Необязательная БД только для чтения (реплика): история, аналитика, выгрузка, обучение.
+# Без DATABASE_READ_URL все читают из основной БД
+SQLALCHEMY_READ_DATABASE_URL = os.getenv("DATABASE_READ_URL", "")
+if SQLALCHEMY_READ_DATABASE_URL:
+    # Копия SQLite подменяется файлом целиком (replicate_db.py) — без пула каждая сессия
+    # открывает свежий файл, а не держит старый
+    _sqlite_read = SQLALCHEMY_READ_DATABASE_URL.startswith("sqlite")
+    read_engine = create_engine(
+        SQLALCHEMY_READ_DATABASE_URL,
+        connect_args={"check_same_thread": False} if _sqlite_read else {},
+        **({"poolclass": NullPool} if _sqlite_read else {})
+    )
+    if hasattr(os, "register_at_fork"):
+        os.register_at_fork(after_in_child=lambda: read_engine.dispose(close=False))
+else:
+    read_engine = engine
+
+ReadSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=read_engine)
+
 Base = declarative_base()
 
 def get_db():
@@ -18,4 +42,12 @@ def get_db():
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+def get_read_db():
+    """Сессия для обработчиков, которые только читают (может отставать от основной БД)"""
+    db = ReadSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
@@ -0,0 +1,211 @@
+"""
+Легкие миграции схемы без Alembic.
+
+create_all создает только отсутствующие таблицы, поэтому новые столбцы и индексы
+существующих таблиц добавляются здесь. Все шаги идемпотентны и выполняются при старте.
+"""
+import datetime
+import logging
+
+from sqlalchemy import Column, DateTime, MetaData, String, Table, bindparam, func, inspect, select, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.schema import CreateTable
+
+from app.models.database import Base
+
+logger = logging.getLogger(__name__)
+
+# Однократные шаги (перенос данных) отмечаются здесь, чтобы не сканировать таблицы при каждом старте
+_meta = MetaData()
+schema_migrations = Table(
+    "schema_migrations", _meta,
+    Column("name", String, primary_key=True),
+    Column("applied_at", DateTime),
+)
+BACKFILL_BATCH = 50000
+
+
+def _add_missing_columns(engine: Engine) -> list:
+    """ALTER TABLE ADD COLUMN для столбцов модели, которых нет в БД. Возвращает добавленные (таблица, столбец)."""
+    inspector = inspect(engine)
+    added = []
+    with engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {col["name"] for col in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+                col_type = column.type.compile(dialect=engine.dialect)
+                conn.execute(text(f'ALTER TABLE {table.name} ADD COLUMN "{column.name}" {col_type}'))
+                added.append((table.name, column.name))
+                logger.info(f"Миграция: добавлен столбец {table.name}.{column.name}")
+    return added
+
+
+def _create_missing_indexes(engine: Engine):
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=engine, checkfirst=True)
+
+
+def _backfill_rule_fields(engine: Engine):
+    """knowledge_rules.field — денормализованная копия condition_json["field"] для фильтра по индексу"""
+    from app.models.models import KnowledgeRule
+
+    table = KnowledgeRule.__table__
+    with engine.begin() as conn:
+        rows = conn.execute(
+            table.select().with_only_columns(table.c.id, table.c.condition_json).where(table.c.field.is_(None))
+        ).all()
+        updates = [
+            {"rule_id": rule_id, "rule_field": (cond or {}).get("field")}
+            for rule_id, cond in rows if (cond or {}).get("field")
+        ]
+        if updates:
+            conn.execute(
+                table.update().where(table.c.id == bindparam("rule_id")).values(field=bindparam("rule_field")),
+                updates,
+            )
+            logger.info(f"Миграция: заполнено поле field у правил: {len(updates)}")
+
+
+def _backfill_typed_financials(engine: Engine):
+    """
+    Известные показатели из applications.financial_data переносятся в отдельные столбцы,
+    в JSON остаются только прочие. Перенос идет в SQL пачками по id.
+    """
+    from app.models.models import FINANCIAL_COLUMNS
+
+    dialect = engine.dialect.name
+    if dialect == "sqlite":
+        assignments = ", ".join(
+            f"{name} = COALESCE({name}, CASE WHEN json_type(financial_data, '$.{name}') IN ('integer', 'real') "
+            f"THEN json_extract(financial_data, '$.{name}') END)"
+            for name in FINANCIAL_COLUMNS
+        )
+        # Ключ удаляется из JSON, только если значение перенесено (иначе удаляется несуществующий путь)
+        stripped = "json_remove(financial_data, " + ", ".join(
+            f"CASE WHEN json_type(financial_data, '$.{name}') IN ('integer', 'real') THEN '$.{name}' ELSE '$.__none__' END"
+            for name in FINANCIAL_COLUMNS
+        ) + ")"
+    elif dialect == "postgresql":
+        assignments = ", ".join(
+            f"{name} = COALESCE({name}, CASE WHEN jsonb_typeof(financial_data::jsonb -> '{name}') = 'number' "
+            f"THEN (financial_data::jsonb ->> '{name}')::float END)"
+            for name in FINANCIAL_COLUMNS
+        )
+        stripped = "(financial_data::jsonb - " + " - ".join(
+            f"(CASE WHEN jsonb_typeof(financial_data::jsonb -> '{name}') = 'number' THEN '{name}' ELSE '' END)"
+            for name in FINANCIAL_COLUMNS
+        ) + ")::json"
+    else:
+        _backfill_typed_financials_python(engine)
+        return
+
+    sql = text(
+        f"UPDATE applications SET {assignments}, financial_data = {stripped} "
+        f"WHERE id > :low AND id <= :high AND financial_data IS NOT NULL"
+    )
+    with engine.connect() as conn:
+        max_id = conn.execute(text("SELECT MAX(id) FROM applications")).scalar() or 0
+    for low in range(0, max_id, BACKFILL_BATCH):
+        with engine.begin() as conn:
+            conn.execute(sql, {"low": low, "high": low + BACKFILL_BATCH})
+    if max_id:
+        logger.info(f"Миграция: показатели заявок перенесены в столбцы (до id {max_id})")
+
+
+def _backfill_typed_financials_python(engine: Engine):
+    from app.models.models import CreditApplication, split_financial_data
+
+    table = CreditApplication.__table__
+    last_id = 0
+    while True:
+        with engine.begin() as conn:
+            rows = conn.execute(
+                select(table.c.id, table.c.financial_data).where(table.c.id > last_id)
+                .order_by(table.c.id).limit(BACKFILL_BATCH)
+            ).all()
+            if not rows:
+                return
+            for app_id, data in rows:
+                typed, extras = split_financial_data(data)
+                if typed:
+                    conn.execute(table.update().where(table.c.id == app_id).values(financial_data=extras, **typed))
+            last_id = rows[-1][0]
+
+
+def _applications_autoincrement(engine: Engine):
+    """
+    SQLite: пересоздание applications с AUTOINCREMENT (столбец им не изменить), чтобы id
+    удаленных и архивных заявок не доставались новым. Счетчик ставится на максимальный id
+    из applications и archived_applications.
+    """
+    from app.models.models import ArchivedApplication, CreditApplication
+
+    if engine.dialect.name != "sqlite":
+        return
+    table = CreditApplication.__table__
+    with engine.connect() as conn:
+        current_sql = conn.execute(
+            text("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = :name"), {"name": table.name}
+        ).scalar()
+    if current_sql is None:
+        return
+
+    if "AUTOINCREMENT" not in current_sql.upper():
+        create_sql = str(CreateTable(table).compile(dialect=engine.dialect)).replace(
+            f"CREATE TABLE {table.name} ", f"CREATE TABLE {table.name}__new ", 1
+        )
+        columns = ", ".join(f'"{column.name}"' for column in table.columns)
+        with engine.begin() as conn:
+            conn.execute(text(create_sql))
+            conn.execute(text(f"INSERT INTO {table.name}__new ({columns}) SELECT {columns} FROM {table.name}"))
+            conn.execute(text(f"DROP TABLE {table.name}"))
+            conn.execute(text(f"ALTER TABLE {table.name}__new RENAME TO {table.name}"))
+        for index in table.indexes:
+            index.create(bind=engine, checkfirst=True)
+        logger.info("Миграция: таблица applications пересоздана с AUTOINCREMENT")
+
+    with engine.begin() as conn:
+        high = max(
+            conn.execute(select(func.max(table.c.id))).scalar() or 0,
+            conn.execute(select(func.max(ArchivedApplication.__table__.c.id))).scalar() or 0,
+        )
+        seq = conn.execute(
+            text("SELECT seq FROM sqlite_sequence WHERE name = :name"), {"name": table.name}
+        ).scalar()
+        if seq is None:
+            conn.execute(text("INSERT INTO sqlite_sequence (name, seq) VALUES (:name, :seq)"), {"name": table.name, "seq": high})
+        elif seq < high:
+            conn.execute(text("UPDATE sqlite_sequence SET seq = :seq WHERE name = :name"), {"name": table.name, "seq": high})
+
+
+ONE_TIME_STEPS = [
+    ("applications_typed_financials", _backfill_typed_financials),
+    ("applications_autoincrement", _applications_autoincrement),
+]
+
+
+def _run_one_time_steps(engine: Engine):
+    _meta.create_all(bind=engine)
+    with engine.connect() as conn:
+        applied = set(conn.execute(select(schema_migrations.c.name)).scalars())
+    for name, step in ONE_TIME_STEPS:
+        if name in applied:
+            continue
+        step(engine)
+        with engine.begin() as conn:
+            conn.execute(schema_migrations.insert().values(name=name, applied_at=datetime.datetime.now()))
+
+
+def run_migrations(engine: Engine):
+    # Столбцы сравниваются с Base.metadata — модели должны быть импортированы
+    import app.models.models  # noqa: F401
+
+    _add_missing_columns(engine)
+    _create_missing_indexes(engine)
+    _backfill_rule_fields(engine)
+    _run_one_time_steps(engine)
@@ -1,7 +1,7 @@
 from typing import List, Optional
 
 from pydantic import BaseModel
-from sqlalchemy import Column, DateTime, Integer, String, Float, JSON, ForeignKey, Enum as SQLEnum
+from sqlalchemy import Column, DateTime, Integer, String, Float, JSON, ForeignKey, LargeBinary, Index, Enum as SQLEnum
 from sqlalchemy.orm import relationship
 from app.models.database import Base
 import datetime
@@ -29,33 +29,76 @@ class User(Base):
     id = Column(Integer, primary_key=True, index=True)
     username = Column(String, unique=True, index=True)
     hashed_password = Column(String) # В реальном проекте храним хэш!
-    role = Column(String, default="user") # admin, operator, user
+    role = Column(String, default="user", index=True) # admin, operator, user
     applications = relationship("CreditApplication", back_populates="user", cascade="all, delete-orphan")
 
+# Показатели, которые хранятся отдельными столбцами (фильтры и агрегаты в SQL)
+FINANCIAL_COLUMNS = ["current_ratio", "debt_to_equity", "net_profit_margin", "company_age"]
+
+def split_financial_data(data: dict) -> tuple:
+    """Разделяет показатели на известные числовые (для столбцов) и прочие (в JSON)"""
+    typed, extras = {}, {}
+    for key, value in (data or {}).items():
+        if key in FINANCIAL_COLUMNS and isinstance(value, (int, float)) and not isinstance(value, bool):
+            typed[key] = float(value)
+        else:
+            extras[key] = value
+    return typed, extras
+
 # --- Заявки на кредит (История) ---
 class CreditApplication(Base):
     __tablename__ = "applications"
     id = Column(Integer, primary_key=True, index=True)
     company_name = Column(String)
     industry = Column(String)
-    financial_data = Column(JSON) # Храним JSON с коэффицентами
+    current_ratio = Column(Float, index=True)
+    debt_to_equity = Column(Float, index=True)
+    net_profit_margin = Column(Float, index=True)
+    company_age = Column(Float, index=True)
+    financial_data = Column(JSON) # Прочие показатели (известные — в столбцах выше)
     business_description = Column(String)
     user_id = Column(Integer, ForeignKey("users.id"))
     rating = Column(Integer, default=0)
     status = Column(String, default="Обработан") # или "Отклонен"
-    created_at = Column(DateTime, default=datetime.datetime.now)
-    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"))
+    created_at = Column(DateTime, default=datetime.datetime.now, index=True)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), index=True)
     user = relationship("User", back_populates="applications")
     risks = relationship("FoundRisk", back_populates="application", cascade="all, delete-orphan")
+    # SQLite без AUTOINCREMENT выдает id = max(id) + 1 и повторно использует id удаленных
+    # и архивных заявок; с ним счетчик в sqlite_sequence только растет
+    __table_args__ = {"sqlite_autoincrement": True}
+
+    @property
+    def full_financial_data(self) -> dict:
+        """Все показатели заявки: столбцы + прочие из JSON"""
+        data = {name: getattr(self, name) for name in FINANCIAL_COLUMNS if getattr(self, name) is not None}
+        data.update(self.financial_data or {})
+        return data
+
+# --- Архив заявок (холодные данные) ---
+# Сама заявка с рисками хранится в сжатом файле архива (archive_service); здесь — поля для
+# списка истории, фильтров выгрузки и место записи в файле. id совпадает с id исходной заявки.
+class ArchivedApplication(Base):
+    __tablename__ = "archived_applications"
+    id = Column(Integer, primary_key=True, autoincrement=False)
+    user_id = Column(Integer, index=True)
+    company_name = Column(String)
+    industry = Column(String)
+    rating = Column(Integer)
+    created_at = Column(DateTime, index=True)
+    partition = Column(String)  # файл архива (месяц подачи)
+    block_offset = Column(Integer)  # смещение gzip-блока с заявкой в файле
+    archived_at = Column(DateTime, default=datetime.datetime.now)
 
 # --- База Знаний (Правила) ---
 class KnowledgeRule(Base):
     __tablename__ = "knowledge_rules"
     id = Column(Integer, primary_key=True, index=True)
-    risk_type = Column(String) # финансовый, отраслевой...
+    risk_type = Column(String, index=True) # финансовый, отраслевой...
     rule_name = Column(String) # Название правила
     condition_json = Column(JSON) # {"field": "current_ratio", "op": "<", "val": 1.5}
-    severity = Column(String)
+    field = Column(String, index=True) # Копия condition_json["field"] для фильтрации в админке
+    severity = Column(String, index=True)
     recommendation = Column(String)
 
 # --- Найденные риски (для отчетов) ---
@@ -67,9 +110,51 @@ class FoundRisk(Base):
     source = Column(String)
     severity = Column(String)
     recommendation = Column(String)
-    application_id = Column(Integer, ForeignKey("applications.id", ondelete="CASCADE"))
+    application_id = Column(Integer, ForeignKey("applications.id", ondelete="CASCADE"), index=True)
     application = relationship("CreditApplication", back_populates="risks")
 
+# --- Очередь асинхронной обработки заявок ---
+class Job(Base):
+    __tablename__ = "jobs"
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"))
+    status = Column(String, default="queued") # queued, running, done, error
+    priority = Column(Integer, default=0) # больше — раньше
+    payload = Column(JSON) # ApplicationData
+    document = Column(LargeBinary, nullable=True) # загруженный файл, разбирается обработчиком
+    document_name = Column(String, nullable=True)
+    result = Column(JSON, nullable=True) # AnalysisResult
+    application_id = Column(Integer, nullable=True)
+    error = Column(String, nullable=True)
+    created_at = Column(DateTime, default=datetime.datetime.now)
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+    worker_pid = Column(Integer, nullable=True) # процесс, взявший задачу в работу
+    __table_args__ = (Index("ix_jobs_status_priority", "status", "priority", "id"),)
+
+# --- Пакетная оценка портфеля заявок (прогресс виден всем воркерам) ---
+class PortfolioRun(Base):
+    __tablename__ = "portfolio_runs"
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"))
+    filename = Column(String)
+    status = Column(String, default="running") # running, done, error
+    rows_read = Column(Integer, default=0)
+    rows_scored = Column(Integer, default=0)
+    rows_failed = Column(Integer, default=0)
+    error = Column(String, nullable=True)
+    created_at = Column(DateTime, default=datetime.datetime.now)
+    finished_at = Column(DateTime, nullable=True)
+
+# --- Мониторинг дрейфа: счетчики по корзинам эталонных гистограмм за окно (drift_service) ---
+class DriftSnapshot(Base):
+    __tablename__ = "drift_snapshots"
+    id = Column(Integer, primary_key=True, index=True)
+    created_at = Column(DateTime, default=datetime.datetime.now, index=True)
+    reference_id = Column(String)  # эталон (момент обучения модели), с которым совпадают границы корзин
+    samples = Column(Integer)
+    counts = Column(JSON)  # {признак: [число заявок в каждой корзине]}
+
 class RiskReport(BaseModel):
     risk_type: RiskTypeEnum
     source: str  # локализация риска
@@ -81,6 +166,8 @@ class AnalysisResult(BaseModel):
     risks: List[RiskReport]
     statistics: dict
     rating: int  # Итоговый рейтинг кредитоспособности
+    application_id: Optional[int] = None  # ID сохраненной заявки
+    comparables: List[dict] = []  # Похожие прошлые заявки (comparables_service)
 
 class ApplicationData(BaseModel):
     company_name: str
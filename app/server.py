@@ -0,0 +1,247 @@
+"""
+Многопроцессный режим (pre-fork).
+
+Master-процесс один раз готовит БД, загружает модель (плоские массивы FlatForest) и
+скомпилированный снимок правил, после чего создает воркеры через fork. Данные модели
+остаются общими страницами памяти (copy-on-write), поэтому RSS воркера не растет
+с размером модели.
+
+    python -m app.server --workers 4
+
+Перезагрузка: SIGHUP master-процессу (или переобучение модели в любом воркере) —
+master перечитывает модель и правила и по одному заменяет воркеры.
+"""
+import argparse
+import gc
+import logging
+import os
+import signal
+import socket
+import time
+
+logger = logging.getLogger(__name__)
+
+MASTER_PID_ENV = "PREFORK_MASTER_PID"
+WORKER_STOP_TIMEOUT = 30
+
+
+def notify_master_reload() -> bool:
+    """Вызывается из воркера: попросить master перезагрузить модель и пересоздать воркеры"""
+    master_pid = os.getenv(MASTER_PID_ENV)
+    if not master_pid or int(master_pid) == os.getpid():
+        return False
+    try:
+        os.kill(int(master_pid), signal.SIGHUP)
+        return True
+    except OSError as e:
+        logger.warning(f"Не удалось уведомить master-процесс: {e}")
+        return False
+
+
+def preload(app):
+    """Все тяжелое — до fork, чтобы воркеры получили это через copy-on-write"""
+    from app.main import init_db
+    from app.models.database import SessionLocal, engine
+    from app.services.analysis_service import analysis_service
+    from app.services.kb_service import kb_service
+
+    init_db()
+    app.state.db_initialized = True
+
+    if analysis_service.ready:
+        analysis_service.load_model()
+    else:
+        analysis_service.ensure_model()
+    db = SessionLocal()
+    try:
+        kb_service.get_snapshot(db)
+    finally:
+        db.close()
+    engine.dispose()
+
+    # Объекты, созданные до fork, не трогаем сборщиком мусора — иначе страницы копируются
+    gc.collect()
+    gc.freeze()
+
+
+class PreforkServer:
+    def __init__(self, app, workers: int, host: str, port: int):
+        self.app = app
+        self.workers = workers
+        self.host = host
+        self.port = port
+        self.children = set()
+        self.sock = None
+        self._stopping = False
+        self._reload_requested = False
+        self.replicator = None  # pid процесса копирования SQLite-реплики
+
+    def run(self):
+        os.environ[MASTER_PID_ENV] = str(os.getpid())
+        # Master пишет в лог без фонового потока (потоки не переживают fork) и один ротирует файл;
+        # воркеры настраивают свой слушатель в lifespan
+        from app.core.deps import rotate_log_if_needed, setup_logging
+        setup_logging(rotate=True, background=False)
+        preload(self.app)
+        # Копию SQLite-реплики обновляет отдельный процесс: в master не должно быть потоков к моменту fork
+        self._start_replicator()
+
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.sock.bind((self.host, self.port))
+        self.sock.listen(2048)
+        self.sock.set_inheritable(True)
+
+        signal.signal(signal.SIGTERM, self._on_stop)
+        signal.signal(signal.SIGINT, self._on_stop)
+        signal.signal(signal.SIGHUP, self._on_reload)
+
+        for _ in range(self.workers):
+            self._spawn()
+        logger.info(f"Master {os.getpid()}: запущено воркеров {self.workers} на {self.host}:{self.port}")
+        print(f"Сервер запущен: http://{self.host}:{self.port} (воркеров: {self.workers})")
+
+        while not self._stopping:
+            if self._reload_requested:
+                self._reload_requested = False
+                self._reload()
+            self._reap(respawn=True)
+            rotate_log_if_needed()
+            time.sleep(0.5)
+
+        self._shutdown()
+
+    def _on_stop(self, signum, frame):
+        self._stopping = True
+
+    def _on_reload(self, signum, frame):
+        self._reload_requested = True
+
+    def _spawn(self) -> int:
+        pid = os.fork()
+        if pid:
+            self.children.add(pid)
+            return pid
+
+        # --- Дочерний процесс ---
+        for sig in (signal.SIGTERM, signal.SIGINT, signal.SIGHUP):
+            signal.signal(sig, signal.SIG_DFL)
+        exit_code = 0
+        try:
+            import uvicorn
+            server = uvicorn.Server(uvicorn.Config(self.app, host=self.host, port=self.port))
+            server.run(sockets=[self.sock])
+        except Exception:
+            logger.exception("Воркер завершился с ошибкой")
+            exit_code = 1
+        finally:
+            os._exit(exit_code)
+
+    def _start_replicator(self, first_copy: bool = True):
+        from app.services.replication_service import REPLICA_SYNC_SECONDS, replication_service
+
+        if REPLICA_SYNC_SECONDS <= 0 or not replication_service.enabled:
+            return
+        if first_copy:
+            # Первая копия — до запуска воркеров, чтобы реплика существовала до запросов
+            replication_service.replicate()
+        pid = os.fork()
+        if pid:
+            self.replicator = pid
+            return
+
+        # --- Дочерний процесс репликации ---
+        for sig in (signal.SIGTERM, signal.SIGINT, signal.SIGHUP):
+            signal.signal(sig, signal.SIG_DFL)
+        if self.sock is not None:
+            self.sock.close()  # запросы принимают только воркеры
+        logger.info(f"Репликация SQLite (pid {os.getpid()}): каждые {REPLICA_SYNC_SECONDS} с")
+        try:
+            replication_service.run(REPLICA_SYNC_SECONDS)
+        finally:
+            os._exit(1)
+
+    def _reap(self, respawn: bool):
+        while self.children:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                self.children.clear()
+                return
+            if pid == 0:
+                return
+            if pid == self.replicator:
+                self.replicator = None
+                if respawn and not self._stopping:
+                    logger.warning(f"Процесс репликации {pid} завершился (статус {status}), запускаем новый")
+                    self._start_replicator(first_copy=False)
+                continue
+            if pid in self.children:
+                self.children.discard(pid)
+                if respawn and not self._stopping:
+                    logger.warning(f"Воркер {pid} завершился (статус {status}), запускаем новый")
+                    self._spawn()
+
+    def _wait_exit(self, pid: int):
+        deadline = time.time() + WORKER_STOP_TIMEOUT
+        while time.time() < deadline:
+            try:
+                done, _ = os.waitpid(pid, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if done:
+                return
+            time.sleep(0.1)
+        os.kill(pid, signal.SIGKILL)
+        os.waitpid(pid, 0)
+
+    def _reload(self):
+        """Перечитать модель и правила в master и заменить воркеры по одному (без простоя)"""
+        logger.info("Master: перезагрузка модели и правил")
+        gc.unfreeze()
+        try:
+            preload(self.app)
+        except Exception:
+            logger.exception("Ошибка перезагрузки, воркеры не заменяются")
+            gc.freeze()
+            return
+
+        for old_pid in list(self.children):
+            self._spawn()
+            self.children.discard(old_pid)
+            try:
+                os.kill(old_pid, signal.SIGTERM)
+            except ProcessLookupError:
+                continue
+            self._wait_exit(old_pid)
+        logger.info("Master: воркеры заменены")
+
+    def _shutdown(self):
+        if self.replicator is not None:
+            self.children.add(self.replicator)
+        for pid in list(self.children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        for pid in list(self.children):
+            self._wait_exit(pid)
+        self.children.clear()
+        self.sock.close()
+
+
+def serve(app=None, workers: int = 2, host: str = "127.0.0.1", port: int = 8000):
+    if not hasattr(os, "fork"):
+        raise RuntimeError("Многопроцессный режим требует fork (Linux/macOS)")
+    if app is None:
+        from app.main import app
+    PreforkServer(app, workers, host, port).run()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Многопроцессный сервер с общей моделью")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 2)
+    args = parser.parse_args()
+    serve(workers=args.workers, host=args.host, port=args.port)
@@ -1,56 +1,369 @@
-import joblib
+import logging
 import os
+import threading
 import numpy as np
+from typing import List, Optional
+from sqlalchemy import insert
 from sqlalchemy.orm import Session
+from app.core.cache import LRUCache
+from app.core.shared_state import bump, model_generation, stats_generation
 from app.core.utils import get_label
-from app.models.models import CreditApplication, FoundRisk, AnalysisResult, RiskReport, ApplicationData
+from app.models.models import CreditApplication, FoundRisk, AnalysisResult, RiskReport, ApplicationData, FINANCIAL_COLUMNS, split_financial_data
+from app.services.data_service import data_service
+from app.services.comparables_service import comparables_service
+from app.services.dedup_service import dedup_service
+from app.services.drift_service import drift_service
+from app.services.forest import FlatForest
+from app.services.kb_service import kb_service
+from app.services.text_model import read_text_model
+
+logger = logging.getLogger(__name__)
 
 MODEL_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), "credit_model.pkl")
+# Та же модель в виде плоских массивов (FlatForest): грузится без sklearn и разделяется между воркерами
+MODEL_FLAT_PATH = os.path.splitext(MODEL_PATH)[0] + ".npz"
+MODEL_FEATURES = ["current_ratio", "debt_to_equity", "net_profit_margin", "company_age"]
+# Модель текста описания (hashing + логистическая регрессия); без нее — эвристика по ключевым словам
+TEXT_MODEL_PATH = os.path.join(os.path.dirname(MODEL_PATH), "text_model.npz")
+
+# Кэш вероятностей: ключ — версия модели + признаки, округленные до PREDICTION_CACHE_DECIMALS знаков
+PREDICTION_CACHE_SIZE = int(os.getenv("PREDICTION_CACHE_SIZE", "10000"))
+PREDICTION_CACHE_DECIMALS = 4
+# В источник прогнозного риска попадают до ML_TOP_CONTRIBUTIONS показателей с вкладом от 1 п.п.
+ML_TOP_CONTRIBUTIONS = 2
+ML_CONTRIBUTION_MIN = 0.01
+
+def model_exists() -> bool:
+    return os.path.exists(MODEL_FLAT_PATH) or os.path.exists(MODEL_PATH)
+
+def read_model() -> FlatForest:
+    """Читает модель с диска, предпочитая актуальный .npz; при необходимости конвертирует .pkl"""
+    if os.path.exists(MODEL_FLAT_PATH) and (
+        not os.path.exists(MODEL_PATH) or os.path.getmtime(MODEL_FLAT_PATH) >= os.path.getmtime(MODEL_PATH)
+    ):
+        return FlatForest.load(MODEL_FLAT_PATH)
+
+    import joblib  # вместе с моделью подтягивает sklearn — только если .npz нет или он устарел
+    flat = FlatForest.from_sklearn(joblib.load(MODEL_PATH))
+    try:
+        flat.save(MODEL_FLAT_PATH)
+    except OSError as e:
+        logger.warning(f"Не удалось сохранить {MODEL_FLAT_PATH}: {e}")
+    return flat
 
 class AnalysisService:
     def __init__(self, kb_service, data_service):
         self.kb = kb_service
         self.preproc = data_service
-        # Загрузка модели (если есть)
-        if os.path.exists(MODEL_PATH):
-            self.model = joblib.load(MODEL_PATH)
-        else:
-            from sklearn.ensemble import RandomForestClassifier
-            self.model = RandomForestClassifier(n_estimators=10, random_state=42)
-            self.model.fit(np.array([[1, 1], [2, 2]]), [0, 1])
+        # Модель загружается лениво (ensure_model) или в фоне (start_background_load)
+        self.model = None
+        self.text_model = None
+        self.model_version = -1
+        self.model_error = None
+        self.prediction_cache = LRUCache(PREDICTION_CACHE_SIZE)
+        self._model_lock = threading.Lock()
+        self._init_lock = threading.Lock()
+        self._ready = threading.Event()
+
+    @property
+    def ready(self) -> bool:
+        return self._ready.is_set()
+
+    def start_background_load(self):
+        """Загрузка модели в фоне при старте: сервер сразу принимает соединения, /readyz ждет модель"""
+        if not self.ready:
+            threading.Thread(target=self._background_load, name="model-loader", daemon=True).start()
+
+    def _background_load(self):
+        try:
+            self.ensure_model()
+        except Exception as e:
+            logger.error(f"Модель не загружена: {e}")
+
+    def ensure_model(self):
+        """Гарантирует, что модель загружена. Если файла модели нет — обучает ее (один раз)."""
+        if self.ready:
+            return
+        with self._init_lock:
+            if self.ready:
+                return
+            try:
+                if not model_exists():
+                    logger.info("Файл модели не найден, запускаем первичное обучение...")
+                    import train_model
+                    train_model.train_credit_model()
+                self.load_model()
+                self.model_error = None
+            except Exception as e:
+                self.model_error = str(e)
+                raise RuntimeError(f"Модель недоступна: {e}")
+
+    def load_model(self):
+        """Загрузка модели с диска. Кэш предсказаний прошлой версии становится недоступен."""
+        generation = model_generation.value
+        model = read_model()
+        text_model = read_text_model(TEXT_MODEL_PATH)
+
+        with self._model_lock:
+            self.model = model
+            self.text_model = text_model
+            self.model_version = generation
+            self.prediction_cache.clear()
+        self._ready.set()
+        logger.info(
+            f"Модель загружена, версия {self.model_version} (pid {os.getpid()}), "
+            f"текст: {'модель' if text_model else 'эвристика'}"
+        )
+
+    def reload_model(self):
+        """Перезагрузка после переобучения: остальные процессы подхватят новую версию сами"""
+        bump(model_generation)
+        self.load_model()
+
+    def _sync_model(self):
+        """Если модель еще не загружена или ее переобучили в другом воркере — (пере)читываем ее"""
+        self.ensure_model()
+        if model_generation.value != self.model_version:
+            self.load_model()
+
+    def predict_probability(self, financial_data: dict) -> float:
+        """Вероятность дефолта по статистической модели"""
+        return self.predict_explained(financial_data)[0]
+
+    def predict_explained(self, financial_data: dict) -> tuple:
+        """
+        Вероятность дефолта и ее объяснение {"base", "contributions"} — вклады показателей
+        по путям в деревьях. LRU-кэш по версии модели и квантованным признакам.
+        """
+        self._sync_model()
+        features = tuple(
+            round(float(financial_data.get(name, 0)), PREDICTION_CACHE_DECIMALS) for name in MODEL_FEATURES
+        )
+        # Сначала версия, потом модель: load_model меняет их в обратном порядке,
+        # поэтому под новой версией никогда не окажется предсказание старой модели
+        version = self.model_version
+        model = self.model
+        key = (version, features)
+
+        cached = self.prediction_cache.get(key)
+        if cached is None:
+            probabilities, contributions = model.contributions(np.array([features]))
+            cached = (float(probabilities[0]), self._explanation(model, contributions[0]))
+            self.prediction_cache.set(key, cached)
+        return cached
+
+    def predict_batch(self, financial_rows: List[dict]) -> np.ndarray:
+        """Вероятности дефолта для пачки заявок одним вызовом модели (без кэша)"""
+        return self.predict_batch_explained(financial_rows)[0]
+
+    def predict_batch_explained(self, financial_rows: List[dict]) -> tuple:
+        """Вероятности и объяснения для пачки заявок одним проходом по деревьям"""
+        self._sync_model()
+        model = self.model
+        X = np.array([
+            [float(row.get(name, 0)) for name in MODEL_FEATURES] for row in financial_rows
+        ], dtype=np.float64).reshape(len(financial_rows), len(MODEL_FEATURES))
+        probabilities, contributions = model.contributions(X)
+        return probabilities, [self._explanation(model, row) for row in contributions]
+
+    def _explanation(self, model: FlatForest, contributions: np.ndarray) -> dict:
+        return {
+            "base": model.expected_value,
+            "contributions": dict(zip(MODEL_FEATURES, contributions.tolist())),
+        }
+
+    def analyze_texts(self, descriptions: List[str]) -> List[dict]:
+        """Риск по описаниям бизнеса (пачкой): обученная модель, а если ее нет — эвристика"""
+        self._sync_model()
+        text_model = self.text_model
+        if text_model is None:
+            return [self.preproc.analyze_text_sentiment(text) for text in descriptions]
+
+        results = []
+        for text, score in zip(descriptions, text_model.risk_scores(descriptions)):
+            score = round(float(score), 2)
+            reason = None
+            if score > 0.3:
+                markers = text_model.risk_markers(text)
+                if markers:
+                    reason = f"Негативные маркеры в описании бизнеса: {', '.join(markers)}"
+            results.append({"score": score, "reason": reason})
+        return results
 
     def analyze_application(self, raw_data: ApplicationData, user_id: int, db: Session) -> AnalysisResult:
+        probability, explanation = self.predict_explained(raw_data.financial_data)
+        drift_service.observe(raw_data.financial_data, probability)
+        scored = self.score_application(
+            raw_data, self.kb.get_snapshot(db), probability,
+            self.analyze_texts([raw_data.business_description])[0], explanation,
+            self.find_duplicates(db, raw_data, user_id)
+        )
+        scored["comparables"] = self.find_comparables(db, [raw_data], user_id)[0]
+        new_app = self.save_scored(db, raw_data, scored, user_id)
+        db.flush()
+        app_id = new_app.id
+        db.commit()
+        bump(stats_generation)
+        dedup_service.add(app_id, raw_data.business_description, raw_data.financial_data)
+        return self.build_result(scored, app_id)
+
+    def analyze_batch(self, applications: List[ApplicationData], user_id: int, db: Session) -> List[AnalysisResult]:
+        """Оценка пачки заявок: модель вызывается один раз, сохранение — одной транзакцией"""
+        duplicates = [self.find_duplicates(db, a, user_id) for a in applications]
+        scored = self.score_batch(applications, self.kb.get_snapshot(db), duplicates)
+        for s, comparables in zip(scored, self.find_comparables(db, applications, user_id)):
+            s["comparables"] = comparables
+        app_ids = self.persist_batch(db, applications, scored, user_id)
+        return [self.build_result(s, app_id) for s, app_id in zip(scored, app_ids)]
+
+    def score_batch(self, applications: List[ApplicationData], rules,
+                    duplicates: Optional[List[list]] = None) -> List[dict]:
+        """Оценка без обращения к БД (можно выполнять в отдельных процессах)"""
+        if not applications:
+            return []
+        probabilities, explanations = self.predict_batch_explained([a.financial_data for a in applications])
+        texts = self.analyze_texts([a.business_description for a in applications])
+        duplicates = duplicates or [None] * len(applications)
+        return [
+            self.score_application(a, rules, float(p), text, explanation, dup)
+            for a, p, text, explanation, dup in zip(applications, probabilities, texts, explanations, duplicates)
+        ]
+
+    def find_comparables(self, db: Session, applications: List[ApplicationData], user_id: int) -> List[list]:
+        """Ближайшие прошлые заявки по показателям (для страницы результата; чужие — обезличенные)"""
+        try:
+            return comparables_service.find_batch(db, [a.financial_data for a in applications], user_id=user_id)
+        except Exception as e:
+            logger.warning(f"Поиск аналогов не выполнен: {e}")
+            return [[] for _ in applications]
+
+    def find_duplicates(self, db: Session, raw_data: ApplicationData, user_id: int) -> list:
+        """
+        Похожие ранее поданные заявки; ошибка индекса не должна мешать оценке.
+        Текст риска видит заявитель, поэтому номер и название известны только для его
+        собственных заявок; совпадение с чужой заявкой записывается в лог для администратора.
+        """
+        try:
+            matches = dedup_service.find_duplicates(db, raw_data.business_description, raw_data.financial_data)
+        except Exception as e:
+            logger.warning(f"Проверка дубликатов не выполнена: {e}")
+            return []
+        # Свои заявки — первыми, чтобы риск ссылался на них
+        matches.sort(key=lambda m: m["user_id"] != user_id)
+        for match in matches:
+            if match["user_id"] != user_id:
+                logger.info(
+                    f"Повторная подача: заявка пользователя {user_id} похожа на заявку #{match['id']} "
+                    f"пользователя {match['user_id']} ({match['similarity'] * 100:.0f}%)"
+                )
+        return [
+            match if match["user_id"] == user_id else {
+                "id": None, "user_id": None, "company_name": None,
+                "similarity": match["similarity"], "same_ratios": match["same_ratios"],
+            }
+            for match in matches
+        ]
+
+    def persist_batch(self, db: Session, applications: List[ApplicationData], scored: List[dict], user_id: int) -> List[int]:
+        """Сохраняет оцененные заявки и их риски одной транзакцией, возвращает id заявок"""
+        if not applications:
+            return []
+        # Массовая вставка без ORM-объектов: id заявок возвращаются в порядке строк (RETURNING)
+        app_rows = []
+        for a, s in zip(applications, scored):
+            typed, extras = split_financial_data(a.financial_data)
+            app_rows.append({
+                "company_name": a.company_name,
+                "industry": a.industry,
+                # У executemany набор ключей должен быть одинаковым во всех строках
+                **{name: typed.get(name) for name in FINANCIAL_COLUMNS},
+                "financial_data": extras,
+                "business_description": a.business_description,
+                "user_id": user_id,
+                "rating": s["rating"],
+            })
+        app_ids = list(db.execute(
+            insert(CreditApplication).returning(CreditApplication.id, sort_by_parameter_order=True), app_rows
+        ).scalars())
+        risk_rows = [
+            {"application_id": app_id, **r}
+            for app_id, s in zip(app_ids, scored) for r in s["risks"]
+        ]
+        if risk_rows:
+            db.execute(insert(FoundRisk), risk_rows)
+        db.commit()
+        bump(stats_generation)
+        # Следующие пачки (и повторная загрузка того же файла) увидят эти заявки как возможные дубликаты
+        for app_id, a in zip(app_ids, applications):
+            dedup_service.add(app_id, a.business_description, a.financial_data)
+        # Оценка пачки могла идти в других процессах (портфель) — дрейф учитываем здесь, при сохранении
+        observed = [(a.financial_data, s["statistics"]["default_probability"])
+                    for a, s in zip(applications, scored) if "default_probability" in s["statistics"]]
+        if observed:
+            drift_service.observe_batch([fin for fin, _ in observed], np.array([p for _, p in observed]))
+        return app_ids
+
+    def save_scored(self, db: Session, raw_data: ApplicationData, scored: dict, user_id: int) -> CreditApplication:
+        """Добавляет заявку и риски в сессию (без flush и commit)"""
+        typed, extras = split_financial_data(raw_data.financial_data)
+        new_app = CreditApplication(
+            company_name=raw_data.company_name,
+            industry=raw_data.industry,
+            **typed,
+            financial_data=extras,
+            business_description=raw_data.business_description,
+            user_id=user_id,
+            rating=scored["rating"]
+        )
+        new_app.risks = [FoundRisk(**r) for r in scored["risks"]]
+        db.add(new_app)
+        return new_app
+
+    def build_result(self, scored: dict, application_id: Optional[int] = None) -> AnalysisResult:
+        return AnalysisResult(
+            summary=scored["summary"],
+            risks=[RiskReport(**r) for r in scored["risks"]],
+            statistics=scored["statistics"],
+            rating=scored["rating"],
+            application_id=application_id,
+            comparables=scored.get("comparables", [])
+        )
+
+    def score_application(self, raw_data: ApplicationData, rules, risk_probability: float,
+                          text_analysis: Optional[dict] = None, explanation: Optional[dict] = None,
+                          duplicates: Optional[list] = None) -> dict:
+        """
+        Расчет рейтинга и рисков по вероятности модели, тексту и правилам.
+        Чистая функция: не обращается к БД и не меняет состояние сервиса.
+        text_analysis — результат analyze_texts; если не передан, используется эвристика.
+        explanation — вклады показателей в вероятность (predict_explained).
+        duplicates — похожие ранее поданные заявки (find_duplicates).
+        """
         processed_text = self.preproc.preprocess_text(raw_data.business_description)
         risks_data = []
 
         # --- 1. ML ---
-        features = np.array([[
-            raw_data.financial_data.get("current_ratio", 0),
-            raw_data.financial_data.get("debt_to_equity", 0),
-            raw_data.financial_data.get("net_profit_margin", 0),
-            raw_data.financial_data.get("company_age", 0)
-        ]])
-        
-        risk_probability = self.model.predict_proba(features)[0][1]
         rating = int(100 * (1 - risk_probability))
 
+        ml_source = self._ml_source(raw_data, explanation)
         if risk_probability > 0.5:
             risks_data.append({
                 "risk_type": "прогнозный",
-                "source": "Нейросетевая модель",
+                "source": ml_source,
                 "severity": "критический",
                 "recommendation": "Высокая вероятность дефолта по статистической модели."
             })
         elif risk_probability > 0.3:
                 risks_data.append({
                 "risk_type": "прогнозный",
-                "source": "Нейросетевая модель",
+                "source": ml_source,
                 "severity": "средний",
                 "recommendation": "Статистические показатели ниже оптимальных."
             })
 
         # --- 2. NLP ---
-        text_analysis = self.preproc.analyze_text_sentiment(raw_data.business_description)
+        if text_analysis is None:
+            text_analysis = self.preproc.analyze_text_sentiment(raw_data.business_description)
         text_risk_score = text_analysis["score"]
         
         text_penalty = int(text_risk_score * 20)
@@ -61,20 +374,33 @@ class AnalysisService:
                 "risk_type": "операционный",
                 "source": "Анализ описания бизнеса (NLP)",
                 "severity": "средний" if text_risk_score > 0.6 else "низкий",
-                "recommendation": text_analysis.get("reason", "Обнаружены негативные маркеры в тексте.")
+                "recommendation": text_analysis.get("reason") or "Обнаружены негативные маркеры в тексте."
+            })
+
+        # --- 2.1 Повторная подача ---
+        if duplicates:
+            best = duplicates[0]
+            same_ratios = best["same_ratios"]
+            # Чужая заявка не раскрывается (id и название убраны в find_duplicates)
+            match = f"Похожая заявка #{best['id']} ({best['company_name']})" if best["id"] else "Похожая заявка другого заявителя"
+            risks_data.append({
+                "risk_type": "операционный",
+                "source": (
+                    f"{match}: описание совпадает на "
+                    f"{best['similarity'] * 100:.0f}%, показатели {'те же' if same_ratios else 'изменены'}"
+                ),
+                "severity": "средний" if same_ratios else "низкий",
+                "recommendation": "Проверить, не подается ли та же компания повторно с измененными данными."
             })
 
         # --- 3. ПРАВИЛА  ---
-        rules = self.kb.get_all_rules(db)
-        
         # Словарь для отслеживания уже обработанных полей
         processed_fields = {}
         
         for rule in rules:
-            cond = rule.condition_json
-            field_name = cond.get("field")
-            op = cond.get("op")
-            threshold = cond.get("val")
+            field_name = rule.field
+            op = rule.op
+            threshold = rule.val
             
             current_val = raw_data.financial_data.get(field_name)
             if current_val is None:
@@ -132,39 +458,38 @@ class AnalysisService:
         # Добавляем все уникальные риски
         risks_data.extend(processed_fields.values())
 
-        # --- 4. СОХРАНЕНИЕ (без изменений) ---
-        rating = max(0, min(100, rating))
-
-        new_app = CreditApplication(
-            company_name=raw_data.company_name,
-            industry=raw_data.industry,
-            financial_data=raw_data.financial_data,
-            business_description=raw_data.business_description,
-            user_id=user_id
-        )
-        db.add(new_app)
-        db.commit()
-        db.refresh(new_app)
-
-        for r in risks_data:
-            risk_entry = FoundRisk(application_id=new_app.id, **r)
-            db.add(risk_entry)
-        db.commit()
-
-        new_app.rating = rating
-        db.commit()
+        rating = int(max(0, min(100, rating)))
 
         stats = {
             "input_params": len(raw_data.financial_data) + 2,
             "risks_found": len(risks_data),
             "text_analyzed_words": processed_text.get("token_count", 0)
         }
+        if explanation is not None:
+            stats["default_probability"] = round(risk_probability, 4)
+            stats["base_probability"] = round(explanation["base"], 4)
+            stats["feature_contributions"] = {
+                name: round(value, 4) for name, value in explanation["contributions"].items()
+            }
 
         summary = "Рейтинг основан на статистической модели и анализе текста." if risks_data else "Профиль надежный."
-        
-        return AnalysisResult(
-            summary=summary,
-            risks=[RiskReport(**r) for r in risks_data],
-            statistics=stats,
-            rating=rating
-        )
\ No newline at end of file
+
+        return {"rating": rating, "risks": risks_data, "statistics": stats, "summary": summary}
+
+    def _ml_source(self, raw_data: ApplicationData, explanation: Optional[dict]) -> str:
+        """Источник прогнозного риска: показатели, сильнее всего повысившие вероятность дефолта"""
+        if explanation is None:
+            return "Нейросетевая модель"
+        top = sorted(
+            ((name, value) for name, value in explanation["contributions"].items() if value >= ML_CONTRIBUTION_MIN),
+            key=lambda item: item[1], reverse=True
+        )[:ML_TOP_CONTRIBUTIONS]
+        if not top:
+            return "Нейросетевая модель"
+        parts = [
+            f"{get_label(name)} = {raw_data.financial_data.get(name, 0)} (+{value * 100:.1f} п.п.)"
+            for name, value in top
+        ]
+        return f"Нейросетевая модель: {'; '.join(parts)}"
+
+analysis_service = AnalysisService(kb_service, data_service)
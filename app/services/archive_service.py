@@ -0,0 +1,231 @@
+import datetime
+import json
+import logging
+import os
+import time
+import zlib
+from typing import Iterator, List, Optional
+
+from sqlalchemy import func, text
+from sqlalchemy.orm import Session
+
+from app.core.cache import LRUCache
+from app.core.shared_state import bump, stats_generation
+from app.models.database import engine
+from app.models.models import ArchivedApplication, CreditApplication, FoundRisk, split_financial_data
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_DIR = os.getenv("ARCHIVE_DIR", os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), "archive"))
+ARCHIVE_AFTER_DAYS = int(os.getenv("ARCHIVE_AFTER_DAYS", "365"))
+# Заявок в одном gzip-блоке: для чтения одной заявки распаковывается только ее блок
+ARCHIVE_BLOCK_SIZE = int(os.getenv("ARCHIVE_BLOCK_SIZE", "1000"))
+ARCHIVE_READ_CHUNK = 64 * 1024
+# Распакованные блоки при выгрузке: одна пачка id может лежать в блоках разных месяцев
+ARCHIVE_BLOCK_CACHE = 64
+
+
+class ArchiveService:
+    """
+    Перенос старых заявок с рисками из рабочей БД в архив.
+
+    Архив — файлы NDJSON.gz по месяцам подачи (applications-ГГГГ-ММ.ndjson.gz), записи в формате
+    выгрузки (export_service.record). Файл — цепочка независимых gzip-блоков (так gzip допускает),
+    поэтому дописывается без перепаковки, а заявка читается распаковкой одного блока по смещению
+    из заглушки в archived_applications. Заглушки держат историю и фильтры выгрузки в SQL.
+    """
+
+    def __init__(self, archive_dir: str = ARCHIVE_DIR):
+        self.archive_dir = archive_dir
+
+    def _write_block(self, partition: str, records: List[dict]) -> int:
+        """Дописывает gzip-блок в файл месяца; возвращает смещение блока"""
+        os.makedirs(self.archive_dir, exist_ok=True)
+        payload = "".join(json.dumps(r, ensure_ascii=False) + "\n" for r in records).encode("utf-8")
+        compressor = zlib.compressobj(wbits=31)  # 31 — формат gzip
+        block = compressor.compress(payload) + compressor.flush()
+        with open(os.path.join(self.archive_dir, partition), "ab") as f:
+            offset = f.tell()
+            f.write(block)
+            f.flush()
+            # Файл должен быть на диске до удаления строк из БД
+            os.fsync(f.fileno())
+        return offset
+
+    def read_block(self, partition: str, offset: int) -> List[dict]:
+        decompressor = zlib.decompressobj(wbits=31)
+        data = []
+        with open(os.path.join(self.archive_dir, partition), "rb") as f:
+            f.seek(offset)
+            while not decompressor.eof:
+                chunk = f.read(ARCHIVE_READ_CHUNK)
+                if not chunk:
+                    break
+                data.append(decompressor.decompress(chunk))
+        return [json.loads(line) for line in b"".join(data).decode("utf-8").splitlines() if line]
+
+    def archive(self, db: Session, older_than_days: int = ARCHIVE_AFTER_DAYS, vacuum: bool = True,
+                dry_run: bool = False, progress=None) -> dict:
+        """Архивирует заявки, поданные раньше чем older_than_days дней назад (целыми днями)"""
+        from app.services.export_service import ExportFilters, export_service
+
+        started = time.time()
+        cutoff = datetime.date.today() - datetime.timedelta(days=older_than_days)
+        filters = ExportFilters(date_to=cutoff - datetime.timedelta(days=1))
+        ArchivedApplication.__table__.create(bind=db.get_bind(), checkfirst=True)
+
+        archived, partitions = 0, set()
+        for batch in export_service.iter_batches(db, filters, batch_size=ARCHIVE_BLOCK_SIZE):
+            batch = [(a, risks) for a, risks in batch if a.created_at is not None]
+            if not batch:
+                continue
+            if dry_run:
+                archived += len(batch)
+                continue
+            by_month = {}
+            for application, risks in batch:
+                by_month.setdefault(f"applications-{application.created_at:%Y-%m}.ndjson.gz", []).append((application, risks))
+
+            stubs = []
+            for partition, items in by_month.items():
+                offset = self._write_block(partition, [export_service.record(a, risks) for a, risks in items])
+                partitions.add(partition)
+                stubs.extend({
+                    "id": a.id, "user_id": a.user_id, "company_name": a.company_name, "industry": a.industry,
+                    "rating": a.rating, "created_at": a.created_at, "partition": partition,
+                    "block_offset": offset, "archived_at": datetime.datetime.now(),
+                } for a, _ in items)
+
+            ids = [a.id for a, _ in batch]
+            db.bulk_insert_mappings(ArchivedApplication, stubs)
+            db.query(FoundRisk).filter(FoundRisk.application_id.in_(ids)).delete(synchronize_session=False)
+            db.query(CreditApplication).filter(CreditApplication.id.in_(ids)).delete(synchronize_session=False)
+            db.commit()
+            archived += len(batch)
+            if progress:
+                progress(archived)
+
+        if archived and not dry_run:
+            bump(stats_generation)
+            if vacuum:
+                self.vacuum(db.get_bind())
+        result = {
+            "archived": archived,
+            "cutoff": cutoff.isoformat(),
+            "partitions": sorted(partitions),
+            "dry_run": dry_run,
+            "elapsed_sec": round(time.time() - started, 1),
+        }
+        logger.info(f"Архивация: {result}")
+        return result
+
+    def purge_user(self, db: Session, user_id: int) -> int:
+        """
+        Удаляет архивные заявки пользователя вместе с заглушками. Блоки с его заявками
+        переписываются в новый файл месяца (остальные записи сохраняются), заглушки переводятся
+        на новые смещения одной транзакцией; старый файл удаляется, когда на него не ссылается
+        ни одна заглушка. Прерванная очистка оставляет лишь неиспользуемый файл.
+        """
+        partitions = [row[0] for row in db.query(ArchivedApplication.partition).filter(
+            ArchivedApplication.user_id == user_id
+        ).distinct()]
+        purged = 0
+        for partition in partitions:
+            stubs = db.query(
+                ArchivedApplication.id, ArchivedApplication.user_id, ArchivedApplication.block_offset
+            ).filter(ArchivedApplication.partition == partition).all()
+            keep = {app_id for app_id, owner, _ in stubs if owner != user_id}
+            rewritten = f"{partition.split('.')[0]}.{time.time_ns()}.ndjson.gz"
+            moved = []
+            for offset in sorted({offset for _, _, offset in stubs}):
+                # В блоке остаются только заявки с заглушками, кроме заявок пользователя
+                records = [r for r in self.read_block(partition, offset) if r["id"] in keep]
+                if records:
+                    new_offset = self._write_block(rewritten, records)
+                    moved.extend({"id": r["id"], "partition": rewritten, "block_offset": new_offset} for r in records)
+
+            db.bulk_update_mappings(ArchivedApplication, moved)
+            purged += db.query(ArchivedApplication).filter(
+                ArchivedApplication.partition == partition, ArchivedApplication.user_id == user_id
+            ).delete(synchronize_session=False)
+            db.commit()
+            # Во время очистки архивация могла дописать в старый файл новый блок — тогда он остается
+            if not db.query(ArchivedApplication.id).filter(ArchivedApplication.partition == partition).first():
+                os.remove(os.path.join(self.archive_dir, partition))
+        if purged:
+            logger.info(f"Из архива удалено {purged} заявок пользователя {user_id}")
+        return purged
+
+    def vacuum(self, bind=engine):
+        """Сжатие файла БД и обновление статистики планировщика после удаления строк"""
+        with bind.connect() as conn:
+            conn = conn.execution_options(isolation_level="AUTOCOMMIT")
+            if bind.dialect.name == "sqlite":
+                conn.execute(text("VACUUM"))
+                conn.execute(text("ANALYZE"))
+            elif bind.dialect.name == "postgresql":
+                conn.execute(text("VACUUM ANALYZE applications"))
+                conn.execute(text("VACUUM ANALYZE found_risks"))
+
+    def get_application(self, db: Session, app_id: int) -> Optional[CreditApplication]:
+        """
+        Архивная заявка как несохраненный объект CreditApplication с рисками —
+        шаблоны и JSON деталей работают с ней так же, как с заявкой из БД.
+        """
+        stub = db.query(ArchivedApplication).filter(ArchivedApplication.id == app_id).first()
+        if stub is None:
+            return None
+        record = next((r for r in self.read_block(stub.partition, stub.block_offset) if r["id"] == app_id), None)
+        if record is None:
+            logger.error(f"Заявка {app_id} не найдена в архиве {stub.partition}")
+            return None
+        typed, extras = split_financial_data(record["financial_data"])
+        return CreditApplication(
+            id=record["id"],
+            user_id=record["user_id"],
+            company_name=record["company_name"],
+            industry=record["industry"],
+            rating=record["rating"],
+            status=record["status"],
+            created_at=datetime.datetime.fromisoformat(record["created_at"]),
+            business_description=record["business_description"],
+            financial_data=extras,
+            risks=[FoundRisk(application_id=app_id, **risk) for risk in record["risks"]],
+            **typed,
+        )
+
+    def iter_records(self, db: Session, filters, batch_size: int = ARCHIVE_BLOCK_SIZE) -> Iterator[dict]:
+        """Архивные записи по фильтрам выгрузки в порядке id"""
+        last_id = 0
+        blocks = LRUCache(ARCHIVE_BLOCK_CACHE)
+        while True:
+            stubs = filters.apply(db.query(
+                ArchivedApplication.id, ArchivedApplication.partition, ArchivedApplication.block_offset
+            ), ArchivedApplication).filter(
+                ArchivedApplication.id > last_id
+            ).order_by(ArchivedApplication.id).limit(batch_size).all()
+            if not stubs:
+                return
+            last_id = stubs[-1].id
+            db.rollback()
+            for app_id, partition, offset in stubs:
+                block = blocks.get((partition, offset))
+                if block is None:
+                    block = {r["id"]: r for r in self.read_block(partition, offset)}
+                    blocks.set((partition, offset), block)
+                record = block.get(app_id)
+                if record is not None:
+                    yield record
+
+    def stats(self, db: Session) -> dict:
+        count, oldest, newest = db.query(
+            func.count(ArchivedApplication.id), func.min(ArchivedApplication.created_at), func.max(ArchivedApplication.created_at)
+        ).one()
+        return {
+            "archived": count,
+            "oldest": oldest.isoformat() if oldest else None,
+            "newest": newest.isoformat() if newest else None,
+        }
+
+
+archive_service = ArchiveService()
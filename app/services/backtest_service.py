@@ -0,0 +1,287 @@
+import logging
+import os
+import threading
+import time
+from typing import Optional
+
+import numpy as np
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from app.core.shared_state import stats_generation
+from app.models.models import FINANCIAL_COLUMNS, CreditApplication
+
+logger = logging.getLogger(__name__)
+
+BACKTEST_FIELDS = FINANCIAL_COLUMNS
+BACKTEST_LOAD_BATCH = 20000
+# Записи в обход приложения не увеличивают stats_generation — проверяем БД хотя бы так часто
+BACKTEST_REFRESH_SECONDS = int(os.getenv("BACKTEST_REFRESH_SECONDS", "60"))
+BACKTEST_EXAMPLES = 10
+RATING_BINS = np.arange(0, 101, 10)
+
+SEVERITY_LEVELS = {"низкий": 1, "средний": 2, "критический": 3}
+LEVEL_NAMES = {level: name for name, level in SEVERITY_LEVELS.items()}
+
+
+class HistorySnapshot:
+    """Колоночная копия истории заявок: id, показатели (NaN — нет значения), отрасль (в нижнем регистре), рейтинг"""
+
+    def __init__(self):
+        self.ids = np.empty(0, dtype=np.int64)
+        self.features = np.empty((0, len(BACKTEST_FIELDS)), dtype=np.float64)
+        self.industries = np.empty(0, dtype=object)
+        self.ratings = np.empty(0, dtype=np.float64)
+
+    def __len__(self):
+        return len(self.ids)
+
+    @property
+    def last_id(self) -> int:
+        return int(self.ids[-1]) if len(self.ids) else 0
+
+    def append(self, ids, features, industries, ratings):
+        self.ids = np.concatenate([self.ids, ids])
+        self.features = np.concatenate([self.features, features])
+        self.industries = np.concatenate([self.industries, industries])
+        self.ratings = np.concatenate([self.ratings, ratings])
+
+    def copy(self) -> "HistorySnapshot":
+        """Новый объект с теми же массивами: append и keep заменяют массивы, а не меняют их"""
+        other = HistorySnapshot()
+        other.ids, other.features, other.industries, other.ratings = self.ids, self.features, self.industries, self.ratings
+        return other
+
+    def keep(self, mask: np.ndarray):
+        self.ids = self.ids[mask]
+        self.features = self.features[mask]
+        self.industries = self.industries[mask]
+        self.ratings = self.ratings[mask]
+
+    def column(self, field: str):
+        if field == "industry":
+            return self.industries
+        return self.features[:, BACKTEST_FIELDS.index(field)]
+
+
+class BacktestService:
+    """
+    "Что если": как правило базы знаний сработало бы на сохраненных заявках.
+
+    Вместо повторного analyze_application правило проверяется векторно (numpy) по
+    снимку истории в памяти. Снимок дополняется только новыми заявками (id > последнего),
+    а удаленные (и перенесенные в архив) заявки убираются из него по списку id.
+    """
+
+    def __init__(self):
+        self._snapshot = HistorySnapshot()
+        self._generation = -1
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def get_snapshot(self, db: Session) -> HistorySnapshot:
+        generation = stats_generation.value
+        if generation == self._generation and time.time() - self._checked_at < BACKTEST_REFRESH_SECONDS:
+            return self._snapshot
+        with self._lock:
+            generation = stats_generation.value
+            # Бэктесты, уже взявшие снимок, дорабатывают со старым — меняем копию
+            snapshot = self._snapshot.copy()
+            if len(snapshot):
+                # Удаления видно по числу строк в уже загруженном диапазоне id
+                count = db.query(func.count(CreditApplication.id)).filter(
+                    CreditApplication.id <= snapshot.last_id
+                ).scalar()
+                if count != len(snapshot):
+                    self._drop_deleted(db, snapshot)
+            self._load_new(db, snapshot)
+            self._snapshot = snapshot
+            self._generation = generation
+            self._checked_at = time.time()
+            return snapshot
+
+    def _drop_deleted(self, db: Session, snapshot: HistorySnapshot):
+        """
+        Убирает из снимка удаленные и перенесенные в архив заявки. Читаются только id
+        загруженного диапазона, показатели заново не загружаются.
+        """
+        present = np.fromiter(
+            (row[0] for row in db.query(CreditApplication.id).filter(
+                CreditApplication.id <= snapshot.last_id
+            ).execution_options(yield_per=BACKTEST_LOAD_BATCH)),
+            dtype=np.int64,
+        )
+        keep = np.isin(snapshot.ids, present, assume_unique=True)
+        logger.info(f"Бэктест: из снимка истории убрано удаленных заявок: {int((~keep).sum())}")
+        snapshot.keep(keep)
+
+    def _load_new(self, db: Session, snapshot: HistorySnapshot):
+        started = time.time()
+        loaded = 0
+        while True:
+            # Показатели читаются из типизированных колонок — без разбора JSON
+            rows = db.query(
+                CreditApplication.id, CreditApplication.industry, CreditApplication.rating,
+                *(getattr(CreditApplication, name) for name in BACKTEST_FIELDS)
+            ).filter(CreditApplication.id > snapshot.last_id).order_by(CreditApplication.id).limit(BACKTEST_LOAD_BATCH).all()
+            if not rows:
+                break
+            ids = np.fromiter((r[0] for r in rows), dtype=np.int64, count=len(rows))
+            # None -> NaN при приведении к float64
+            features = np.array([r[3:] for r in rows], dtype=np.float64)
+            # Отрасль сравнивается без учета регистра — храним сразу в нижнем регистре
+            industries = np.array([(r[1] or "").lower() for r in rows], dtype=object)
+            ratings = np.array([r[2] for r in rows], dtype=np.float64)
+            snapshot.append(ids, features, industries, ratings)
+            loaded += len(rows)
+        if loaded:
+            logger.info(f"Бэктест: загружено заявок в снимок: {loaded} за {time.time() - started:.2f} с")
+
+    # --- Векторная версия проверки правила и kb_service.evaluate_rule_severity ---
+
+    def _evaluate(self, values: np.ndarray, op: str, threshold):
+        """Маска срабатывания, уровень серьезности (1-3) и штраф для каждой заявки"""
+        n = len(values)
+        if values.dtype == object:
+            # Текстовое поле (отрасль): только равенство без учета регистра
+            match = (values == str(threshold).lower()) if op == "==" else np.zeros(n, dtype=bool)
+            deviation = np.full(n, 0.1)
+        else:
+            try:
+                threshold = float(threshold)
+            except (TypeError, ValueError):
+                # Текстовый порог для числового поля никогда не срабатывает
+                return np.zeros(n, dtype=bool), np.zeros(n, dtype=np.int64), np.zeros(n)
+            valid = ~np.isnan(values)
+            with np.errstate(invalid="ignore"):
+                if op == "<":
+                    match = valid & (values < threshold)
+                elif op == ">":
+                    match = valid & (values > threshold)
+                elif op == "==":
+                    match = valid & (np.abs(values - threshold) < 0.0001)
+                else:
+                    match = np.zeros(n, dtype=bool)
+
+            if threshold == 0:
+                deviation = np.abs(values) * 10
+            elif op == "<":
+                deviation = (threshold - values) / threshold
+            elif op == ">":
+                deviation = (values - threshold) / threshold
+            else:
+                deviation = np.full(n, 0.1)
+            deviation = np.nan_to_num(np.clip(deviation, 0, 1))
+
+        level = np.select([deviation > 0.5, deviation > 0.2], [3, 2], default=1)
+        max_penalty = np.select([deviation > 0.5, deviation > 0.2], [40.0, 20.0], default=10.0)
+        penalty = np.minimum(max_penalty, max_penalty * deviation * 2)
+        return match, np.where(match, level, 0), np.where(match, penalty, 0.0)
+
+    def _group_penalty(self, values: np.ndarray, rules) -> np.ndarray:
+        """
+        Суммарный штраф правил одной группы (поле + оператор) так же, как в analyze_application:
+        правила идут по порядку, и штраф следующего учитывается, только если оно строже уже принятого.
+        """
+        current_level = np.zeros(len(values), dtype=np.int64)
+        total = np.zeros(len(values))
+        for op, threshold in rules:
+            match, level, penalty = self._evaluate(values, op, threshold)
+            accept = match & (level > current_level)
+            total += np.where(accept, penalty, 0.0)
+            current_level = np.where(accept, level, current_level)
+        return total
+
+    def _rules_penalty(self, snapshot: HistorySnapshot, idx: np.ndarray, rules) -> np.ndarray:
+        """Суммарный штраф правил (field, op, val) для заявок idx — по группам, как в score_application"""
+        groups = {}
+        for field, op, val in rules:
+            if field in BACKTEST_FIELDS or field == "industry":
+                groups.setdefault((field, op), []).append((op, val))
+        total = np.zeros(len(idx))
+        for (field, _), group in groups.items():
+            total += self._group_penalty(snapshot.column(field)[idx], group)
+        return total
+
+    def backtest(self, db: Session, condition: dict, rules, rule_id: Optional[int] = None) -> dict:
+        """
+        condition — кандидат {"field", "op", "val"}; rules — текущий снимок правил (kb_service.get_snapshot);
+        rule_id — если правило редактируется, его старая версия заменяется кандидатом.
+        """
+        started = time.time()
+        field, op, val = condition.get("field"), condition.get("op"), condition.get("val")
+        if field not in BACKTEST_FIELDS and field != "industry":
+            raise ValueError(f"Поле {field} не поддерживается")
+        if op not in ("<", ">", "=="):
+            raise ValueError(f"Оператор {op} не поддерживается")
+
+        snapshot = self.get_snapshot(db)
+        values = snapshot.column(field)
+        match, level, _ = self._evaluate(values, op, val)
+
+        # Заявки, у которых может измениться рейтинг: срабатывает кандидат или старая версия правила
+        affected = match.copy()
+        old_rule = next((r for r in rules if r.id == rule_id), None)
+        if old_rule is not None and (old_rule.field in BACKTEST_FIELDS or old_rule.field == "industry"):
+            affected |= self._evaluate(snapshot.column(old_rule.field), old_rule.op, old_rule.val)[0]
+        rules_before = [(r.field, r.op, r.val) for r in rules]
+        # Отредактированное правило остается на своем месте в порядке правил, новое — в конце
+        rules_after = [(field, op, val) if r.id == rule_id else (r.field, r.op, r.val) for r in rules]
+        if old_rule is None:
+            rules_after.append((field, op, val))
+
+        ratings = snapshot.ratings
+        ratings_after = ratings.copy()
+        idx = np.nonzero(affected)[0]
+        if idx.size:
+            penalty_before = self._rules_penalty(snapshot, idx, rules_before)
+            penalty_after = self._rules_penalty(snapshot, idx, rules_after)
+            # В score_application рейтинг = целое (модель и текст) минус штрафы правил, затем int()
+            # в пределах 0..100. Целую часть восстанавливаем по сохраненному рейтингу и штрафам
+            base = ratings[idx] + np.ceil(penalty_before - 1e-9)
+            ratings_after[idx] = np.trunc(np.clip(base - penalty_after, 0, 100))
+
+        known = ~np.isnan(ratings)
+        before = ratings[known]
+        after = ratings_after[known]
+        hits = int(match.sum())
+        total = len(snapshot)
+
+        positions = np.nonzero(match)[0][:BACKTEST_EXAMPLES]
+        position_by_id = dict(zip(snapshot.ids[positions].tolist(), positions.tolist()))
+        examples = []
+        if position_by_id:
+            rows = db.query(CreditApplication.id, CreditApplication.company_name, CreditApplication.rating).filter(
+                CreditApplication.id.in_(list(position_by_id))
+            ).order_by(CreditApplication.id).all()
+            for app_id, company_name, rating in rows:
+                p = position_by_id[app_id]
+                examples.append({
+                    "id": app_id,
+                    "company_name": company_name,
+                    "value": values[p] if values.dtype == object else float(values[p]),
+                    "severity": LEVEL_NAMES[int(level[p])],
+                    "rating_before": rating,
+                    "rating_after": int(ratings_after[p]) if rating is not None else None,
+                })
+
+        return {
+            "total": total,
+            "hits": hits,
+            "hit_rate": round(hits / total, 4) if total else 0.0,
+            "severity_counts": {LEVEL_NAMES[lvl]: int((level == lvl).sum()) for lvl in (3, 2, 1)},
+            "changed": int((after != before).sum()),
+            "mean_rating_before": round(float(before.mean()), 2) if before.size else None,
+            "mean_rating_after": round(float(after.mean()), 2) if after.size else None,
+            # Переход за порог 50 — граница "надежный / рискованный" при обучении модели
+            "crossed_below_50": int(((before >= 50) & (after < 50)).sum()),
+            "crossed_above_50": int(((before < 50) & (after >= 50)).sum()),
+            "rating_bins": RATING_BINS.tolist(),
+            "histogram_before": np.histogram(before, bins=RATING_BINS)[0].tolist(),
+            "histogram_after": np.histogram(after, bins=RATING_BINS)[0].tolist(),
+            "examples": examples,
+            "elapsed_ms": round((time.time() - started) * 1000, 1),
+        }
+
+
+backtest_service = BacktestService()
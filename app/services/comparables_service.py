@@ -0,0 +1,274 @@
+import logging
+import os
+import threading
+import time
+from typing import List, Optional
+
+import numpy as np
+from sqlalchemy.orm import Session
+
+from app.core.shared_state import stats_generation
+from app.models.database import ReadSessionLocal
+from app.models.models import FINANCIAL_COLUMNS, CreditApplication
+
+logger = logging.getLogger(__name__)
+
+DATASET_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), "final_dataset.csv")
+COMPARABLES_K = int(os.getenv("COMPARABLES_K", "5"))
+# Новые заявки ищутся перебором в буфере; при таком размере буфера дерево перестраивается в фоне
+COMPARABLES_REBUILD_ROWS = int(os.getenv("COMPARABLES_REBUILD_ROWS", "5000"))
+# Полная перестройка по расписанию убирает из индекса удаленные заявки
+COMPARABLES_REBUILD_SECONDS = int(os.getenv("COMPARABLES_REBUILD_SECONDS", "3600"))
+COMPARABLES_REFRESH_SECONDS = int(os.getenv("COMPARABLES_REFRESH_SECONDS", "60"))
+COMPARABLES_LOAD_BATCH = 50000
+# Показатели чужих заявок отдаются огрубленными (знаков после запятой)
+COMPARABLES_FOREIGN_DIGITS = int(os.getenv("COMPARABLES_FOREIGN_DIGITS", "1"))
+
+
+def _transform(raw: np.ndarray) -> np.ndarray:
+    """Показатели с длинными хвостами (ликвидность 0.1..100+) сжимаются знаковым логарифмом"""
+    return np.sign(raw) * np.log1p(np.abs(raw))
+
+
+class ComparablesIndex:
+    """
+    KD-дерево (scipy cKDTree) по нормированным показателям. Точки из датасета
+    имеют отрицательные id и исход (target) вместо рейтинга.
+    """
+
+    def __init__(self, ids: np.ndarray, raw: np.ndarray, ratings: np.ndarray, targets: np.ndarray, last_id: int):
+        from scipy.spatial import cKDTree
+
+        transformed = _transform(raw)
+        self.center = np.median(transformed, axis=0) if len(raw) else np.zeros(len(FINANCIAL_COLUMNS))
+        scale = transformed.std(axis=0) if len(raw) else np.ones(len(FINANCIAL_COLUMNS))
+        self.scale = np.where(scale > 0, scale, 1.0)
+        # Пустой ввод в запросе заменяется медианой
+        self.medians = np.median(raw, axis=0) if len(raw) else np.zeros(len(FINANCIAL_COLUMNS))
+        self.ids = ids
+        self.raw = raw
+        self.ratings = ratings
+        self.targets = targets
+        self.last_id = last_id
+        self.tree = cKDTree(self.normalize(raw)) if len(raw) else None
+        self.built_at = time.time()
+
+    def normalize(self, raw: np.ndarray) -> np.ndarray:
+        return (_transform(raw) - self.center) / self.scale
+
+
+def _load_dataset() -> tuple:
+    try:
+        import pandas as pd
+        df = pd.read_csv(DATASET_PATH).dropna(subset=FINANCIAL_COLUMNS)
+    except (OSError, ValueError, KeyError) as e:
+        logger.warning(f"Датасет {DATASET_PATH} не загружен для поиска аналогов: {e}")
+        return np.empty((0, len(FINANCIAL_COLUMNS))), np.empty(0)
+    targets = df["target"].to_numpy(dtype=np.float64) if "target" in df.columns else np.full(len(df), np.nan)
+    return df[FINANCIAL_COLUMNS].to_numpy(dtype=np.float64), targets
+
+
+def _query_rows(db: Session, after_id: int, limit: int) -> list:
+    # Только заявки со всеми четырьмя показателями — иначе расстояние не определено
+    return db.query(
+        CreditApplication.id, CreditApplication.rating,
+        *(getattr(CreditApplication, name) for name in FINANCIAL_COLUMNS)
+    ).filter(
+        CreditApplication.id > after_id,
+        *(getattr(CreditApplication, name).isnot(None) for name in FINANCIAL_COLUMNS)
+    ).order_by(CreditApplication.id).limit(limit).all()
+
+
+def _rows_to_arrays(rows: list) -> tuple:
+    ids = np.fromiter((r[0] for r in rows), dtype=np.int64, count=len(rows))
+    ratings = np.array([r[1] for r in rows], dtype=np.float64)
+    raw = np.array([r[2:] for r in rows], dtype=np.float64).reshape(len(rows), len(FINANCIAL_COLUMNS))
+    return ids, raw, ratings
+
+
+class ComparablesService:
+    """
+    Аналоги заявки: k ближайших прошлых заявок (и строк final_dataset.csv) по показателям.
+    Чужие заявки обезличиваются: без номера и с огрубленными показателями (полностью — только админу).
+
+    Дерево строится в фоне; заявки, появившиеся после построения, попадают в небольшой
+    буфер (id > последнего, как у снимка бэктеста) и проверяются перебором. Когда буфер
+    вырастает или дерево устаревает, фоновый поток строит новое и подменяет старое.
+    """
+
+    def __init__(self, k: int = COMPARABLES_K):
+        self.k = k
+        self._index: Optional[ComparablesIndex] = None
+        self._buffer_ids = np.empty(0, dtype=np.int64)
+        self._buffer_raw = np.empty((0, len(FINANCIAL_COLUMNS)))
+        self._buffer_ratings = np.empty(0)
+        self._buffer_points = np.empty((0, len(FINANCIAL_COLUMNS)))
+        self._last_id = 0
+        self._generation = -1
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+        self._building = False
+
+    @property
+    def ready(self) -> bool:
+        return self._index is not None
+
+    def start_background_build(self):
+        with self._lock:
+            if self._building:
+                return
+            self._building = True
+        threading.Thread(target=self._build, name="comparables-builder", daemon=True).start()
+
+    def _build(self):
+        started = time.time()
+        try:
+            db = ReadSessionLocal()
+            try:
+                parts, last_id = [], 0
+                while True:
+                    rows = _query_rows(db, last_id, COMPARABLES_LOAD_BATCH)
+                    if not rows:
+                        break
+                    parts.append(_rows_to_arrays(rows))
+                    # int(): numpy.int64 SQLite привязал бы как BLOB
+                    last_id = int(parts[-1][0][-1])
+                    db.rollback()
+            finally:
+                db.close()
+            dataset_raw, dataset_targets = _load_dataset()
+
+            ids = np.concatenate([p[0] for p in parts] + [-np.arange(1, len(dataset_raw) + 1)])
+            raw = np.concatenate([p[1] for p in parts] + [dataset_raw]).reshape(-1, len(FINANCIAL_COLUMNS))
+            ratings = np.concatenate([p[2] for p in parts] + [np.full(len(dataset_raw), np.nan)])
+            targets = np.concatenate([np.full(len(ids) - len(dataset_raw), np.nan), dataset_targets])
+            index = ComparablesIndex(ids, raw, ratings, targets, last_id)
+
+            with self._lock:
+                # В буфере остаются только заявки новее построенного дерева
+                keep = self._buffer_ids > index.last_id
+                self._buffer_ids = self._buffer_ids[keep]
+                self._buffer_raw = self._buffer_raw[keep]
+                self._buffer_ratings = self._buffer_ratings[keep]
+                self._buffer_points = index.normalize(self._buffer_raw)
+                self._last_id = max(self._last_id, index.last_id)
+                self._index = index
+            logger.info(f"Индекс аналогов построен: {len(ids)} точек за {time.time() - started:.1f} с")
+        except Exception as e:
+            logger.error(f"Индекс аналогов не построен: {e}")
+        finally:
+            self._building = False
+
+    def _catch_up(self, db: Session):
+        generation = stats_generation.value
+        if generation == self._generation and time.time() - self._checked_at < COMPARABLES_REFRESH_SECONDS:
+            return
+        rows = _query_rows(db, self._last_id, COMPARABLES_REBUILD_ROWS)
+        with self._lock:
+            if rows:
+                ids, raw, ratings = _rows_to_arrays(rows)
+                fresh = ids > self._last_id
+                self._buffer_ids = np.concatenate([self._buffer_ids, ids[fresh]])
+                self._buffer_raw = np.concatenate([self._buffer_raw, raw[fresh]])
+                self._buffer_ratings = np.concatenate([self._buffer_ratings, ratings[fresh]])
+                self._buffer_points = np.concatenate([self._buffer_points, self._index.normalize(raw[fresh])])
+                self._last_id = max(self._last_id, int(ids[-1]))
+            self._generation = generation
+            self._checked_at = time.time()
+        if (len(self._buffer_ids) >= COMPARABLES_REBUILD_ROWS
+                or time.time() - self._index.built_at > COMPARABLES_REBUILD_SECONDS):
+            self.start_background_build()
+
+    def find(self, db: Session, financial_data: dict, exclude_id: Optional[int] = None,
+             user_id: Optional[int] = None, is_admin: bool = False) -> List[dict]:
+        """k ближайших аналогов; пока индекс строится — пустой список (запрос не ждет)"""
+        return self.find_batch(db, [financial_data], exclude_id, user_id, is_admin)[0]
+
+    def find_batch(self, db: Session, financial_rows: List[dict], exclude_id: Optional[int] = None,
+                   user_id: Optional[int] = None, is_admin: bool = False) -> List[List[dict]]:
+        if self._index is None:
+            self.start_background_build()
+            return [[] for _ in financial_rows]
+        self._catch_up(db)
+        with self._lock:
+            index = self._index
+            buffer_ids, buffer_raw = self._buffer_ids, self._buffer_raw
+            buffer_ratings, buffer_points = self._buffer_ratings, self._buffer_points
+
+        raw = np.array([
+            [np.nan if row.get(name) is None else float(row[name]) for name in FINANCIAL_COLUMNS]
+            for row in financial_rows
+        ], dtype=np.float64).reshape(len(financial_rows), len(FINANCIAL_COLUMNS))
+        raw = np.where(np.isnan(raw), index.medians, raw)
+        points = index.normalize(raw)
+        # Лишний сосед — на случай, если сама заявка уже в индексе
+        k = self.k + (1 if exclude_id is not None else 0)
+
+        results = []
+        tree_k = min(k, len(index.ids))
+        if tree_k:
+            distances, positions = index.tree.query(points, k=tree_k)
+            distances = distances.reshape(len(points), tree_k)
+            positions = positions.reshape(len(points), tree_k)
+        for i, point in enumerate(points):
+            candidates = []
+            if tree_k:
+                candidates = [
+                    (float(d), int(index.ids[p]), index.raw[p], index.ratings[p], index.targets[p])
+                    for d, p in zip(distances[i], positions[i])
+                ]
+            if len(buffer_ids):
+                buffer_distances = np.sqrt(((buffer_points - point) ** 2).sum(axis=1))
+                nearest = np.argpartition(buffer_distances, k - 1)[:k] if len(buffer_ids) > k else range(len(buffer_ids))
+                for p in nearest:
+                    candidates.append((float(buffer_distances[p]), int(buffer_ids[p]), buffer_raw[p],
+                                       buffer_ratings[p], np.nan))
+            candidates.sort(key=lambda c: c[0])
+            results.append([
+                self._describe(*c) for c in candidates if c[1] != exclude_id
+            ][:self.k])
+        if not is_admin:
+            self._anonymize(db, results, user_id)
+        return results
+
+    def _anonymize(self, db: Session, results: List[List[dict]], user_id: Optional[int]):
+        """Номер и точные показатели остаются только у своих заявок (владелец — одним запросом)"""
+        history_ids = {c["id"] for comparables in results for c in comparables if c["id"] is not None}
+        if not history_ids:
+            return
+        own = set() if user_id is None else {
+            row[0] for row in db.query(CreditApplication.id).filter(
+                CreditApplication.id.in_(history_ids), CreditApplication.user_id == user_id
+            )
+        }
+        for comparables in results:
+            for c in comparables:
+                if c["id"] is not None and c["id"] not in own:
+                    c["id"] = None
+                    c["financial_data"] = {
+                        name: round(value, COMPARABLES_FOREIGN_DIGITS) for name, value in c["financial_data"].items()
+                    }
+
+    def _describe(self, distance: float, app_id: int, raw: np.ndarray, rating: float, target: float) -> dict:
+        from_dataset = app_id < 0
+        return {
+            "id": None if from_dataset else app_id,
+            "source": "датасет" if from_dataset else "история",
+            "rating": None if np.isnan(rating) else int(rating),
+            "defaulted": None if np.isnan(target) else bool(target),
+            "distance": round(distance, 3),
+            "financial_data": {name: round(float(v), 4) for name, v in zip(FINANCIAL_COLUMNS, raw)},
+        }
+
+    def stats(self) -> dict:
+        index = self._index
+        return {
+            "ready": index is not None,
+            "indexed": 0 if index is None else len(index.ids),
+            "buffer": len(self._buffer_ids),
+            "building": self._building,
+            "built_at": None if index is None else round(index.built_at),
+        }
+
+
+comparables_service = ComparablesService()
@@ -1,10 +1,9 @@
 import re
 import io
-import pandas as pd
-import pdfplumber
 import logging
 import datetime
 from fastapi import UploadFile
+from app.core.utils import FIELD_ALIASES, match_columns, normalize_column
 
 logger = logging.getLogger(__name__)
 
@@ -58,7 +57,11 @@ class DataProcessingService:
     async def parse_financial_document(self, file: UploadFile) -> dict:
         """Улучшенный парсинг CSV и PDF"""
         contents = await file.read()
-        filename = file.filename.lower()
+        return self.parse_financial_bytes(contents, file.filename)
+
+    def parse_financial_bytes(self, contents: bytes, filename: str) -> dict:
+        """Парсинг уже прочитанного файла (используется и фоновыми обработчиками заявок)"""
+        filename = filename.lower()
         
         extracted_data = {
             "current_ratio": None,
@@ -69,35 +72,29 @@ class DataProcessingService:
 
         try:
             if filename.endswith('.csv'):
+                import pandas as pd  # тяжелый импорт — только когда действительно пришел CSV
                 df = pd.read_csv(io.BytesIO(contents))
                 
                 # Нормализуем названия колонок: убираем пробелы, приводим к нижнему регистру
-                df.columns = [c.strip().lower().replace(' ', '_').replace('-', '_') for c in df.columns]
-                
-                # Словарь маппинга
-                field_aliases = {
-                    "current_ratio": ["current_ratio", "liquidity", "ликвидность", "current"],
-                    "debt_to_equity": ["debt_to_equity", "leverage", "леверидж", "debt", "задолженност"],
-                    "net_profit_margin": ["net_profit_margin", "profit", "рентабельность", "margin", "чистая_прибыль"],
-                    "company_age": ["company_age", "age", "возраст", "лет", "years"]
-                }
+                df.columns = [normalize_column(c) for c in df.columns]
 
                 if not df.empty:
                     last_row = df.iloc[-1]
                     
-                    for field, aliases in field_aliases.items():
-                        for col in df.columns:
-                            if any(alias in col for alias in aliases):
-                                try:
-                                    val = float(last_row[col])
-                                    extracted_data[field] = val
-                                    logger.info(f"CSV: Найдено {field} = {val} в колонке '{col}'")
-                                    break
-                                except ValueError:
-                                    pass
+                    # Первая подходящая колонка слева, как и раньше (приоритет точных совпадений — только в портфеле)
+                    for field, columns in match_columns(df.columns, FIELD_ALIASES, exact_first=False).items():
+                        for col in columns:
+                            try:
+                                val = float(last_row[col])
+                                extracted_data[field] = val
+                                logger.info(f"CSV: Найдено {field} = {val} в колонке '{col}'")
+                                break
+                            except ValueError:
+                                pass
                 
             elif filename.endswith('.pdf'):
                 text = ""
+                import pdfplumber
                 with pdfplumber.open(io.BytesIO(contents)) as pdf:
                     for page in pdf.pages:
                         page_text = page.extract_text()
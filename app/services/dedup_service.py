@@ -0,0 +1,406 @@
+import logging
+import os
+import pickle
+import re
+import threading
+import time
+import zlib
+from typing import List, Optional
+
+import numpy as np
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from app.models.database import SessionLocal
+from app.models.models import FINANCIAL_COLUMNS, CreditApplication
+
+logger = logging.getLogger(__name__)
+
+DEDUP_INDEX_PATH = os.getenv(
+    "DEDUP_INDEX_PATH",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), "dedup_index.pkl")
+)
+# 64 хеш-функции в 16 полосах по 4: пара с похожестью 0.7 попадает в общую корзину с вероятностью ~0.98
+DEDUP_NUM_PERM = 64
+DEDUP_BANDS = 16
+DEDUP_SHINGLE = 5
+DEDUP_THRESHOLD = float(os.getenv("DEDUP_THRESHOLD", "0.7"))
+# Описания короче — без проверки: у коротких текстов совпадения случайны
+DEDUP_MIN_LENGTH = 30
+DEDUP_MAX_MATCHES = 3
+# Новые заявки копятся в буфере и вливаются в отсортированные таблицы пачками
+DEDUP_MERGE_ROWS = int(os.getenv("DEDUP_MERGE_ROWS", "5000"))
+DEDUP_LOAD_BATCH = 20000
+DEDUP_REFRESH_SECONDS = int(os.getenv("DEDUP_REFRESH_SECONDS", "60"))
+
+_PRIME = np.uint64(4294967311)  # простое > 2^32
+_rng = np.random.RandomState(42)
+_PERM_A = _rng.randint(1, 2 ** 32 - 1, DEDUP_NUM_PERM, dtype=np.uint64)
+_PERM_B = _rng.randint(0, 2 ** 32 - 1, DEDUP_NUM_PERM, dtype=np.uint64)
+# Множители для свертки 4 значений полосы в один 64-битный ключ
+_BAND_MIX = np.array([0x9E3779B97F4A7C15, 0xC2B2AE3D27D4EB4F, 0x165667B19E3779F9, 1], dtype=np.uint64)
+_ROWS = DEDUP_NUM_PERM // DEDUP_BANDS
+_SPACES_RE = re.compile(r"\s+")
+
+
+def normalize_text(text: str) -> str:
+    return _SPACES_RE.sub(" ", (text or "").lower().replace("ё", "е")).strip()
+
+
+def minhash(text: str) -> Optional[np.ndarray]:
+    """MinHash-подпись по символьным шинглам описания (None — описание слишком короткое)"""
+    text = normalize_text(text)
+    if len(text) < DEDUP_MIN_LENGTH:
+        return None
+    shingles = {text[i:i + DEDUP_SHINGLE] for i in range(len(text) - DEDUP_SHINGLE + 1)}
+    hashes = np.fromiter((zlib.crc32(s.encode("utf-8")) for s in shingles), dtype=np.uint64, count=len(shingles))
+    # (a*x + b) mod p для всех шинглов и всех хеш-функций сразу; a, x < 2^32 — переполнения нет
+    values = (hashes[:, None] * _PERM_A + _PERM_B) % _PRIME
+    return values.min(axis=0).astype(np.uint32)
+
+
+def band_keys(signatures: np.ndarray) -> np.ndarray:
+    """Ключи полос: матрица (n x DEDUP_BANDS) uint64"""
+    bands = signatures.reshape(len(signatures), DEDUP_BANDS, _ROWS).astype(np.uint64)
+    with np.errstate(over="ignore"):
+        return (bands * _BAND_MIX).sum(axis=2, dtype=np.uint64)
+
+
+def ratio_key(financial_data: dict) -> int:
+    """Показатели, округленные до 1 знака: мелкие правки чисел дают тот же ключ"""
+    # crc32, а не hash(): ключ сохраняется на диск и должен совпадать между запусками
+    return zlib.crc32(repr(tuple(
+        None if financial_data.get(name) is None else round(float(financial_data[name]), 1)
+        for name in FINANCIAL_COLUMNS
+    )).encode())
+
+
+def _database_name(db: Session) -> str:
+    return db.get_bind().url.render_as_string(hide_password=True)
+
+
+class DedupIndex:
+    """
+    Основная часть: id, подписи и ключи показателей в массивах numpy и отсортированные
+    ключи каждой полосы (поиск — searchsorted). Новые заявки — в небольшом буфере со словарем.
+    """
+
+    def __init__(self):
+        self.ids = np.empty(0, dtype=np.int64)
+        self.signatures = np.empty((0, DEDUP_NUM_PERM), dtype=np.uint32)
+        self.ratio_keys = np.empty(0, dtype=np.int64)
+        self.sorted_keys = np.empty((DEDUP_BANDS, 0), dtype=np.uint64)
+        self.sorted_pos = np.empty((DEDUP_BANDS, 0), dtype=np.int64)
+        self.last_id = 0  # заявки до этого id прочитаны из БД
+        self.extra_ids = set()  # добавлены при сохранении, раньше чтения из БД (id > last_id)
+        self.database = None  # БД, по которой построен индекс
+        self._clear_buffer()
+
+    def _clear_buffer(self):
+        self.buffer_ids, self.buffer_signatures, self.buffer_ratio_keys = [], [], []
+        self.buffer_buckets = {}
+
+    def __len__(self):
+        return len(self.ids) + len(self.buffer_ids)
+
+    def add(self, app_id: int, signature: Optional[np.ndarray], key: int, from_db: bool = True):
+        """from_db=False — заявка только что сохранена этим процессом; из БД она не перечитывается"""
+        if from_db:
+            self.last_id = max(self.last_id, app_id)
+            if app_id in self.extra_ids:
+                self.extra_ids.discard(app_id)
+                return
+        elif app_id > self.last_id:
+            self.extra_ids.add(app_id)
+        if signature is None:
+            return
+        position = len(self.buffer_ids)
+        self.buffer_ids.append(app_id)
+        self.buffer_signatures.append(signature)
+        self.buffer_ratio_keys.append(key)
+        for band, band_key in enumerate(band_keys(signature[None, :])[0].tolist()):
+            self.buffer_buckets.setdefault((band, band_key), []).append(position)
+
+    def snapshot(self) -> "DedupIndex":
+        """Копия для сохранения на диск (только после merge): массивы не изменяются на месте"""
+        copy = DedupIndex()
+        copy.ids, copy.signatures, copy.ratio_keys = self.ids, self.signatures, self.ratio_keys
+        copy.sorted_keys, copy.sorted_pos = self.sorted_keys, self.sorted_pos
+        copy.last_id, copy.extra_ids, copy.database = self.last_id, set(self.extra_ids), self.database
+        return copy
+
+    def merge(self):
+        """Вливает буфер в основные массивы (вставка в отсортированные таблицы — O(n))"""
+        if not self.buffer_ids:
+            return
+        offset = len(self.ids)
+        signatures = np.array(self.buffer_signatures, dtype=np.uint32)
+        keys = band_keys(signatures).T
+        positions = np.arange(offset, offset + len(signatures), dtype=np.int64)
+        merged_keys, merged_pos = [], []
+        for band in range(DEDUP_BANDS):
+            order = np.argsort(keys[band], kind="stable")
+            new_keys, new_pos = keys[band][order], positions[order]
+            at = np.searchsorted(self.sorted_keys[band], new_keys)
+            merged_keys.append(np.insert(self.sorted_keys[band], at, new_keys))
+            merged_pos.append(np.insert(self.sorted_pos[band], at, new_pos))
+        self.sorted_keys = np.array(merged_keys, dtype=np.uint64).reshape(DEDUP_BANDS, -1)
+        self.sorted_pos = np.array(merged_pos, dtype=np.int64).reshape(DEDUP_BANDS, -1)
+        self.ids = np.concatenate([self.ids, np.array(self.buffer_ids, dtype=np.int64)])
+        self.signatures = np.concatenate([self.signatures, signatures])
+        self.ratio_keys = np.concatenate([self.ratio_keys, np.array(self.buffer_ratio_keys, dtype=np.int64)])
+        self._clear_buffer()
+
+    def query(self, signature: np.ndarray, key: int, threshold: float, limit: int) -> list:
+        """
+        Заявки, совпавшие хотя бы в одной полосе и с оценкой сходства Жаккара не ниже threshold:
+        до limit штук [(id, сходство, совпадают ли показатели)], сначала совпадающие и по показателям.
+        """
+        keys = band_keys(signature[None, :])[0]
+        found = []
+        for band in range(DEDUP_BANDS):
+            row = self.sorted_keys[band]
+            lo = np.searchsorted(row, keys[band], side="left")
+            hi = np.searchsorted(row, keys[band], side="right")
+            if hi > lo:
+                found.append(self.sorted_pos[band][lo:hi])
+        results = []
+        if found:
+            # Популярное описание может дать тысячи кандидатов — сравниваем подписи векторно
+            positions = np.unique(np.concatenate(found))
+            similarity = (self.signatures[positions] == signature).mean(axis=1)
+            same = self.ratio_keys[positions] == key
+            keep = np.nonzero(similarity >= threshold)[0]
+            top = keep[np.lexsort((-similarity[keep], ~same[keep]))][:limit]
+            results = list(zip(self.ids[positions[top]].tolist(), similarity[top].tolist(), same[top].tolist()))
+
+        buffered = set()
+        for band, band_key in enumerate(keys.tolist()):
+            buffered.update(self.buffer_buckets.get((band, band_key), ()))
+        for p in buffered:
+            similarity = float((self.buffer_signatures[p] == signature).mean())
+            if similarity >= threshold:
+                results.append((self.buffer_ids[p], similarity, self.buffer_ratio_keys[p] == key))
+        results.sort(key=lambda r: (r[2], r[1]), reverse=True)
+        return results[:limit]
+
+
+class DedupService:
+    """
+    Поиск почти-дубликатов заявок (повторная подача той же компании с мелкими правками)
+    через MinHash/LSH по описанию бизнеса вместе с ключом округленных показателей.
+
+    Индекс строится (или читается с диска, DEDUP_INDEX_PATH) в фоновом потоке; пока он не готов,
+    проверка пропускается. Тот же поток раз в DEDUP_REFRESH_SECONDS дочитывает заявки других
+    процессов (id > последнего), вливает буфер и сохраняет индекс. Заявки этого процесса
+    добавляются сразу при сохранении (add). На пути запроса — только поиск в памяти.
+    """
+
+    def __init__(self, path: str = DEDUP_INDEX_PATH):
+        self.path = path
+        self._index: Optional[DedupIndex] = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._dirty = False  # индекс изменился после последнего сохранения
+
+    @property
+    def ready(self) -> bool:
+        return self._index is not None
+
+    def _new_index(self, db: Session) -> DedupIndex:
+        index = DedupIndex()
+        index.database = _database_name(db)
+        return index
+
+    def _load(self, db: Session) -> DedupIndex:
+        try:
+            with open(self.path, "rb") as f:
+                index = pickle.load(f)
+        except FileNotFoundError:
+            return self._new_index(db)
+        except Exception as e:
+            logger.warning(f"Индекс дубликатов {self.path} не прочитан ({e}), строится заново")
+            return self._new_index(db)
+        # Индекс от другой или пересозданной БД ссылался бы на чужие id
+        max_id = db.query(func.max(CreditApplication.id)).scalar() or 0
+        if index.database != _database_name(db) or index.last_id > max_id:
+            logger.info("Индекс дубликатов построен по другой БД, строится заново")
+            return self._new_index(db)
+        if not hasattr(index, "extra_ids"):
+            index.extra_ids = set()
+        logger.info(f"Индекс дубликатов загружен: {len(index)} заявок (до id {index.last_id})")
+        return index
+
+    def _save(self, index: DedupIndex):
+        """Атомарная запись: читатели видят либо старый файл, либо новый целиком"""
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, "wb") as f:
+                pickle.dump(index, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            logger.warning(f"Не удалось сохранить индекс дубликатов: {e}")
+
+    def _read_new(self, db: Session, after_id: int) -> list:
+        """Следующая пачка заявок из БД с подписями: [(id, подпись, ключ показателей)]"""
+        rows = db.query(
+            CreditApplication.id, CreditApplication.business_description,
+            *(getattr(CreditApplication, name) for name in FINANCIAL_COLUMNS)
+        ).filter(CreditApplication.id > after_id).order_by(CreditApplication.id).limit(DEDUP_LOAD_BATCH).all()
+        db.rollback()
+        return [(row[0], minhash(row[1]), ratio_key(dict(zip(FINANCIAL_COLUMNS, row[2:])))) for row in rows]
+
+    def _catch_up(self, db: Session, index: DedupIndex, locked: bool) -> int:
+        """Дочитывает заявки из БД. locked — индекс уже опубликован, изменения под блокировкой."""
+        added = 0
+        while True:
+            items = self._read_new(db, index.last_id)
+            if not items:
+                return added
+            if locked:
+                with self._lock:
+                    for item in items:
+                        index.add(*item)
+            else:
+                for item in items:
+                    index.add(*item)
+            added += len(items)
+            if len(items) < DEDUP_LOAD_BATCH:
+                return added
+
+    # --- Фоновый поток ---
+
+    def start_background_build(self):
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="dedup-index", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Остановка потока и сохранение несохраненных изменений (при завершении процесса)"""
+        thread = self._thread
+        if thread is None:
+            return
+        self._stop.set()
+        thread.join()
+        self._thread = None
+        if self._index is not None and self._dirty:
+            self._merge_and_save()
+
+    def _run(self):
+        started = time.time()
+        try:
+            db = SessionLocal()
+            try:
+                index = self._load(db)
+                loaded = index.last_id
+                self._catch_up(db, index, locked=False)
+            finally:
+                db.close()
+            index.merge()
+            with self._lock:
+                self._index = index
+                self._dirty = index.last_id != loaded
+            logger.info(f"Индекс дубликатов готов: {len(index)} заявок за {time.time() - started:.1f} с")
+            if self._dirty:
+                self._merge_and_save()
+        except Exception as e:
+            logger.error(f"Индекс дубликатов не построен: {e}")
+            return
+
+        while not self._stop.wait(DEDUP_REFRESH_SECONDS):
+            try:
+                self.refresh()
+            except Exception as e:
+                logger.error(f"Ошибка обновления индекса дубликатов: {e}")
+
+    def refresh(self):
+        """Заявки других процессов; буфер вливается и индекс сохраняется, когда набралось DEDUP_MERGE_ROWS"""
+        index = self._index
+        if index is None:
+            return
+        db = SessionLocal()
+        try:
+            if self._catch_up(db, index, locked=True):
+                self._dirty = True
+        finally:
+            db.close()
+        if len(index.buffer_ids) >= DEDUP_MERGE_ROWS:
+            self._merge_and_save()
+
+    def _merge_and_save(self):
+        with self._lock:
+            index = self._index
+            index.merge()
+            snapshot = index.snapshot()
+            self._dirty = False
+        # Запись файла — вне блокировки: поиск не ждет pickle
+        self._save(snapshot)
+
+    # --- Запросы ---
+
+    def add(self, app_id: int, description: str, financial_data: dict):
+        """Только что сохраненная заявка этого процесса — сразу видна поиску"""
+        index = self._index
+        if index is None:
+            return
+        signature = minhash(description)
+        with self._lock:
+            index.add(app_id, signature, ratio_key(financial_data), from_db=False)
+            self._dirty = True
+
+    def rebuild(self, db: Session) -> dict:
+        """Полная перестройка по БД (удаленные заявки уходят из индекса)"""
+        started = time.time()
+        index = self._new_index(db)
+        self._catch_up(db, index, locked=False)
+        index.merge()
+        with self._lock:
+            self._index = index
+            self._dirty = False
+        self._save(index.snapshot())
+        logger.info(f"Индекс дубликатов перестроен: {len(index)} заявок за {time.time() - started:.1f} с")
+        return {"indexed": len(index), "last_id": index.last_id, "elapsed_s": round(time.time() - started, 2)}
+
+    def find_duplicates(self, db: Session, description: str, financial_data: dict) -> List[dict]:
+        """
+        Похожие сохраненные заявки: [{"id", "user_id", "company_name", "similarity", "same_ratios"}].
+        Пока индекс строится — пустой список (запрос не ждет).
+        """
+        index = self._index
+        if index is None:
+            self.start_background_build()
+            return []
+        signature = minhash(description)
+        if signature is None:
+            return []
+        with self._lock:
+            matches = index.query(signature, ratio_key(financial_data), DEDUP_THRESHOLD, DEDUP_MAX_MATCHES)
+        if not matches:
+            return []
+        # Заявки могли быть удалены после построения индекса
+        found = {
+            app_id: (user_id, name) for app_id, user_id, name in db.query(
+                CreditApplication.id, CreditApplication.user_id, CreditApplication.company_name
+            ).filter(CreditApplication.id.in_([m[0] for m in matches])).all()
+        }
+        return [
+            {"id": app_id, "user_id": found[app_id][0], "company_name": found[app_id][1],
+             "similarity": round(similarity, 2), "same_ratios": same}
+            for app_id, similarity, same in matches if app_id in found
+        ]
+
+    def stats(self) -> dict:
+        index = self._index
+        return {
+            "ready": index is not None,
+            "indexed": 0 if index is None else len(index),
+            "buffer": 0 if index is None else len(index.buffer_ids),
+            "last_id": 0 if index is None else index.last_id,
+        }
+
+
+dedup_service = DedupService()
@@ -0,0 +1,264 @@
+import bisect
+import datetime
+import json
+import logging
+import os
+import threading
+import time
+from typing import List, Optional
+
+import numpy as np
+
+from app.core.shared_state import model_generation
+from app.models.database import ReadSessionLocal, SessionLocal
+from app.models.models import FINANCIAL_COLUMNS, DriftSnapshot
+
+logger = logging.getLogger(__name__)
+
+DRIFT_REFERENCE_PATH = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.dirname(__file__))), "drift_reference.json"
+)
+# Корзины — децили эталона: у каждой ~10% обучающей выборки
+DRIFT_BINS = 10
+PROBABILITY_FEATURE = "default_probability"
+DRIFT_FEATURES = FINANCIAL_COLUMNS + [PROBABILITY_FEATURE]
+# Окно процесса сохраняется не чаще раза в DRIFT_SNAPSHOT_SECONDS и только от DRIFT_MIN_SAMPLES заявок
+DRIFT_SNAPSHOT_SECONDS = int(os.getenv("DRIFT_SNAPSHOT_SECONDS", "300"))
+DRIFT_MIN_SAMPLES = int(os.getenv("DRIFT_MIN_SAMPLES", "50"))
+# Отчет в /admin/stats — по снимкам за последние DRIFT_REPORT_HOURS часов (всех воркеров)
+DRIFT_REPORT_HOURS = int(os.getenv("DRIFT_REPORT_HOURS", "24"))
+# Общепринятые пороги PSI: до 0.1 — стабильно, 0.1–0.25 — умеренный сдвиг, выше — значительный
+PSI_MODERATE = 0.1
+PSI_SIGNIFICANT = 0.25
+PSI_EPSILON = 1e-4
+
+
+def build_reference(X: np.ndarray, probabilities: np.ndarray, bins: int = DRIFT_BINS) -> dict:
+    """
+    Эталонные гистограммы при обучении: границы — квантили обучающей выборки,
+    счетчики — число примеров в корзинах. Корзина i — значения в (edges[i-1], edges[i]].
+    """
+    columns = {name: X[:, i] for i, name in enumerate(FINANCIAL_COLUMNS)}
+    columns[PROBABILITY_FEATURE] = probabilities
+    features = {}
+    for name, values in columns.items():
+        values = values[~np.isnan(values)]
+        edges = np.unique(np.quantile(values, np.linspace(0, 1, bins + 1)[1:-1]))
+        counts = np.bincount(np.searchsorted(edges, values, side="left"), minlength=len(edges) + 1)
+        features[name] = {"edges": edges.tolist(), "counts": counts.tolist()}
+    return {
+        "reference_id": datetime.datetime.now().isoformat(timespec="seconds"),
+        "samples": int(len(X)),
+        "features": features,
+    }
+
+
+def save_reference(reference: dict, path: str = DRIFT_REFERENCE_PATH):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(reference, f)
+    os.replace(tmp_path, path)
+
+
+def read_reference(path: str = DRIFT_REFERENCE_PATH) -> Optional[dict]:
+    """Эталон необязателен: без него (модель обучена до появления мониторинга) дрейф не считается"""
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def psi(expected: np.ndarray, actual: np.ndarray) -> float:
+    """Population Stability Index по счетчикам одних и тех же корзин"""
+    e = np.clip(expected / max(expected.sum(), 1), PSI_EPSILON, None)
+    a = np.clip(actual / max(actual.sum(), 1), PSI_EPSILON, None)
+    return float(((a - e) * np.log(a / e)).sum())
+
+
+def ks(expected: np.ndarray, actual: np.ndarray) -> float:
+    """Статистика Колмогорова–Смирнова на границах корзин (оценка снизу точной)"""
+    e = np.cumsum(expected) / max(expected.sum(), 1)
+    a = np.cumsum(actual) / max(actual.sum(), 1)
+    return float(np.abs(a - e).max())
+
+
+def drift_status(value: float) -> str:
+    if value >= PSI_SIGNIFICANT:
+        return "значительный"
+    if value >= PSI_MODERATE:
+        return "умеренный"
+    return "нет"
+
+
+class DriftService:
+    """
+    Дрейф входящих заявок относительно обучающей выборки.
+
+    На каждую оцененную заявку — по одному бинарному поиску среди ~10 границ на признак
+    и инкремент счетчика: время и память на заявку постоянны, заявки не хранятся.
+    Окно счетчиков процесса периодически сохраняется снимком в drift_snapshots; отчет
+    суммирует снимки всех воркеров за последние часы и считает PSI и KS к эталону.
+    """
+
+    def __init__(self, reference_path: str = DRIFT_REFERENCE_PATH):
+        self.reference_path = reference_path
+        self.reference = None
+        self._edges = {}
+        self._generation = -1
+        self._counts = {}
+        self._samples = 0
+        self._window_started = time.time()
+        self._pending = []
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _sync_reference(self):
+        """Эталон перечитывается после переобучения модели (model_generation)"""
+        generation = model_generation.value
+        if generation == self._generation:
+            return
+        reference = read_reference(self.reference_path)
+        with self._lock:
+            self._take_window()
+            self.reference = reference
+            self._edges = {} if reference is None else {
+                name: feature["edges"] for name, feature in reference["features"].items()
+            }
+            self._counts = {name: [0] * (len(edges) + 1) for name, edges in self._edges.items()}
+            self._generation = generation
+
+    def _take_window(self):
+        """Переносит окно в очередь на сохранение и начинает новое (под блокировкой)"""
+        if self._samples and self.reference is not None:
+            self._pending.append({
+                "reference_id": self.reference["reference_id"],
+                "samples": self._samples,
+                "counts": self._counts,
+            })
+        self._counts = {name: [0] * (len(edges) + 1) for name, edges in self._edges.items()}
+        self._samples = 0
+        self._window_started = time.time()
+
+    def observe(self, financial_data: dict, probability: float):
+        """Учет одной оцененной заявки (признаки — как их видела модель)"""
+        self._sync_reference()
+        if not self._edges:
+            return
+        with self._lock:
+            for name in FINANCIAL_COLUMNS:
+                value = float(financial_data.get(name, 0))
+                self._counts[name][bisect.bisect_left(self._edges[name], value)] += 1
+            self._counts[PROBABILITY_FEATURE][bisect.bisect_left(self._edges[PROBABILITY_FEATURE], probability)] += 1
+            self._samples += 1
+
+    def observe_batch(self, financial_rows: List[dict], probabilities: np.ndarray):
+        self._sync_reference()
+        if not self._edges or not financial_rows:
+            return
+        columns = {
+            name: np.array([float(row.get(name, 0)) for row in financial_rows]) for name in FINANCIAL_COLUMNS
+        }
+        columns[PROBABILITY_FEATURE] = np.asarray(probabilities, dtype=np.float64)
+        with self._lock:
+            for name, values in columns.items():
+                edges = self._edges[name]
+                added = np.bincount(np.searchsorted(edges, values, side="left"), minlength=len(edges) + 1)
+                self._counts[name] = [c + int(d) for c, d in zip(self._counts[name], added)]
+            self._samples += len(financial_rows)
+
+    # --- Сохранение снимков ---
+
+    def start(self):
+        """Фоновый поток сохранения окна (в каждом процессе свой)"""
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="drift-snapshots", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+        self.flush(force=True)
+
+    def _run(self):
+        while not self._stop.wait(min(DRIFT_SNAPSHOT_SECONDS, 60)):
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"Снимок дрейфа не сохранен: {e}")
+
+    def flush(self, force: bool = False):
+        with self._lock:
+            due = time.time() - self._window_started >= DRIFT_SNAPSHOT_SECONDS and self._samples >= DRIFT_MIN_SAMPLES
+            if due or (force and self._samples):
+                self._take_window()
+            pending, self._pending = self._pending, []
+        if not pending:
+            return
+        db = SessionLocal()
+        try:
+            db.add_all([DriftSnapshot(**snapshot) for snapshot in pending])
+            db.commit()
+        finally:
+            db.close()
+
+    # --- Отчет ---
+
+    def report(self, hours: int = DRIFT_REPORT_HOURS) -> Optional[dict]:
+        """PSI/KS по каждому признаку и вероятности: снимки за hours часов + текущее окно процесса"""
+        self._sync_reference()
+        reference = self.reference
+        if reference is None:
+            return None
+        reference_id = reference["reference_id"]
+        totals = {name: np.zeros(len(f["counts"]), dtype=np.int64) for name, f in reference["features"].items()}
+        samples = 0
+
+        since = datetime.datetime.now() - datetime.timedelta(hours=hours)
+        db = ReadSessionLocal()
+        try:
+            snapshots = db.query(DriftSnapshot.samples, DriftSnapshot.counts).filter(
+                DriftSnapshot.created_at >= since, DriftSnapshot.reference_id == reference_id
+            ).all()
+        finally:
+            db.close()
+        with self._lock:
+            window = [(self._samples, self._counts)] if self._samples else []
+            window_samples = self._samples
+        for snapshot_samples, counts in list(snapshots) + window:
+            samples += snapshot_samples
+            for name, values in counts.items():
+                if name in totals and len(values) == len(totals[name]):
+                    totals[name] += np.asarray(values, dtype=np.int64)
+
+        features = []
+        for name in DRIFT_FEATURES:
+            expected = np.array(reference["features"][name]["counts"], dtype=np.float64)
+            actual = totals[name].astype(np.float64)
+            value = psi(expected, actual) if samples else 0.0
+            features.append({
+                "name": name,
+                "psi": round(value, 4),
+                "ks": round(ks(expected, actual), 4) if samples else 0.0,
+                "status": drift_status(value) if samples >= DRIFT_MIN_SAMPLES else "мало данных",
+            })
+        worst = max((f["psi"] for f in features), default=0.0)
+        return {
+            "reference_id": reference_id,
+            "reference_samples": reference["samples"],
+            "samples": samples,
+            "snapshots": len(snapshots),
+            "window_samples": window_samples,
+            "hours": hours,
+            "features": features,
+            "retrain_recommended": samples >= DRIFT_MIN_SAMPLES and worst >= PSI_SIGNIFICANT,
+        }
+
+
+drift_service = DriftService()
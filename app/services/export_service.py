@@ -0,0 +1,178 @@
+import csv
+import datetime
+import io
+import json
+import logging
+import os
+import zlib
+from typing import Iterator, List, Optional
+
+from sqlalchemy.orm import Session
+
+from app.models.database import ReadSessionLocal
+from app.models.models import FINANCIAL_COLUMNS, CreditApplication, FoundRisk
+
+logger = logging.getLogger(__name__)
+
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "2000"))
+EXPORT_FORMATS = ("csv", "ndjson")
+MODEL_FEATURES = FINANCIAL_COLUMNS
+
+# Читаем столбцы, а не ORM-объекты: для выгрузки не нужны ни identity map, ни отслеживание изменений
+APPLICATION_COLUMNS = (
+    CreditApplication.id, CreditApplication.created_at, CreditApplication.user_id,
+    CreditApplication.company_name, CreditApplication.industry, CreditApplication.rating,
+    CreditApplication.status, *(getattr(CreditApplication, name) for name in FINANCIAL_COLUMNS),
+    CreditApplication.financial_data, CreditApplication.business_description,
+)
+RISK_COLUMNS = (FoundRisk.application_id, FoundRisk.risk_type, FoundRisk.source, FoundRisk.severity, FoundRisk.recommendation)
+
+CSV_COLUMNS = [
+    "id", "created_at", "user_id", "company_name", "industry", "rating", "status",
+    *MODEL_FEATURES, "business_description", "risks_found", "risks"
+]
+
+
+class ExportFilters:
+    def __init__(self, date_from: Optional[datetime.date] = None, date_to: Optional[datetime.date] = None,
+                 user_id: Optional[int] = None, industry: Optional[str] = None):
+        self.date_from = date_from
+        self.date_to = date_to
+        self.user_id = user_id
+        self.industry = industry
+
+    def apply(self, query, model=CreditApplication):
+        """model — CreditApplication или ArchivedApplication (у заглушек архива те же поля фильтров)"""
+        if self.date_from:
+            query = query.filter(model.created_at >= datetime.datetime.combine(self.date_from, datetime.time()))
+        if self.date_to:
+            # Дата "по" включительно
+            query = query.filter(model.created_at < datetime.datetime.combine(
+                self.date_to + datetime.timedelta(days=1), datetime.time()))
+        if self.user_id is not None:
+            query = query.filter(model.user_id == self.user_id)
+        if self.industry:
+            query = query.filter(model.industry == self.industry)
+        return query
+
+
+class ExportService:
+    """
+    Выгрузка заявок с рисками потоком CSV/NDJSON (опционально gzip).
+
+    Заявки читаются пачками по id (keyset): каждая пачка — короткий запрос
+    в своей транзакции, риски пачки — одним запросом IN. В памяти одновременно
+    только одна пачка, а долгое чтение не держит блокировку SQLite для писателей.
+    """
+
+    def iter_batches(self, db: Session, filters: ExportFilters, batch_size: int = EXPORT_BATCH_SIZE) -> Iterator[List[tuple]]:
+        """Пачки [(заявка, [риски])]"""
+        last_id = 0
+        while True:
+            apps = filters.apply(db.query(*APPLICATION_COLUMNS)).filter(
+                CreditApplication.id > last_id
+            ).order_by(CreditApplication.id).limit(batch_size).all()
+            if not apps:
+                return
+            risks = {}
+            for risk in db.query(*RISK_COLUMNS).filter(FoundRisk.application_id.in_([a.id for a in apps])):
+                risks.setdefault(risk.application_id, []).append(risk)
+            batch = [(a, risks.get(a.id, [])) for a in apps]
+            last_id = apps[-1].id
+            # Отпускаем транзакцию перед следующей пачкой
+            db.rollback()
+            yield batch
+
+    def record(self, application, risks: list) -> dict:
+        # Показатели из типизированных колонок, остальное — из JSON
+        financial_data = {name: getattr(application, name) for name in FINANCIAL_COLUMNS
+                          if getattr(application, name) is not None}
+        financial_data.update(application.financial_data or {})
+        return {
+            "id": application.id,
+            "created_at": application.created_at.isoformat() if application.created_at else None,
+            "user_id": application.user_id,
+            "company_name": application.company_name,
+            "industry": application.industry,
+            "rating": application.rating,
+            "status": application.status,
+            "financial_data": financial_data,
+            "business_description": application.business_description,
+            "risks": [
+                {
+                    "risk_type": r.risk_type,
+                    "source": r.source,
+                    "severity": r.severity,
+                    "recommendation": r.recommendation,
+                }
+                for r in risks
+            ],
+        }
+
+    def _csv_row(self, record: dict) -> list:
+        fin = record["financial_data"]
+        return [
+            record["id"], record["created_at"], record["user_id"], record["company_name"], record["industry"],
+            record["rating"], record["status"], *[fin.get(name) for name in MODEL_FEATURES],
+            record["business_description"], len(record["risks"]),
+            "; ".join(f"{r['severity']}: {r['source']}" for r in record["risks"])
+        ]
+
+    def iter_records(self, db: Session, filters: ExportFilters, include_archive: bool = True) -> Iterator[List[dict]]:
+        """Пачки записей выгрузки: сначала архивные заявки (они старше), затем из рабочей БД"""
+        if include_archive:
+            from app.services.archive_service import archive_service
+
+            batch = []
+            for record in archive_service.iter_records(db, filters):
+                batch.append(record)
+                if len(batch) >= EXPORT_BATCH_SIZE:
+                    yield batch
+                    batch = []
+            if batch:
+                yield batch
+        for batch in self.iter_batches(db, filters):
+            yield [self.record(application, risks) for application, risks in batch]
+
+    def stream(self, fmt: str, filters: ExportFilters, compress: bool = False, include_archive: bool = True) -> Iterator[bytes]:
+        """Генератор байтов выгрузки; сессия БД своя, т.к. ответ отдается после обработчика"""
+        if fmt not in EXPORT_FORMATS:
+            raise ValueError(f"Неизвестный формат: {fmt}")
+        compressor = zlib.compressobj(wbits=31) if compress else None  # 31 — формат gzip
+
+        def encode(text: str) -> bytes:
+            data = text.encode("utf-8")
+            return compressor.compress(data) if compressor else data
+
+        out = io.StringIO()
+        writer = csv.writer(out)
+        if fmt == "csv":
+            writer.writerow(CSV_COLUMNS)
+
+        db = ReadSessionLocal()
+        count = 0
+        try:
+            for batch in self.iter_records(db, filters, include_archive):
+                for record in batch:
+                    if fmt == "csv":
+                        writer.writerow(self._csv_row(record))
+                    else:
+                        out.write(json.dumps(record, ensure_ascii=False))
+                        out.write("\n")
+                count += len(batch)
+                chunk = encode(out.getvalue())
+                out.seek(0)
+                out.truncate()
+                if chunk:
+                    yield chunk
+            tail = encode(out.getvalue())
+            if compressor:
+                tail += compressor.flush()
+            if tail:
+                yield tail
+            logger.info(f"Выгрузка {fmt}: {count} заявок")
+        finally:
+            db.close()
+
+
+export_service = ExportService()
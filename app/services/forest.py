@@ -0,0 +1,116 @@
+import numpy as np
+
+
+class FlatForest:
+    """
+    Случайный лес sklearn, развернутый в плоские массивы numpy (все деревья подряд).
+
+    Массивы не содержат Python-объектов, поэтому после загрузки в master-процессе
+    они разделяются с дочерними процессами через fork/copy-on-write, а загрузка
+    из .npz не требует импорта sklearn.
+    """
+
+    ARRAYS = ("roots", "left", "right", "feature", "threshold", "value")
+
+    def __init__(self, roots, left, right, feature, threshold, value, n_features):
+        self.roots = roots          # индекс корня каждого дерева
+        self.left = left            # левый потомок (-1 для листа)
+        self.right = right          # правый потомок
+        self.feature = feature      # признак разбиения
+        self.threshold = threshold  # порог разбиения
+        self.value = value          # доля класса 1 в узле
+        self.n_features = int(n_features)
+        self.n_trees = len(roots)
+
+    @classmethod
+    def from_sklearn(cls, model) -> "FlatForest":
+        roots, left, right, feature, threshold, value = [], [], [], [], [], []
+        offset = 0
+        for estimator in model.estimators_:
+            tree = estimator.tree_
+            counts = tree.value[:, 0, :]
+            totals = counts.sum(axis=1)
+            positive = counts[:, 1] if counts.shape[1] > 1 else np.zeros(len(counts))
+            is_leaf = tree.children_left == -1
+
+            roots.append(offset)
+            left.append(np.where(is_leaf, -1, tree.children_left + offset))
+            right.append(np.where(is_leaf, -1, tree.children_right + offset))
+            feature.append(np.where(is_leaf, 0, tree.feature))
+            threshold.append(tree.threshold)
+            value.append(np.divide(positive, totals, out=np.zeros_like(positive), where=totals > 0))
+            offset += tree.node_count
+
+        return cls(
+            roots=np.array(roots, dtype=np.int64),
+            left=np.concatenate(left).astype(np.int64),
+            right=np.concatenate(right).astype(np.int64),
+            feature=np.concatenate(feature).astype(np.int64),
+            threshold=np.concatenate(threshold).astype(np.float64),
+            value=np.concatenate(value).astype(np.float64),
+            n_features=model.n_features_in_,
+        )
+
+    def save(self, path: str):
+        np.savez(path, n_features=self.n_features, **{name: getattr(self, name) for name in self.ARRAYS})
+
+    @classmethod
+    def load(cls, path: str) -> "FlatForest":
+        with np.load(path) as data:
+            return cls(n_features=int(data["n_features"]), **{name: data[name] for name in cls.ARRAYS})
+
+    def apply(self, X: np.ndarray) -> np.ndarray:
+        """Индексы листьев: матрица (число объектов x число деревьев)"""
+        # sklearn сравнивает признаки во float32 — повторяем, чтобы ответы совпадали
+        X = np.asarray(X, dtype=np.float32)
+        n_samples = len(X)
+        nodes = np.tile(self.roots, n_samples)
+        samples = np.repeat(np.arange(n_samples), self.n_trees)
+        # Спускаемся по всем деревьям сразу, продолжая только незавершенные пути
+        active = np.nonzero(self.left[nodes] != -1)[0]
+        while active.size:
+            current = nodes[active]
+            go_left = X[samples[active], self.feature[current]] <= self.threshold[current]
+            nodes[active] = np.where(go_left, self.left[current], self.right[current])
+            active = active[self.left[nodes[active]] != -1]
+        nodes = nodes.reshape(n_samples, self.n_trees)
+        return nodes
+
+    @property
+    def expected_value(self) -> float:
+        """Средняя доля класса 1 в корнях деревьев — точка отсчета для вкладов признаков"""
+        return float(self.value[self.roots].mean())
+
+    def contributions(self, X: np.ndarray) -> tuple:
+        """
+        Вклады признаков в вероятность класса 1 по путям в деревьях (метод Saabas):
+        на каждом разбиении изменение доли класса 1 приписывается признаку этого разбиения.
+        Возвращает (вероятности, матрица вкладов n x n_features);
+        expected_value + сумма вкладов строки = вероятность.
+        """
+        X = np.asarray(X, dtype=np.float32)
+        n_samples = len(X)
+        nodes = np.tile(self.roots, n_samples)
+        samples = np.repeat(np.arange(n_samples), self.n_trees)
+        # Суммы изменений копятся в плоском массиве (объект * признак) через bincount
+        totals = np.zeros(n_samples * self.n_features)
+        active = np.nonzero(self.left[nodes] != -1)[0]
+        while active.size:
+            current = nodes[active]
+            split = self.feature[current]
+            go_left = X[samples[active], split] <= self.threshold[current]
+            child = np.where(go_left, self.left[current], self.right[current])
+            nodes[active] = child
+            totals += np.bincount(
+                samples[active] * self.n_features + split,
+                weights=self.value[child] - self.value[current],
+                minlength=totals.size,
+            )
+            active = active[self.left[child] != -1]
+        positive = self.value[nodes].reshape(n_samples, self.n_trees).mean(axis=1)
+        return positive, totals.reshape(n_samples, self.n_features) / self.n_trees
+
+    def predict_proba(self, X: np.ndarray) -> np.ndarray:
+        """Совместимо с RandomForestClassifier.predict_proba для бинарной классификации"""
+        positive = self.value[self.apply(X)].mean(axis=1)
+        return np.column_stack([1 - positive, positive])
@@ -0,0 +1,200 @@
+import datetime
+import logging
+import os
+import threading
+from typing import Optional
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from app.models.database import SessionLocal
+from app.models.models import ApplicationData, Job
+
+logger = logging.getLogger(__name__)
+
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+JOB_QUEUE_MAX_PENDING = int(os.getenv("JOB_QUEUE_MAX_PENDING", "500"))
+JOB_QUEUE_MAX_PER_USER = int(os.getenv("JOB_QUEUE_MAX_PER_USER", "20"))
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "1.0"))
+# Задача в работе дольше этого срока считается брошенной, даже если процесс-владелец жив
+JOB_LEASE_SECONDS = int(os.getenv("JOB_LEASE_SECONDS", "600"))
+
+# Приоритет по роли: заявки администраторов и операторов обрабатываются раньше
+PRIORITY_BY_ROLE = {"admin": 2, "operator": 1, "user": 0}
+
+
+class QueueFullError(Exception):
+    """Очередь переполнена — клиенту нужно повторить попытку позже"""
+
+    def __init__(self, message: str, retry_after: int):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def _process_alive(pid: Optional[int]) -> bool:
+    """Процесс-владелец задачи еще работает. Свой pid — задача от прошлого процесса с тем же номером."""
+    if not pid or pid == os.getpid():
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class JobQueueService:
+    """
+    Локальная персистентная очередь заявок на таблице jobs (без внешнего брокера).
+    Обработчики — потоки этого процесса; задачи, поставленные другими процессами,
+    подхватываются периодическим опросом таблицы.
+    """
+
+    def __init__(self, workers: int = JOB_WORKERS):
+        self.workers = workers
+        self._threads = []
+        self._stop = threading.Event()
+        self._wakeup = threading.Condition()
+
+    def enqueue(self, db: Session, user, application: ApplicationData,
+                document: Optional[bytes] = None, document_name: Optional[str] = None) -> Job:
+        """Ставит заявку в очередь. При переполнении бросает QueueFullError."""
+        pending = db.query(func.count(Job.id)).filter(Job.status == "queued").scalar()
+        if pending >= JOB_QUEUE_MAX_PENDING:
+            raise QueueFullError("Очередь заявок переполнена", retry_after=max(1, pending // max(self.workers, 1)))
+
+        user_pending = db.query(func.count(Job.id)).filter(
+            Job.status.in_(["queued", "running"]), Job.user_id == user.id
+        ).scalar()
+        if user_pending >= JOB_QUEUE_MAX_PER_USER:
+            raise QueueFullError("Слишком много необработанных заявок", retry_after=5)
+
+        job = Job(
+            user_id=user.id,
+            status="queued",
+            priority=PRIORITY_BY_ROLE.get(user.role, 0),
+            payload=application.model_dump(),
+            document=document,
+            document_name=document_name,
+        )
+        db.add(job)
+        db.commit()
+        db.refresh(job)
+
+        with self._wakeup:
+            self._wakeup.notify()
+        return job
+
+    def get_job(self, db: Session, job_id: int) -> Optional[Job]:
+        return db.query(Job).filter(Job.id == job_id).first()
+
+    def queue_stats(self, db: Session) -> dict:
+        rows = db.query(Job.status, func.count(Job.id)).group_by(Job.status).all()
+        return {status: count for status, count in rows}
+
+    # --- Обработчики ---
+
+    def start(self):
+        if self._threads:
+            return
+        self._stop.clear()
+        self._requeue_interrupted()
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._worker_loop, name=f"job-worker-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        logger.info(f"Запущено обработчиков очереди: {self.workers}")
+
+    def stop(self, timeout: float = 10.0):
+        self._stop.set()
+        with self._wakeup:
+            self._wakeup.notify_all()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def _requeue_interrupted(self):
+        """
+        Задачи, прерванные остановкой процесса, возвращаются в очередь. В режиме pre-fork
+        (и при замене воркеров) другие процессы еще обрабатывают свои задачи, поэтому
+        возвращаются только задачи умерших процессов и задачи с истекшим сроком.
+        """
+        db = SessionLocal()
+        try:
+            expired = datetime.datetime.now() - datetime.timedelta(seconds=JOB_LEASE_SECONDS)
+            running = db.query(Job.id, Job.worker_pid, Job.started_at).filter(Job.status == "running").all()
+            abandoned = [
+                job_id for job_id, pid, started_at in running
+                if not _process_alive(pid) or started_at is None or started_at < expired
+            ]
+            count = 0
+            if abandoned:
+                count = db.query(Job).filter(Job.id.in_(abandoned), Job.status == "running").update(
+                    {Job.status: "queued", Job.started_at: None, Job.worker_pid: None}, synchronize_session=False
+                )
+            db.commit()
+            if count:
+                logger.info(f"Возвращено в очередь прерванных задач: {count}")
+        finally:
+            db.close()
+
+    def _claim(self, db: Session) -> Optional[Job]:
+        """Забирает задачу с наибольшим приоритетом. UPDATE с условием по статусу защищает от гонки обработчиков."""
+        while True:
+            job_id = db.query(Job.id).filter(Job.status == "queued").order_by(
+                Job.priority.desc(), Job.id
+            ).limit(1).scalar()
+            if job_id is None:
+                return None
+            claimed = db.query(Job).filter(Job.id == job_id, Job.status == "queued").update(
+                {Job.status: "running", Job.started_at: datetime.datetime.now(), Job.worker_pid: os.getpid()},
+                synchronize_session=False,
+            )
+            db.commit()
+            if claimed:
+                return db.query(Job).filter(Job.id == job_id).first()
+
+    def _worker_loop(self):
+        while not self._stop.is_set():
+            db = SessionLocal()
+            try:
+                job = self._claim(db)
+                if job is not None:
+                    self._process(db, job)
+                    continue
+            except Exception as e:
+                logger.error(f"Ошибка обработчика очереди: {e}")
+            finally:
+                db.close()
+
+            with self._wakeup:
+                self._wakeup.wait(JOB_POLL_INTERVAL)
+
+    def _process(self, db: Session, job: Job):
+        from app.services.analysis_service import analysis_service
+        from app.services.data_service import data_service
+
+        try:
+            application = ApplicationData(**job.payload)
+            if job.document and job.document_name:
+                file_data = data_service.parse_financial_bytes(job.document, job.document_name)
+                if file_data:
+                    application.financial_data.update(file_data)
+
+            result = analysis_service.analyze_application(application, user_id=job.user_id, db=db)
+            job.result = result.model_dump(mode="json")
+            job.application_id = result.application_id
+            job.status = "done"
+        except Exception as e:
+            db.rollback()
+            logger.error(f"Ошибка обработки задачи {job.id}: {e}")
+            job.status = "error"
+            job.error = str(e)
+
+        job.document = None  # файл больше не нужен
+        job.finished_at = datetime.datetime.now()
+        db.commit()
+
+
+job_queue = JobQueueService()
@@ -1,13 +1,83 @@
+import threading
 from sqlalchemy.orm import Session
+from app.core.shared_state import bump, rules_generation
 from app.models.models import KnowledgeRule
-from typing import List, Optional
+from typing import List, NamedTuple, Optional, Tuple
+
+class CompiledRule(NamedTuple):
+    """Неизменяемая копия правила для горячего пути (без обращения к ORM)"""
+    id: int
+    risk_type: str
+    rule_name: str
+    field: str
+    op: str
+    val: object
+    severity: str
+    recommendation: str
 
 class KnowledgeBaseService:
-    
+
+    def __init__(self):
+        self._snapshot: Tuple[CompiledRule, ...] = ()
+        self._snapshot_generation = -1
+        self._snapshot_lock = threading.Lock()
+
     def get_all_rules(self, db: Session) -> List[KnowledgeRule]:
         """Получить все активные правила"""
         return db.query(KnowledgeRule).all()
 
+    def list_rules(self, db: Session, risk_type: Optional[str] = None, severity: Optional[str] = None,
+                   field: Optional[str] = None, offset: int = 0, limit: int = 50) -> Tuple[List[KnowledgeRule], int]:
+        """Страница правил с фильтрами (по индексированным столбцам) и общее число найденных"""
+        query = db.query(KnowledgeRule)
+        if risk_type:
+            query = query.filter(KnowledgeRule.risk_type == risk_type)
+        if severity:
+            query = query.filter(KnowledgeRule.severity == severity)
+        if field:
+            query = query.filter(KnowledgeRule.field == field)
+        total = query.count()
+        rules = query.order_by(KnowledgeRule.id).offset(offset).limit(limit).all()
+        return rules, total
+
+    @property
+    def version(self) -> int:
+        """Версия базы знаний: меняется при любом изменении правил (во всех процессах)"""
+        return rules_generation.value
+
+    def get_snapshot(self, db: Session) -> Tuple[CompiledRule, ...]:
+        """
+        Скомпилированный снимок правил. Перечитывается из БД только после изменения базы знаний,
+        в остальных запросах обращения к БД нет.
+        """
+        generation = rules_generation.value
+        if generation != self._snapshot_generation:
+            with self._snapshot_lock:
+                if generation != self._snapshot_generation:
+                    self._snapshot = self.compile_rules(self.get_all_rules(db))
+                    self._snapshot_generation = generation
+        return self._snapshot
+
+    def compile_rules(self, rules: List[KnowledgeRule]) -> Tuple[CompiledRule, ...]:
+        compiled = []
+        for rule in rules:
+            cond = rule.condition_json or {}
+            compiled.append(CompiledRule(
+                id=rule.id,
+                risk_type=rule.risk_type,
+                rule_name=rule.rule_name,
+                field=cond.get("field"),
+                op=cond.get("op"),
+                val=cond.get("val"),
+                severity=rule.severity,
+                recommendation=rule.recommendation
+            ))
+        return tuple(compiled)
+
+    def invalidate(self):
+        """Сообщить всем процессам, что правила изменились"""
+        bump(rules_generation)
+
     def add_rule(self, db: Session, rule_data: dict) -> KnowledgeRule:
         """Добавить новое правило"""
         # Преобразуем словарь в модель
@@ -15,12 +85,14 @@ class KnowledgeBaseService:
             risk_type=rule_data.get("risk_type"),
             rule_name=rule_data.get("rule_name"),
             condition_json=rule_data.get("condition_json"),
+            field=(rule_data.get("condition_json") or {}).get("field"),
             severity=rule_data.get("severity"),
             recommendation=rule_data.get("recommendation")
         )
         db.add(new_rule)
         db.commit()
         db.refresh(new_rule)
+        self.invalidate()
         return new_rule
     
     def update_rule(self, db: Session, rule_id: int, rule_data: dict):
@@ -30,10 +102,12 @@ class KnowledgeBaseService:
             rule.risk_type = rule_data.get("risk_type", rule.risk_type)
             rule.rule_name = rule_data.get("rule_name", rule.rule_name)
             rule.condition_json = rule_data.get("condition_json", rule.condition_json)
+            rule.field = (rule.condition_json or {}).get("field")
             rule.severity = rule_data.get("severity", rule.severity)
             rule.recommendation = rule_data.get("recommendation", rule.recommendation)
             db.commit()
             db.refresh(rule)
+            self.invalidate()
         return rule
 
     def delete_rule(self, db: Session, rule_id: int):
@@ -42,9 +116,10 @@ class KnowledgeBaseService:
         if rule:
             db.delete(rule)
             db.commit()
+            self.invalidate()
         return rule
     
-    def evaluate_rule_severity(self, rule: KnowledgeRule, current_val: float, threshold: float, op: str) -> dict:
+    def evaluate_rule_severity(self, rule: CompiledRule, current_val: float, threshold: float, op: str) -> dict:
         """
         Оценивает правила на основе величины отклонения от порога.
         Возвращает словарь с severity и explanation для конкретного срабатывания.
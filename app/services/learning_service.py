@@ -5,6 +5,7 @@ import joblib
 import numpy as np
 
 from app.services import kb_service
+from app.services.analysis_service import analysis_service
 
 logger = logging.getLogger(__name__)
 
@@ -20,11 +21,13 @@ class LearningService:
             import train_model
             train_model.train_credit_model()
             
-            from app.services import analysis_service
-            model_path = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), "credit_model.pkl")
-            if os.path.exists(model_path):
-                analysis_service.model = joblib.load(model_path)
-                logger.info("Модель успешно перезагружена в памяти.")
+            # Перезагружаем модель в рабочем экземпляре сервиса (кэш предсказаний сбрасывается)
+            analysis_service.reload_model()
+            logger.info("Модель успешно перезагружена в памяти.")
+
+            # В режиме pre-fork master пересоздаст воркеры с общей копией новой модели
+            from app.server import notify_master_reload
+            notify_master_reload()
             
             return {"status": "success", "message": "Модель переобучена."}
         except Exception as e:
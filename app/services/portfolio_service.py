@@ -0,0 +1,315 @@
+import csv
+import datetime
+import io
+import logging
+import multiprocessing
+import os
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import BinaryIO, Callable, Iterator, List, Optional
+
+from sqlalchemy.orm import Session
+
+from app.core.shared_state import model_generation
+from app.core.utils import FIELD_ALIASES, META_ALIASES, match_columns, normalize_column
+from app.models.database import SessionLocal
+from app.models.models import ApplicationData, PortfolioRun
+from app.services.analysis_service import analysis_service
+from app.services.kb_service import kb_service
+
+logger = logging.getLogger(__name__)
+
+PORTFOLIO_CHUNK_SIZE = int(os.getenv("PORTFOLIO_CHUNK_SIZE", "500"))
+PORTFOLIO_WORKERS = int(os.getenv("PORTFOLIO_WORKERS", str(os.cpu_count() or 1)))
+# Пачек в обработке на одного обработчика: больше не читаем файл, пока не сохранены старые
+PORTFOLIO_IN_FLIGHT_PER_WORKER = 2
+
+RESULT_COLUMNS = ["row", "company_name", "industry", "application_id", "rating", "risks_found", "top_risk", "error"]
+SEVERITY_PRIORITY = {"критический": 3, "средний": 2, "низкий": 1}
+
+
+class PortfolioFormatError(ValueError):
+    """Файл портфеля не удалось разобрать"""
+
+
+def _to_float(value) -> Optional[float]:
+    if value is None or value == "":
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    return float(str(value).replace(" ", "").replace(",", "."))
+
+
+class RowParser:
+    """Разбор строк портфеля по заголовку с теми же синонимами колонок, что и у parse_financial_document"""
+
+    def __init__(self, header: list):
+        columns = [normalize_column(c) for c in header]
+        self.index = {}
+        for i, col in enumerate(columns):
+            self.index.setdefault(col, i)
+        self.financial = match_columns(columns, FIELD_ALIASES)
+        if not self.financial:
+            raise PortfolioFormatError("В файле нет колонок с финансовыми показателями")
+        used = {c for cols in self.financial.values() for c in cols}
+        self.meta = match_columns([c for c in columns if c not in used], META_ALIASES)
+
+    def _cell(self, values: list, col: str):
+        i = self.index[col]
+        return values[i] if i < len(values) else None
+
+    def parse(self, values: list) -> ApplicationData:
+        financial_data = {}
+        for field, columns in self.financial.items():
+            for col in columns:
+                try:
+                    val = _to_float(self._cell(values, col))
+                except ValueError:
+                    continue
+                if val is not None:
+                    financial_data[field] = val
+                    break
+        if not financial_data:
+            raise ValueError("Нет финансовых показателей")
+
+        meta = {}
+        for field, columns in self.meta.items():
+            for col in columns:
+                val = self._cell(values, col)
+                if val not in (None, ""):
+                    meta[field] = str(val).strip()
+                    break
+
+        return ApplicationData(
+            company_name=meta.get("company_name", "Без названия"),
+            industry=meta.get("industry", ""),
+            business_description=meta.get("business_description", ""),
+            financial_data=financial_data
+        )
+
+
+def iter_file_rows(file: BinaryIO, filename: str) -> Iterator[list]:
+    """Построчное чтение CSV/XLSX без загрузки файла в память"""
+    name = filename.lower()
+    if name.endswith(".csv"):
+        text = io.TextIOWrapper(file, encoding="utf-8-sig", newline="")
+        first = text.readline()
+        # Excel с русской локалью сохраняет CSV через ";"
+        delimiter = max(",;\t", key=first.count)
+        yield from csv.reader([first], delimiter=delimiter)
+        yield from csv.reader(text, delimiter=delimiter)
+        text.detach()
+    elif name.endswith(".xlsx"):
+        try:
+            import openpyxl
+        except ImportError:
+            raise PortfolioFormatError("Для XLSX нужен пакет openpyxl (pip install openpyxl)")
+        workbook = openpyxl.load_workbook(file, read_only=True, data_only=True)
+        try:
+            for row in workbook.active.iter_rows(values_only=True):
+                yield list(row)
+        finally:
+            workbook.close()
+    else:
+        raise PortfolioFormatError("Поддерживаются только CSV и XLSX")
+
+
+def _init_worker():
+    # Файл лога ротирует веб-процесс; процесс пула в него не пишет
+    from app.core.deps import use_stderr_logging
+    use_stderr_logging()
+    # Процесс пула загружает модель один раз
+    analysis_service.ensure_model()
+
+
+def _score_chunk(applications: List[ApplicationData], rules, duplicates: List[list]) -> List[dict]:
+    return analysis_service.score_batch(applications, rules, duplicates)
+
+
+class PortfolioService:
+    """
+    Пакетная оценка портфеля: файл читается потоком, строки собираются в пачки по
+    chunk_size, пачки оцениваются в пуле процессов (все ядра), а сохраняются
+    в основном процессе — одна транзакция на пачку. Результат отдается потоком CSV.
+
+    Пул один на процесс: создается при первой оценке и общий для одновременных загрузок,
+    поэтому процессов пула не больше workers. После переобучения модели пул пересоздается.
+    """
+
+    def __init__(self, workers: int = PORTFOLIO_WORKERS, chunk_size: int = PORTFOLIO_CHUNK_SIZE):
+        self.workers = workers
+        self.chunk_size = chunk_size
+        self._pool = None
+        self._pool_generation = None
+        self._pool_lock = threading.Lock()
+
+    def start_run(self, db: Session, user_id: int, filename: str) -> PortfolioRun:
+        run = PortfolioRun(user_id=user_id, filename=filename, status="running")
+        db.add(run)
+        db.commit()
+        db.refresh(run)
+        return run
+
+    def get_run(self, db: Session, run_id: int) -> Optional[PortfolioRun]:
+        return db.query(PortfolioRun).filter(PortfolioRun.id == run_id).first()
+
+    def run_progress(self, run: PortfolioRun) -> dict:
+        return {
+            "run_id": run.id,
+            "filename": run.filename,
+            "status": run.status,
+            "rows_read": run.rows_read,
+            "rows_scored": run.rows_scored,
+            "rows_failed": run.rows_failed,
+            "error": run.error,
+            "created_at": run.created_at.isoformat() if run.created_at else None,
+            "finished_at": run.finished_at.isoformat() if run.finished_at else None,
+        }
+
+    def _executor(self) -> Optional[ProcessPoolExecutor]:
+        if self.workers <= 1:
+            return None
+        with self._pool_lock:
+            generation = model_generation.value
+            stale = self._pool is not None and (self._pool_generation != generation or self._pool._broken)
+            if stale:
+                # Начатые пачки старый пул доделает сам
+                self._pool.shutdown(wait=False)
+                self._pool = None
+            if self._pool is None:
+                # spawn: веб-процесс многопоточный, fork из него небезопасен
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"), initializer=_init_worker
+                )
+                self._pool_generation = generation
+            return self._pool
+
+    def shutdown(self):
+        with self._pool_lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=False, cancel_futures=True)
+                self._pool = None
+
+    def _chunks(self, rows: Iterator[list]) -> Iterator[list]:
+        """Пачки вида [(номер строки, заявка или None, ошибка или None)]"""
+        header = next(rows, None)
+        if header is None:
+            raise PortfolioFormatError("Файл пуст")
+        parser = RowParser(header)
+
+        chunk = []
+        for row_no, values in enumerate(rows, start=2):
+            if not any(v not in (None, "") for v in values):
+                continue
+            try:
+                chunk.append((row_no, parser.parse(values), None))
+            except ValueError as e:
+                chunk.append((row_no, None, str(e)))
+            if len(chunk) >= self.chunk_size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+    def process_file(self, file: BinaryIO, filename: str, run_id: int, user_id: int,
+                     progress: Optional[Callable[[PortfolioRun], None]] = None) -> Iterator[str]:
+        """То же, что process, но читает открытый файл и закрывает его по окончании"""
+        try:
+            yield from self.process(iter_file_rows(file, filename), run_id, user_id, progress)
+        finally:
+            file.close()
+
+    def process(self, rows: Iterator[list], run_id: int, user_id: int,
+                progress: Optional[Callable[[PortfolioRun], None]] = None) -> Iterator[str]:
+        """Генератор строк CSV с результатами. Можно отдавать прямо в StreamingResponse."""
+        db = SessionLocal()
+        run = self.get_run(db, run_id)
+        out = io.StringIO()
+        writer = csv.writer(out)
+
+        def flush() -> str:
+            data = out.getvalue()
+            out.seek(0)
+            out.truncate()
+            return data
+
+        writer.writerow(RESULT_COLUMNS)
+        yield flush()
+
+        executor = self._executor()
+        pending = deque()
+        max_in_flight = max(1, self.workers) * PORTFOLIO_IN_FLIGHT_PER_WORKER
+        try:
+            rules = kb_service.get_snapshot(db)
+            for chunk in self._chunks(rows):
+                applications = [a for _, a, _ in chunk if a is not None]
+                # Индекс дубликатов — в этом процессе; процессы пула получают готовые совпадения
+                duplicates = [analysis_service.find_duplicates(db, a, user_id) for a in applications]
+                future = (executor.submit(_score_chunk, applications, rules, duplicates)
+                          if executor and applications else None)
+                pending.append((chunk, applications, duplicates, future))
+                if len(pending) >= max_in_flight:
+                    self._complete(db, run, pending.popleft(), rules, user_id, writer)
+                    if progress:
+                        progress(run)
+                    yield flush()
+
+            while pending:
+                self._complete(db, run, pending.popleft(), rules, user_id, writer)
+                if progress:
+                    progress(run)
+                yield flush()
+            run.status = "done"
+        except Exception as e:
+            db.rollback()
+            logger.error(f"Ошибка пакетной оценки {run_id}: {e}")
+            run.status = "error"
+            run.error = str(e)
+            writer.writerow(["", "", "", "", "", "", "", str(e)])
+            yield flush()
+        finally:
+            # Пул общий: отменяются только пачки этой загрузки
+            for _, _, _, future in pending:
+                if future is not None:
+                    future.cancel()
+            if run.status == "running":
+                # Клиент разорвал соединение — обработанные пачки уже сохранены
+                run.status = "error"
+                run.error = "Обработка прервана"
+            run.finished_at = datetime.datetime.now()
+            db.commit()
+            logger.info(f"Пакетная оценка {run_id}: {run.status}, оценено {run.rows_scored}, ошибок {run.rows_failed}")
+            db.close()
+
+    def _complete(self, db: Session, run: PortfolioRun, item, rules, user_id: int, writer):
+        chunk, applications, duplicates, future = item
+        if future is not None:
+            scored = future.result()
+        else:
+            scored = analysis_service.score_batch(applications, rules, duplicates)
+
+        # Счетчики прогресса сохраняются в той же транзакции, что и заявки пачки
+        run.rows_read += len(chunk)
+        run.rows_scored += len(applications)
+        run.rows_failed += len(chunk) - len(applications)
+        if applications:
+            app_ids = analysis_service.persist_batch(db, applications, scored, user_id)
+        else:
+            db.commit()
+            app_ids = []
+
+        results = iter(zip(scored, app_ids))
+        for row_no, application, error in chunk:
+            if application is None:
+                writer.writerow([row_no, "", "", "", "", "", "", error])
+                continue
+            result, app_id = next(results)
+            top = max(result["risks"], key=lambda r: SEVERITY_PRIORITY.get(r["severity"], 0), default=None)
+            writer.writerow([
+                row_no, application.company_name, application.industry, app_id, result["rating"],
+                len(result["risks"]), top["source"] if top else "", ""
+            ])
+
+
+portfolio_service = PortfolioService()
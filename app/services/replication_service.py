@@ -0,0 +1,104 @@
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Optional
+
+from sqlalchemy.engine import make_url
+
+from app.models.database import SQLALCHEMY_DATABASE_URL, SQLALCHEMY_READ_DATABASE_URL
+
+logger = logging.getLogger(__name__)
+
+# Период обновления копии SQLite из процесса сервера (0 — только вручную, replicate_db.py)
+REPLICA_SYNC_SECONDS = int(os.getenv("REPLICA_SYNC_SECONDS", "0"))
+
+
+def sqlite_path(url: str) -> Optional[str]:
+    """Путь к файлу SQLite из URL (в т.ч. вида sqlite:///file:replica.db?mode=ro&uri=true); None — не SQLite"""
+    if not url:
+        return None
+    parsed = make_url(url)
+    if parsed.get_backend_name() != "sqlite" or not parsed.database or parsed.database == ":memory:":
+        return None
+    return parsed.database.removeprefix("file:")
+
+
+class ReplicationService:
+    """
+    Локальная "реплика" для SQLite: копия основной БД через backup API (согласованный снимок
+    без остановки записи), которая атомарно подменяет файл реплики. Читающие сессии открывают
+    файл заново (NullPool у read_engine), поэтому после подмены видят новую копию.
+
+    Для Postgres DATABASE_READ_URL указывает на настоящую реплику (потоковая репликация),
+    этот сервис там не нужен.
+    """
+
+    def __init__(self, source_url: str = SQLALCHEMY_DATABASE_URL, replica_url: str = SQLALCHEMY_READ_DATABASE_URL):
+        self.source = sqlite_path(source_url)
+        self.replica = sqlite_path(replica_url)
+        self.last_sync = None
+        self.last_duration = None
+        self._lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.source and self.replica and os.path.abspath(self.source) != os.path.abspath(self.replica))
+
+    def replicate(self) -> float:
+        """Одна синхронизация; возвращает длительность в секундах"""
+        if not self.enabled:
+            raise RuntimeError("Репликация доступна, только если DATABASE_URL и DATABASE_READ_URL — разные файлы SQLite")
+        with self._lock:
+            started = time.time()
+            tmp_path = f"{self.replica}.tmp-{os.getpid()}"
+            source = sqlite3.connect(self.source)
+            target = sqlite3.connect(tmp_path)
+            try:
+                # Копия целиком за один шаг: по частям копирование перезапускается при каждой записи в основную БД
+                source.backup(target)
+                # Реплика только читается: журнал WAL (если он у основной БД) ей не нужен
+                target.execute("PRAGMA journal_mode=DELETE")
+            finally:
+                target.close()
+                source.close()
+            os.replace(tmp_path, self.replica)
+            self.last_sync = time.time()
+            self.last_duration = self.last_sync - started
+            return self.last_duration
+
+    def start_periodic(self, interval: int = REPLICA_SYNC_SECONDS):
+        """Фоновый поток синхронизации. Первая копия делается сразу, чтобы реплика существовала до запросов."""
+        if interval <= 0 or not self.enabled or self._thread is not None:
+            return
+        self.replicate()
+        self._thread = threading.Thread(target=self.run, args=(interval,), name="sqlite-replication", daemon=True)
+        self._thread.start()
+        logger.info(f"Репликация SQLite: {self.source} -> {self.replica} каждые {interval} с")
+
+    def run(self, interval: int = REPLICA_SYNC_SECONDS):
+        """Цикл синхронизации в текущем потоке: фоновый поток или отдельный процесс pre-fork сервера"""
+        while True:
+            time.sleep(interval)
+            try:
+                self.replicate()
+            except Exception as e:
+                logger.error(f"Ошибка репликации SQLite: {e}")
+
+    def stats(self) -> dict:
+        last_sync = self.last_sync
+        if self.enabled and os.path.exists(self.replica):
+            # Копию может делать другой процесс (pre-fork): время последней подмены файла реплики
+            last_sync = max(last_sync or 0.0, os.path.getmtime(self.replica))
+        return {
+            "enabled": self.enabled,
+            "replica": self.replica,
+            "last_sync": round(last_sync) if last_sync else None,
+            "lag_sec": round(time.time() - last_sync, 1) if last_sync else None,
+            "last_duration_sec": round(self.last_duration, 3) if self.last_duration is not None else None,
+        }
+
+
+replication_service = ReplicationService()
@@ -0,0 +1,107 @@
+import math
+import re
+import zlib
+from collections import Counter
+from typing import List, Optional
+
+import numpy as np
+
+# 2^18 признаков: словарь не хранится и не растет, размер весов фиксирован (1 МБ во float32)
+TEXT_HASH_BITS = 18
+# Грубая нормализация словоформ: "задолженность", "задолженности" -> "задолж"
+TEXT_STEM_LENGTH = 6
+
+_TOKEN_RE = re.compile(r"[a-zа-яё0-9]+")
+
+
+def _words(text: str) -> List[str]:
+    return _TOKEN_RE.findall((text or "").lower().replace("ё", "е"))
+
+
+def tokenize(text: str) -> List[str]:
+    """Слова целиком (а не подстроки): "судно" не совпадает с "суд" """
+    return [word[:TEXT_STEM_LENGTH] for word in _words(text)]
+
+
+def vectorize(texts: List[str], bits: int = TEXT_HASH_BITS) -> tuple:
+    """
+    Разреженная матрица пачки текстов в формате CSR: (indptr, indices, data).
+    Признаки — униграммы и биграммы, частоты нормированы по L2 в пределах текста.
+    """
+    mask = (1 << bits) - 1
+    indptr, indices, values = [0], [], []
+    for text in texts:
+        tokens = tokenize(text)
+        counts = Counter(tokens)
+        counts.update(map(" ".join, zip(tokens, tokens[1:])))
+        if counts:
+            norm = math.sqrt(sum(c * c for c in counts.values()))
+            indices.extend(zlib.crc32(gram.encode("utf-8")) & mask for gram in counts)
+            values.extend(c / norm for c in counts.values())
+        indptr.append(len(indices))
+    return (
+        np.array(indptr, dtype=np.int64),
+        np.array(indices, dtype=np.int64),
+        np.array(values, dtype=np.float32),
+    )
+
+
+class HashingTextModel:
+    """
+    Логистическая регрессия по хешированным словам и парам слов описания бизнеса.
+
+    Хранятся только веса (float32) и смещение, поэтому загрузка не требует sklearn,
+    а массивы, как и у FlatForest, разделяются воркерами pre-fork сервера.
+    """
+
+    def __init__(self, weights: np.ndarray, bias: float, prior: float, bits: int = TEXT_HASH_BITS):
+        self.weights = weights  # вес каждого хешированного признака
+        self.bias = float(bias)
+        self.prior = float(prior)  # доля рискованных заявок в обучающей выборке
+        self.bits = int(bits)
+
+    @classmethod
+    def from_sklearn(cls, model, prior: float, bits: int = TEXT_HASH_BITS) -> "HashingTextModel":
+        return cls(np.asarray(model.coef_, dtype=np.float32).ravel(), float(model.intercept_[0]), prior, bits)
+
+    def save(self, path: str):
+        np.savez(path, weights=self.weights, bias=self.bias, prior=self.prior, bits=self.bits)
+
+    @classmethod
+    def load(cls, path: str) -> "HashingTextModel":
+        with np.load(path) as data:
+            return cls(data["weights"], float(data["bias"]), float(data["prior"]), int(data["bits"]))
+
+    def predict_proba(self, texts: List[str]) -> np.ndarray:
+        """Вероятность "рискованного" описания для пачки текстов"""
+        indptr, indices, values = vectorize(texts, self.bits)
+        rows = np.repeat(np.arange(len(texts)), np.diff(indptr))
+        scores = np.bincount(rows, weights=self.weights[indices] * values, minlength=len(texts)) + self.bias
+        return 1.0 / (1.0 + np.exp(-scores))
+
+    def risk_scores(self, texts: List[str]) -> np.ndarray:
+        """
+        Риск текста в шкале эвристики (0..1): насколько вероятность выше средней по выборке.
+        Нейтральное описание дает 0, а не базовую долю дефолтов.
+        """
+        probabilities = self.predict_proba(texts)
+        return np.clip((probabilities - self.prior) / max(1.0 - self.prior, 1e-6), 0.0, 1.0)
+
+    def risk_markers(self, text: str, top: int = 3) -> List[str]:
+        """Слова описания с наибольшим вкладом в риск (для пояснения)"""
+        words = list(dict.fromkeys(_words(text)))
+        mask = (1 << self.bits) - 1
+        indices = np.fromiter(
+            (zlib.crc32(word[:TEXT_STEM_LENGTH].encode("utf-8")) & mask for word in words), dtype=np.int64, count=len(words)
+        )
+        weights = self.weights[indices]
+        order = np.argsort(-weights)[:top]
+        return [words[i] for i in order if weights[i] > 0]
+
+
+def read_text_model(path: str) -> Optional[HashingTextModel]:
+    """Текстовая модель необязательна: без файла используется эвристика по ключевым словам"""
+    try:
+        return HashingTextModel.load(path)
+    except FileNotFoundError:
+        return None
@@ -0,0 +1,47 @@
+"""
+Архивация старых заявок: заявки старше N дней с рисками переносятся из рабочей БД
+в сжатые файлы по месяцам (archive/applications-ГГГГ-ММ.ndjson.gz), затем VACUUM и ANALYZE.
+
+Архивные заявки остаются в истории пользователя, на странице деталей и в выгрузке.
+
+    python archive_data.py --older-than-days 365
+    python archive_data.py --older-than-days 180 --dry-run
+"""
+import argparse
+import os
+import sys
+
+sys.path.append(os.path.dirname(__file__))
+from app.models.database import SessionLocal
+from app.services.archive_service import ARCHIVE_AFTER_DAYS, archive_service
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Архивация старых заявок")
+    parser.add_argument("--older-than-days", type=int, default=ARCHIVE_AFTER_DAYS,
+                        help=f"Возраст заявки в днях (по умолчанию {ARCHIVE_AFTER_DAYS})")
+    parser.add_argument("--dir", help="Каталог архива (по умолчанию ARCHIVE_DIR)")
+    parser.add_argument("--no-vacuum", action="store_true", help="Не выполнять VACUUM/ANALYZE после переноса")
+    parser.add_argument("--dry-run", action="store_true", help="Только посчитать заявки для архивации")
+    args = parser.parse_args()
+
+    if args.dir:
+        archive_service.archive_dir = args.dir
+
+    db = SessionLocal()
+    try:
+        result = archive_service.archive(
+            db, args.older_than_days, vacuum=not args.no_vacuum, dry_run=args.dry_run,
+            progress=lambda n: print(f"\rПеренесено в архив: {n}", end="", flush=True)
+        )
+    finally:
+        db.close()
+
+    if args.dry_run:
+        print(f"Будет перенесено заявок (поданных до {result['cutoff']}): {result['archived']}")
+    else:
+        print(f"\nГотово: {result['archived']} заявок за {result['elapsed_sec']} с, файлы: {', '.join(result['partitions']) or '—'}")
+
+
+if __name__ == "__main__":
+    main()
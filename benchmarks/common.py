@@ -0,0 +1,88 @@
+import json
+import os
+import platform
+import subprocess
+import time
+from datetime import datetime
+
+import numpy as np
+
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), "results")
+
+
+def measure(fn, iterations: int = 200, warmup: int = 10, min_time: float = 0.0) -> dict:
+    """
+    Запускает fn() несколько раз и возвращает пропускную способность и перцентили задержки (мс).
+    min_time — минимальное общее время замера в секундах (итераций может стать больше).
+    """
+    for _ in range(warmup):
+        fn()
+
+    timings = []
+    started = time.perf_counter()
+    while len(timings) < iterations or (time.perf_counter() - started) < min_time:
+        t0 = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - t0)
+    total = time.perf_counter() - started
+
+    ms = np.array(timings) * 1000
+    return {
+        "iterations": len(timings),
+        "throughput_per_s": round(len(timings) / total, 2),
+        "mean_ms": round(float(ms.mean()), 4),
+        "p50_ms": round(float(np.percentile(ms, 50)), 4),
+        "p95_ms": round(float(np.percentile(ms, 95)), 4),
+        "p99_ms": round(float(np.percentile(ms, 99)), 4),
+    }
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], stderr=subprocess.DEVNULL, text=True
+        ).strip()
+    except Exception:
+        return "unknown"
+
+
+def save_results(results: dict, path: str = None) -> str:
+    """Сохраняет результаты в JSON (по умолчанию benchmarks/results/<время>_<коммит>.json)"""
+    commit = git_commit()
+    payload = {
+        "meta": {
+            "commit": commit,
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+        },
+        "results": results,
+    }
+    if path is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        stamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        path = os.path.join(RESULTS_DIR, f"{stamp}_{commit}.json")
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(payload, f, ensure_ascii=False, indent=2)
+    return path
+
+
+def compare_results(current: dict, baseline_path: str, threshold: float = 0.2, metric: str = "p50_ms") -> list:
+    """
+    Сравнивает текущие результаты с сохраненными.
+    Возвращает список регрессий: бенчмарки, где metric вырос больше чем на threshold (0.2 = 20%).
+    """
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = json.load(f)["results"]
+
+    regressions = []
+    for name, stats in current.items():
+        old = baseline.get(name)
+        if not old or not old.get(metric):
+            continue
+        change = (stats[metric] - old[metric]) / old[metric]
+        print(f"  {name:<32} {old[metric]:>10.3f} -> {stats[metric]:>10.3f} мс ({change:+.1%})")
+        if change > threshold:
+            regressions.append({"name": name, "baseline": old[metric], "current": stats[metric], "change": change})
+    return regressions
@@ -0,0 +1,89 @@
+"""Генерация входных данных для бенчмарков: заявки, CSV и PDF отчеты разного размера."""
+import io
+import random
+
+from app.models.models import ApplicationData
+
+DESCRIPTIONS = [
+    "",
+    "Стабильный рост выручки, новый контракт с крупным заказчиком.",
+    "Компания ведет судебный спор с поставщиком, есть просрочка по кредиту и штраф от налоговой.",
+    "Производство упаковки. Расширение линейки продукции, инвестиции в оборудование, "
+    "но наблюдается дефицит оборотных средств и рост задолженности перед поставщиками. " * 5,
+]
+
+
+def make_application(rng: random.Random) -> ApplicationData:
+    return ApplicationData(
+        company_name=f"ООО Бенчмарк {rng.randint(1, 10**6)}",
+        industry=rng.choice(["торговля", "строительство", "производство", "IT"]),
+        financial_data={
+            "current_ratio": round(rng.uniform(0.3, 3.0), 2),
+            "debt_to_equity": round(rng.uniform(0.1, 5.0), 2),
+            "net_profit_margin": round(rng.uniform(-0.2, 0.3), 3),
+            "company_age": rng.randint(0, 30),
+        },
+        business_description=rng.choice(DESCRIPTIONS),
+    )
+
+
+def make_csv(rows: int, seed: int = 42) -> bytes:
+    """CSV отчет с rows строками (парсер берет последнюю строку)"""
+    rng = random.Random(seed)
+    out = io.StringIO()
+    out.write("Current Ratio,Debt-to-Equity,Net Profit Margin,Company Age,Revenue\n")
+    for _ in range(rows):
+        out.write(
+            f"{rng.uniform(0.3, 3.0):.3f},{rng.uniform(0.1, 5.0):.3f},"
+            f"{rng.uniform(-0.2, 0.3):.4f},{rng.randint(0, 30)},{rng.randint(10**5, 10**8)}\n"
+        )
+    return out.getvalue().encode("utf-8")
+
+
+def make_pdf(pages: int, lines_per_page: int = 40) -> bytes:
+    """
+    Минимальный PDF без внешних библиотек: текст на латинице (стандартный шрифт Helvetica),
+    показатели в формате, который ищут регулярные выражения парсера.
+    """
+    objects = []
+
+    def add(body: bytes) -> int:
+        objects.append(body)
+        return len(objects)
+
+    catalog_id = add(b"")
+    pages_id = add(b"")
+    font_id = add(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+
+    page_ids = []
+    for p in range(pages):
+        lines = [f"Financial report, page {p + 1}"]
+        lines += [f"Revenue line {i}: {1000 + i * 17} thousand" for i in range(lines_per_page - 5)]
+        if p == pages - 1:
+            lines += ["Current ratio: 1.45", "Debt to equity: 2.10", "Net profit margin: 0.07", "Founded: 2015"]
+        text = " ".join(
+            f"({line}) Tj 0 -14 Td" for line in lines
+        )
+        stream = f"BT /F1 10 Tf 40 800 Td {text} ET".encode("latin-1")
+        content_id = add(b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream")
+        page_ids.append(add(
+            b"<< /Type /Page /Parent %d 0 R /MediaBox [0 0 595 842] "
+            b"/Resources << /Font << /F1 %d 0 R >> >> /Contents %d 0 R >>" % (pages_id, font_id, content_id)
+        ))
+
+    objects[catalog_id - 1] = b"<< /Type /Catalog /Pages %d 0 R >>" % pages_id
+    kids = b" ".join(b"%d 0 R" % pid for pid in page_ids)
+    objects[pages_id - 1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (kids, len(page_ids))
+
+    out = io.BytesIO()
+    out.write(b"%PDF-1.4\n")
+    offsets = []
+    for i, body in enumerate(objects, start=1):
+        offsets.append(out.tell())
+        out.write(b"%d 0 obj\n" % i + body + b"\nendobj\n")
+    xref_pos = out.tell()
+    out.write(b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1))
+    for off in offsets:
+        out.write(b"%010d 00000 n \n" % off)
+    out.write(b"trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, catalog_id, xref_pos))
+    return out.getvalue()
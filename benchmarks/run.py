@@ -0,0 +1,75 @@
+"""
+Запуск бенчмарков пути скоринга.
+
+    python -m benchmarks.run                        # все наборы
+    python -m benchmarks.run --suite scoring text   # выбранные наборы
+    python -m benchmarks.run --save --compare benchmarks/results/<файл>.json --threshold 0.2
+
+Бенчмарки работают на временной SQLite базе и не трогают credit_system.db.
+При --compare код возврата 1, если p50 какого-либо бенчмарка вырос больше чем на threshold.
+"""
+import argparse
+import os
+import sys
+import tempfile
+
+# Окружение нужно настроить до импорта приложения (движок БД создается при импорте)
+_workdir = tempfile.mkdtemp(prefix="credit_bench_")
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(_workdir, 'bench.db')}")
+os.environ.setdefault("LOG_PATH", os.path.join(_workdir, "bench.log"))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.common import compare_results, measure, save_results
+from benchmarks.suites import SUITES
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарки скоринга")
+    parser.add_argument("--suite", nargs="*", choices=sorted(SUITES), help="Наборы для запуска (по умолчанию все)")
+    parser.add_argument("--scale", type=float, default=1.0, help="Множитель числа итераций")
+    parser.add_argument("--save", action="store_true", help="Сохранить результаты в benchmarks/results/")
+    parser.add_argument("--output", help="Путь для сохранения JSON (вместо benchmarks/results/)")
+    parser.add_argument("--compare", help="JSON с результатами для сравнения")
+    parser.add_argument("--threshold", type=float, default=0.2, help="Допустимый рост p50 (0.2 = 20%%)")
+    args = parser.parse_args()
+
+    from fastapi.testclient import TestClient
+    from app.main import app
+
+    results = {}
+    with TestClient(app) as client:
+        # lifespan создал таблицы, админа и стандартные правила
+        r = client.post("/login", data={"username": "admin", "password": "admin"}, follow_redirects=False)
+        client.cookies.set("user_id", r.cookies.get("user_id"))
+        ctx = {"client": client, "user_id": int(r.cookies.get("user_id")), "cleanup": []}
+
+        try:
+            for suite_name in args.suite or list(SUITES):
+                print(f"== {suite_name}")
+                for name, (fn, iterations) in SUITES[suite_name](ctx).items():
+                    stats = measure(fn, iterations=max(1, int(iterations * args.scale)), warmup=min(10, iterations // 2))
+                    results[name] = stats
+                    print(
+                        f"  {name:<32} {stats['throughput_per_s']:>10.1f} оп/с   "
+                        f"p50 {stats['p50_ms']:>9.3f}  p95 {stats['p95_ms']:>9.3f}  p99 {stats['p99_ms']:>9.3f} мс"
+                    )
+        finally:
+            for cleanup in ctx["cleanup"]:
+                cleanup()
+
+    if args.save or args.output:
+        print(f"Результаты сохранены: {save_results(results, args.output)}")
+
+    if args.compare:
+        print(f"Сравнение с {args.compare}:")
+        regressions = compare_results(results, args.compare, threshold=args.threshold)
+        if regressions:
+            print("РЕГРЕССИЯ:")
+            for reg in regressions:
+                print(f"  {reg['name']}: {reg['baseline']:.3f} -> {reg['current']:.3f} мс ({reg['change']:+.1%})")
+            sys.exit(1)
+        print("Регрессий нет.")
+
+
+if __name__ == "__main__":
+    main()
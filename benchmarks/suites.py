@@ -0,0 +1,133 @@
+"""Наборы бенчмарков. Каждый набор возвращает словарь {имя: (функция, число итераций)}."""
+import asyncio
+import io
+import os
+import random
+import subprocess
+import sys
+
+from starlette.datastructures import Headers, UploadFile
+
+from benchmarks.fixtures import DESCRIPTIONS, make_application, make_csv, make_pdf
+
+
+def scoring_suite(ctx) -> dict:
+    """AnalysisService.analyze_application на заявках со случайными показателями"""
+    from app.api.views import analysis_service
+    from app.models.database import SessionLocal
+
+    rng = random.Random(1)
+    apps = [make_application(rng) for _ in range(500)]
+    db = SessionLocal()
+    ctx["cleanup"].append(db.close)
+    state = {"i": 0}
+
+    def analyze():
+        state["i"] += 1
+        analysis_service.analyze_application(apps[state["i"] % len(apps)], user_id=ctx["user_id"], db=db)
+
+    defaults = {"current_ratio": 1.0, "debt_to_equity": 1.0, "net_profit_margin": 0.0, "company_age": 0}
+
+    return {
+        "analyze_application": (analyze, 300),
+        "predict_repeated_features": (lambda: analysis_service.predict_probability(defaults), 2000),
+    }
+
+
+def text_suite(ctx) -> dict:
+    """Эвристика analyze_text_sentiment и AnalysisService.analyze_texts (модель текста, если обучена)"""
+    from app.services.analysis_service import analysis_service
+    from app.services.data_service import data_service
+
+    short_text, long_text = DESCRIPTIONS[2], DESCRIPTIONS[3] * 20
+    batch = [DESCRIPTIONS[i % len(DESCRIPTIONS)] for i in range(1000)]
+    return {
+        "text_sentiment_short": (lambda: data_service.analyze_text_sentiment(short_text), 5000),
+        "text_sentiment_long": (lambda: data_service.analyze_text_sentiment(long_text), 2000),
+        "text_model_single": (lambda: analysis_service.analyze_texts([short_text]), 5000),
+        "text_model_batch_1000": (lambda: analysis_service.analyze_texts(batch), 20),
+    }
+
+
+def parsing_suite(ctx) -> dict:
+    """parse_financial_document на сгенерированных CSV и PDF разного размера"""
+    from app.services.data_service import data_service
+
+    loop = asyncio.new_event_loop()
+    ctx["cleanup"].append(loop.close)
+
+    def make_parser(filename: str, payload: bytes):
+        def parse():
+            upload = UploadFile(file=io.BytesIO(payload), filename=filename, headers=Headers())
+            loop.run_until_complete(data_service.parse_financial_document(upload))
+        return parse
+
+    suite = {}
+    for rows, iterations in [(10, 300), (1_000, 200), (100_000, 10)]:
+        suite[f"parse_csv_{rows}_rows"] = (make_parser("report.csv", make_csv(rows)), iterations)
+    for pages, iterations in [(1, 50), (10, 10)]:
+        suite[f"parse_pdf_{pages}_pages"] = (make_parser("report.pdf", make_pdf(pages)), iterations)
+    return suite
+
+
+def submit_suite(ctx) -> dict:
+    """Полный маршрут /submit через TestClient (форма и загрузка CSV)"""
+    client = ctx["client"]
+    rng = random.Random(2)
+    csv_payload = make_csv(50)
+
+    def form_data():
+        app = make_application(rng)
+        return {
+            "company_name": app.company_name,
+            "industry": app.industry,
+            "description": app.business_description,
+            **{k: str(v) for k, v in app.financial_data.items()},
+        }
+
+    def submit_form():
+        r = client.post("/submit", data=form_data())
+        assert r.status_code == 200, r.status_code
+
+    def submit_csv():
+        r = client.post("/submit", data=form_data(), files={"document": ("report.csv", csv_payload, "text/csv")})
+        assert r.status_code == 200, r.status_code
+
+    return {
+        "submit_form": (submit_form, 200),
+        "submit_csv_upload": (submit_csv, 100),
+    }
+
+
+READY_SCRIPT = """
+import time
+from fastapi.testclient import TestClient
+from app.main import app
+with TestClient(app) as client:
+    while client.get("/readyz").status_code != 200:
+        time.sleep(0.01)
+"""
+
+
+def startup_suite(ctx) -> dict:
+    """Холодный старт в отдельном процессе: импорт приложения и время до готовности (/readyz)"""
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = dict(os.environ, PYTHONPATH=root)
+
+    def run(code: str):
+        subprocess.run([sys.executable, "-c", code], env=env, cwd=root, check=True,
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    return {
+        "startup_import_app": (lambda: run("import app.main"), 5),
+        "startup_until_ready": (lambda: run(READY_SCRIPT), 5),
+    }
+
+
+SUITES = {
+    "scoring": scoring_suite,
+    "text": text_suite,
+    "parsing": parsing_suite,
+    "submit": submit_suite,
+    "startup": startup_suite,
+}
@@ -0,0 +1,42 @@
+"""
+Выгрузка истории заявок с найденными рисками в CSV/NDJSON (опционально gzip).
+
+Данные читаются пачками, поэтому выгрузка миллионов заявок не загружает их в память.
+
+    python export_data.py --format ndjson --gzip --output applications.ndjson.gz --from 2024-01-01 --industry IT
+"""
+import argparse
+import datetime
+import os
+import sys
+
+sys.path.append(os.path.dirname(__file__))
+from app.services.export_service import EXPORT_FORMATS, ExportFilters, export_service
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Выгрузка заявок и рисков")
+    parser.add_argument("--format", choices=EXPORT_FORMATS, default="csv")
+    parser.add_argument("--gzip", action="store_true", help="Сжать выгрузку gzip")
+    parser.add_argument("--output", help="Файл (по умолчанию applications.<format>[.gz])")
+    parser.add_argument("--from", dest="date_from", type=datetime.date.fromisoformat, help="С даты (ГГГГ-ММ-ДД)")
+    parser.add_argument("--to", dest="date_to", type=datetime.date.fromisoformat, help="По дату включительно")
+    parser.add_argument("--user-id", type=int)
+    parser.add_argument("--industry")
+    parser.add_argument("--no-archive", action="store_true", help="Без заявок из архива (archive_data.py)")
+    args = parser.parse_args()
+
+    output = args.output or f"applications.{args.format}" + (".gz" if args.gzip else "")
+    filters = ExportFilters(date_from=args.date_from, date_to=args.date_to, user_id=args.user_id, industry=args.industry)
+
+    written = 0
+    with open(output, "wb") as f:
+        for chunk in export_service.stream(args.format, filters, compress=args.gzip, include_archive=not args.no_archive):
+            f.write(chunk)
+            written += len(chunk)
+            print(f"\rЗаписано: {written / 1024 / 1024:.1f} МБ", end="", flush=True)
+    print(f"\nГотово: {output}")
+
+
+if __name__ == "__main__":
+    main()
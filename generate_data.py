@@ -0,0 +1,248 @@
+"""
+Генератор синтетических данных для нагрузочного тестирования и профилирования.
+
+Заполняет схему из app/models/models.py: пользователи, заявки (финансовые показатели
+берутся из распределений final_dataset.csv), найденные риски и правила базы знаний.
+Вставка идет пачками (executemany), поэтому база на миллионы заявок строится за минуты.
+
+    python generate_data.py --db sqlite:///./load_test.db --users 10000 --applications 2000000 --rules 5000
+"""
+import argparse
+import datetime
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import create_engine, event, func, select
+
+sys.path.append(os.path.dirname(__file__))
+from app.core.utils import FINANCIAL_LABELS
+from app.models.database import Base
+from app.models.migrations import run_migrations
+from app.models.models import ArchivedApplication, CreditApplication, FoundRisk, KnowledgeRule, User
+
+DATASET_PATH = os.path.join(os.path.dirname(__file__), "final_dataset.csv")
+FEATURES = ["current_ratio", "debt_to_equity", "net_profit_margin", "company_age"]
+
+INDUSTRIES = ["торговля", "строительство", "производство", "IT"]
+INDUSTRY_WEIGHTS = [0.4, 0.2, 0.25, 0.15]
+
+POSITIVE_PHRASES = [
+    "Стабильный рост выручки.", "Подписан новый контракт.", "Расширение производства.",
+    "Инвестиции в оборудование.", "Компания - лидер региона.", "Запущен новый проект.",
+]
+NEGATIVE_PHRASES = [
+    "Идет судебный спор с поставщиком.", "Есть просрочка по кредиту.", "Получен штраф от налоговой.",
+    "Дефицит оборотных средств.", "Растет задолженность перед контрагентами.", "Прошла выездная проверка.",
+]
+NEUTRAL_PHRASES = [
+    "Оптовая торговля стройматериалами.", "Разработка программного обеспечения.",
+    "Производство упаковки.", "Грузоперевозки по области.", "Сеть кофеен.", "Ремонт оборудования.",
+]
+
+# Те же пороги, что и в стандартных правилах (app/main.py)
+DEFAULT_CONDITIONS = [
+    ("current_ratio", "<", 1.5, "финансовый", "критический", "Требуется обеспечение залогом."),
+    ("debt_to_equity", ">", 2.0, "финансовый", "средний", "Ограничить сумму кредита."),
+    ("net_profit_margin", "<", 0.0, "финансовый", "критический", "Отказ в кредитовании."),
+    ("company_age", "<", 1, "операционный", "средний", "Запросить поручительство."),
+]
+
+
+def load_reference(rng: np.random.Generator) -> np.ndarray:
+    """Реальные показатели из final_dataset.csv (или грубое приближение, если файла нет)"""
+    if os.path.exists(DATASET_PATH):
+        df = pd.read_csv(DATASET_PATH).dropna(subset=FEATURES[:3])
+        return df[FEATURES[:3]].to_numpy(dtype=float)
+    print(f"Файл {DATASET_PATH} не найден, используем синтетические распределения.")
+    return np.column_stack([
+        rng.lognormal(0.3, 0.5, 1000),
+        rng.lognormal(0.5, 0.7, 1000),
+        rng.normal(0.05, 0.08, 1000),
+    ])
+
+
+def sample_financials(rng: np.random.Generator, reference: np.ndarray, n: int) -> np.ndarray:
+    """Бутстрэп строк датасета с мультипликативным шумом + возраст компании"""
+    rows = reference[rng.integers(0, len(reference), n)]
+    noise = rng.lognormal(0.0, 0.15, size=(n, 2))
+    current_ratio = np.round(rows[:, 0] * noise[:, 0], 3)
+    debt_to_equity = np.round(rows[:, 1] * noise[:, 1], 3)
+    net_profit_margin = np.round(rows[:, 2] + rng.normal(0, 0.02, n), 4)
+    company_age = np.minimum(np.round(rng.gamma(2.0, 4.0, n)), 60)
+    return np.column_stack([current_ratio, debt_to_equity, net_profit_margin, company_age])
+
+
+def description_pool(rng: np.random.Generator, size: int = 2048) -> list:
+    """Заранее собранные описания: выбор из пула дешевле сборки текста на каждую заявку"""
+    pool = []
+    for _ in range(size):
+        parts = [NEUTRAL_PHRASES[rng.integers(len(NEUTRAL_PHRASES))]]
+        parts += list(rng.choice(POSITIVE_PHRASES, rng.integers(0, 3), replace=False))
+        parts += list(rng.choice(NEGATIVE_PHRASES, rng.poisson(0.6) % 4, replace=False))
+        pool.append(" ".join(parts))
+    return pool
+
+
+def ratings_for(X: np.ndarray, rng: np.random.Generator) -> np.ndarray:
+    """Правдоподобный рейтинг: штрафы по стандартным правилам + шум"""
+    rating = np.full(len(X), 90.0)
+    rating -= 40 * (X[:, 0] < 1.5)
+    rating -= 20 * (X[:, 1] > 2.0)
+    rating -= 30 * (X[:, 2] < 0.0)
+    rating -= 10 * (X[:, 3] < 1)
+    rating += rng.normal(0, 8, len(X))
+    return np.clip(rating, 0, 100).astype(int)
+
+
+def generate_users(conn, rng, count: int, start_id: int) -> np.ndarray:
+    from passlib.context import CryptContext
+
+    # Один хэш на всех: bcrypt на каждого пользователя занял бы часы. Пароль: "password"
+    hashed = CryptContext(schemes=["bcrypt"], deprecated="auto").hash("password")
+    roles = rng.choice(["user", "operator"], count, p=[0.95, 0.05])
+    rows = [
+        {"id": start_id + i, "username": f"user_{start_id + i:07d}", "hashed_password": hashed, "role": str(roles[i])}
+        for i in range(count)
+    ]
+    conn.execute(User.__table__.insert(), rows)
+    return np.arange(start_id, start_id + count)
+
+
+def generate_rules(conn, rng, reference: np.ndarray, count: int):
+    rows = []
+    quantiles = {f: np.quantile(reference[:, i], [0.05, 0.95]) for i, f in enumerate(FEATURES[:3])}
+    quantiles["company_age"] = np.array([0, 10])
+    for i in range(count):
+        field = FEATURES[rng.integers(len(FEATURES))]
+        low, high = quantiles[field]
+        op = "<" if rng.random() < 0.6 else ">"
+        val = round(float(rng.uniform(low, high)), 3)
+        rows.append({
+            "risk_type": str(rng.choice(["финансовый", "операционный", "отраслевой"])),
+            "rule_name": f"Синтетическое правило {i + 1}",
+            "condition_json": {"field": field, "op": op, "val": val},
+            "field": field,
+            "severity": str(rng.choice(["критический", "средний", "низкий"])),
+            "recommendation": "Проверить показатель вручную.",
+        })
+    conn.execute(KnowledgeRule.__table__.insert(), rows)
+
+
+def generate_applications(conn, rng, reference, user_ids, count: int, start_id: int, chunk: int):
+    now = datetime.datetime.now()
+    two_years = 2 * 365 * 24 * 3600
+    app_table, risk_table = CreditApplication.__table__, FoundRisk.__table__
+    descriptions = description_pool(rng)
+    done, risks_total = 0, 0
+    started = time.time()
+
+    while done < count:
+        n = min(chunk, count - done)
+        X = sample_financials(rng, reference, n)
+        ratings = ratings_for(X, rng)
+        users = rng.choice(user_ids, n)
+        industries = rng.choice(INDUSTRIES, n, p=INDUSTRY_WEIGHTS)
+        offsets = rng.integers(0, two_years, n)
+        description_ids = rng.integers(0, len(descriptions), n)
+
+        app_rows, risk_rows = [], []
+        for i in range(n):
+            app_id = start_id + done + i
+            fin = dict(zip(FEATURES, (float(X[i, 0]), float(X[i, 1]), float(X[i, 2]), int(X[i, 3]))))
+            app_rows.append({
+                "id": app_id,
+                "company_name": f"ООО Компания {app_id}",
+                "industry": str(industries[i]),
+                **fin,
+                "financial_data": {},
+                "business_description": descriptions[description_ids[i]],
+                "user_id": int(users[i]),
+                "rating": int(ratings[i]),
+                "status": "Обработан",
+                "created_at": now - datetime.timedelta(seconds=int(offsets[i])),
+            })
+            for field, op, threshold, risk_type, severity, recommendation in DEFAULT_CONDITIONS:
+                value = fin[field]
+                if (op == "<" and value < threshold) or (op == ">" and value > threshold):
+                    risk_rows.append({
+                        "application_id": app_id,
+                        "risk_type": risk_type,
+                        "source": f"{FINANCIAL_LABELS[field]} = {value} ({threshold} {op} нормы)",
+                        "severity": severity,
+                        "recommendation": recommendation,
+                    })
+            if ratings[i] < 50:
+                risk_rows.append({
+                    "application_id": app_id,
+                    "risk_type": "прогнозный",
+                    "source": "Нейросетевая модель",
+                    "severity": "критический" if ratings[i] < 30 else "средний",
+                    "recommendation": "Высокая вероятность дефолта по статистической модели.",
+                })
+
+        conn.execute(app_table.insert(), app_rows)
+        if risk_rows:
+            conn.execute(risk_table.insert(), risk_rows)
+        conn.commit()
+
+        done += n
+        risks_total += len(risk_rows)
+        rate = done / max(time.time() - started, 1e-9)
+        print(f"  заявок: {done}/{count} (рисков: {risks_total}), {rate:,.0f} заявок/с", flush=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Генерация синтетических данных")
+    # Не DATABASE_URL: генератор пишет без журнала и не должен попасть в рабочую БД по умолчанию
+    parser.add_argument("--db", default="sqlite:///./benchmark.db", help="URL базы данных (по умолчанию benchmark.db)")
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--applications", type=int, default=100_000)
+    parser.add_argument("--rules", type=int, default=1000)
+    parser.add_argument("--chunk", type=int, default=20_000, help="Размер пачки вставки")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    engine = create_engine(args.db)
+    if engine.dialect.name == "sqlite":
+        # Для одноразовой загрузки надежность журнала не нужна
+        @event.listens_for(engine, "connect")
+        def _sqlite_bulk_pragmas(dbapi_conn, _):
+            cursor = dbapi_conn.cursor()
+            cursor.execute("PRAGMA journal_mode=MEMORY")
+            cursor.execute("PRAGMA synchronous=OFF")
+            cursor.execute("PRAGMA cache_size=-200000")
+            cursor.close()
+
+    Base.metadata.create_all(bind=engine)
+    run_migrations(engine)
+    rng = np.random.default_rng(args.seed)
+    reference = load_reference(rng)
+    started = time.time()
+
+    with engine.connect() as conn:
+        next_user_id = (conn.execute(select(func.max(User.id))).scalar() or 0) + 1
+        # Id архивных заявок тоже заняты: новые заявки с ними не должны совпадать
+        next_app_id = max(
+            conn.execute(select(func.max(CreditApplication.id))).scalar() or 0,
+            conn.execute(select(func.max(ArchivedApplication.id))).scalar() or 0,
+        ) + 1
+
+        print(f"Пользователи: {args.users}")
+        user_ids = generate_users(conn, rng, args.users, next_user_id)
+        conn.commit()
+
+        print(f"Правила: {args.rules}")
+        generate_rules(conn, rng, reference, args.rules)
+        conn.commit()
+
+        print(f"Заявки: {args.applications}")
+        generate_applications(conn, rng, reference, user_ids, args.applications, next_app_id, args.chunk)
+
+    print(f"Готово за {time.time() - started:.1f} с")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,36 @@
+"""
+Обновление копии SQLite для чтения (DATABASE_READ_URL) из основной БД (DATABASE_URL).
+
+    DATABASE_READ_URL=sqlite:///./credit_system_read.db python replicate_db.py
+    DATABASE_READ_URL=sqlite:///./credit_system_read.db python replicate_db.py --interval 30
+
+Для Postgres используется штатная потоковая репликация, скрипт не нужен.
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.append(os.path.dirname(__file__))
+from app.services.replication_service import replication_service
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Копия SQLite для чтения")
+    parser.add_argument("--interval", type=int, default=0, help="Повторять каждые N секунд (0 — один раз)")
+    args = parser.parse_args()
+
+    if not replication_service.enabled:
+        print("Ошибка: DATABASE_URL и DATABASE_READ_URL должны указывать на разные файлы SQLite")
+        sys.exit(1)
+
+    while True:
+        duration = replication_service.replicate()
+        print(f"{time.strftime('%H:%M:%S')} Копия {replication_service.replica} обновлена за {duration:.2f} с")
+        if args.interval <= 0:
+            break
+        time.sleep(args.interval)
+
+
+if __name__ == "__main__":
+    main()
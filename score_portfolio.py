@@ -0,0 +1,66 @@
+"""
+Пакетная оценка портфеля заявок из CSV/XLSX без веб-интерфейса.
+
+Использует ту же логику, что и /portfolio/upload: файл читается потоком, пачки строк
+оцениваются в пуле процессов и сохраняются в БД приложения (DATABASE_URL).
+
+    python score_portfolio.py portfolio.csv --output results.csv --user admin --workers 4
+"""
+import argparse
+import os
+import sys
+
+sys.path.append(os.path.dirname(__file__))
+from app.models.database import Base, SessionLocal, engine
+from app.models.migrations import run_migrations
+from app.models.models import User
+from app.services.portfolio_service import PORTFOLIO_CHUNK_SIZE, PORTFOLIO_WORKERS, portfolio_service
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Пакетная оценка портфеля заявок")
+    parser.add_argument("input", help="Файл портфеля (.csv или .xlsx)")
+    parser.add_argument("--output", default="portfolio_results.csv", help="Куда записать результаты")
+    parser.add_argument("--user", default="admin", help="Логин, от имени которого сохраняются заявки")
+    parser.add_argument("--workers", type=int, default=PORTFOLIO_WORKERS)
+    parser.add_argument("--chunk", type=int, default=PORTFOLIO_CHUNK_SIZE)
+    args = parser.parse_args()
+
+    Base.metadata.create_all(bind=engine)
+    run_migrations(engine)
+
+    db = SessionLocal()
+    try:
+        user = db.query(User).filter(User.username == args.user).first()
+        if not user:
+            print(f"Пользователь {args.user} не найден")
+            sys.exit(1)
+        run = portfolio_service.start_run(db, user.id, os.path.basename(args.input))
+        user_id, run_id = user.id, run.id
+    finally:
+        db.close()
+
+    portfolio_service.workers = args.workers
+    portfolio_service.chunk_size = args.chunk
+
+    def progress(run):
+        print(f"\rПрочитано: {run.rows_read}, оценено: {run.rows_scored}, с ошибками: {run.rows_failed}", end="", flush=True)
+
+    with open(args.output, "w", encoding="utf-8", newline="") as out:
+        for part in portfolio_service.process_file(open(args.input, "rb"), args.input, run_id, user_id, progress):
+            out.write(part)
+    print()
+
+    db = SessionLocal()
+    try:
+        run = portfolio_service.get_run(db, run_id)
+        if run.status != "done":
+            print(f"Ошибка: {run.error}")
+            sys.exit(1)
+        print(f"Готово: {args.output}")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
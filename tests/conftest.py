@@ -0,0 +1,11 @@
+"""Общие настройки тестов: БД, архив и лог — во временном каталоге, до импорта app."""
+import os
+import sys
+import tempfile
+
+_tmp = tempfile.mkdtemp(prefix="sme-tests-")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_tmp, 'test.db')}"
+os.environ["ARCHIVE_DIR"] = os.path.join(_tmp, "archive")
+os.environ["LOG_PATH"] = os.path.join(_tmp, "app.log")
+os.environ["PROFILE_DIR"] = os.path.join(_tmp, "profiles")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,82 @@
+"""
+Контроль допуска: пополнение корзины токенов и отказ 429/503 в middleware до чтения тела запроса.
+
+    python -m pytest tests
+"""
+import asyncio
+
+from app.core.admission import AdmissionController, AdmissionMiddleware, EndpointLimits, TokenBucket
+
+
+def test_token_bucket_refills_at_rate():
+    bucket = TokenBucket(capacity=2, now=0.0)
+    assert bucket.take(rate=0.5, capacity=2, now=0.0) == 0.0
+    assert bucket.take(rate=0.5, capacity=2, now=0.0) == 0.0
+    # Корзина пуста: до следующего токена 1 / 0.5 = 2 секунды
+    assert bucket.take(rate=0.5, capacity=2, now=0.0) == 2.0
+    # Через секунду накоплено полтокена — ждать еще секунду
+    assert bucket.take(rate=0.5, capacity=2, now=1.0) == 1.0
+    assert bucket.take(rate=0.5, capacity=2, now=2.0) == 0.0
+    # Долгий простой не копит токенов сверх запаса
+    assert bucket.take(rate=0.5, capacity=2, now=1000.0) == 0.0
+    assert bucket.take(rate=0.5, capacity=2, now=1000.0) == 0.0
+    assert bucket.take(rate=0.5, capacity=2, now=1000.0) > 0
+
+
+def _call(middleware, scope):
+    """Прогоняет запрос через middleware; тело запроса читать нельзя — receive падает"""
+    sent = []
+
+    async def receive():
+        raise AssertionError("тело запроса прочитано до решения о допуске")
+
+    async def send(message):
+        sent.append(message)
+
+    asyncio.run(middleware(scope, receive, send))
+    start = next(m for m in sent if m["type"] == "http.response.start")
+    return start["status"], dict(start["headers"])
+
+
+def _scope(path="/login", method="POST"):
+    return {"type": "http", "method": method, "path": path, "headers": [], "client": ("10.0.0.1", 5000)}
+
+
+def _middleware(limits: EndpointLimits):
+    calls = []
+
+    async def app(scope, receive, send):
+        calls.append(scope["path"])
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b""})
+
+    controller = AdmissionController(limits={"login": limits})
+    return AdmissionMiddleware(app, routes={("POST", "/login"): "login"}, controller=controller), controller, calls
+
+
+def test_rate_limited_request_gets_429_before_body_is_read():
+    middleware, controller, calls = _middleware(EndpointLimits(rate=0.01, burst=2, concurrency=4, by_ip=True))
+    assert [_call(middleware, _scope())[0] for _ in range(2)] == [200, 200]
+
+    status, headers = _call(middleware, _scope())
+    assert status == 429
+    assert int(headers[b"retry-after"]) >= 1
+    assert calls == ["/login", "/login"]
+    stats = controller.stats()["endpoints"]["login"]
+    assert stats["admitted"] == 2 and stats["rate_limited"] == 1 and stats["in_flight"] == 0
+
+    # Другие пути и методы middleware не трогает
+    status, _ = _call(middleware, _scope(method="GET"))
+    assert status == 200
+
+
+def test_busy_class_gets_503_and_slot_is_released():
+    middleware, controller, calls = _middleware(EndpointLimits(rate=100, burst=100, concurrency=1, by_ip=True))
+    assert controller.acquire("login")  # слот занят другим запросом
+    status, headers = _call(middleware, _scope())
+    assert status == 503 and headers[b"retry-after"] == b"1"
+    assert calls == []
+    controller.release("login")
+    status, _ = _call(middleware, _scope())
+    assert status == 200
+    assert controller.stats()["endpoints"]["login"]["in_flight"] == 0
@@ -0,0 +1,99 @@
+"""
+Архивация не должна освобождать id: в SQLite без AUTOINCREMENT новая заявка получает
+max(id) + 1, и после удаления последней заявки новые id совпадали с архивными.
+
+    python -m pytest tests
+"""
+import datetime
+
+from app.models.database import Base, SessionLocal, engine
+from app.models.migrations import run_migrations
+from app.models.models import ArchivedApplication, CreditApplication, FoundRisk, User
+from app.services.archive_service import archive_service
+
+
+def _application(user, days_ago: int) -> CreditApplication:
+    return CreditApplication(
+        user_id=user.id, company_name=f"ООО {user.username}", industry="IT", rating=50,
+        business_description="", financial_data={}, current_ratio=1.0,
+        created_at=datetime.datetime.now() - datetime.timedelta(days=days_ago),
+        risks=[FoundRisk(risk_type="финансовый", source="тест", severity="средний")],
+    )
+
+
+def test_ids_are_not_reused_after_archive_and_user_delete():
+    Base.metadata.create_all(bind=engine)
+    run_migrations(engine)
+    db = SessionLocal()
+    try:
+        alice, bob, carol = (User(username=name, hashed_password="x", role="user") for name in ("alice", "bob", "carol"))
+        db.add_all([alice, bob, carol])
+        db.commit()
+        db.add_all([_application(alice, 400), _application(alice, 400)])
+        db.commit()
+        db.add(_application(bob, 1))  # самая новая заявка, ее владелец будет удален
+        db.commit()
+
+        result = archive_service.archive(db, older_than_days=365, vacuum=False)
+        assert result["archived"] == 2
+        archived_ids = {stub.id for stub in db.query(ArchivedApplication)}
+
+        db.delete(db.get(User, bob.id))
+        db.commit()
+        assert db.query(CreditApplication).count() == 0
+
+        new_ids = []
+        for _ in range(2):
+            application = _application(carol, 0)
+            db.add(application)
+            db.commit()
+            new_ids.append(application.id)
+        assert not archived_ids & set(new_ids)
+        assert min(new_ids) > max(archived_ids)
+
+        # Повторная архивация тех же по возрасту заявок не упирается в первичный ключ архива
+        for application in db.query(CreditApplication):
+            application.created_at = datetime.datetime.now() - datetime.timedelta(days=400)
+        db.commit()
+        assert archive_service.archive(db, older_than_days=365, vacuum=False)["archived"] == 2
+        assert archive_service.get_application(db, min(archived_ids)).user_id == alice.id
+    finally:
+        db.close()
+
+
+def _archived_owners(directory: str) -> list:
+    """user_id всех записей во всех файлах архива (файл — цепочка gzip-блоков)"""
+    import gzip
+    import json
+    import os
+
+    owners = []
+    for name in os.listdir(directory):
+        with gzip.open(os.path.join(directory, name), "rt", encoding="utf-8") as f:
+            owners.extend(json.loads(line)["user_id"] for line in f if line.strip())
+    return owners
+
+
+def test_purge_user_removes_archived_records():
+    Base.metadata.create_all(bind=engine)
+    run_migrations(engine)
+    db = SessionLocal()
+    try:
+        dave, erin = (User(username=name, hashed_password="x", role="user") for name in ("dave", "erin"))
+        db.add_all([dave, erin])
+        db.commit()
+        # Заявки обоих пользователей попадают в один блок одного месяца
+        db.add_all([_application(dave, 400), _application(erin, 400), _application(dave, 400)])
+        db.commit()
+        archive_service.archive(db, older_than_days=365, vacuum=False)
+        erin_ids = [stub.id for stub in db.query(ArchivedApplication).filter(ArchivedApplication.user_id == erin.id)]
+        assert dave.id in _archived_owners(archive_service.archive_dir)
+
+        assert archive_service.purge_user(db, dave.id) == 2
+        assert db.query(ArchivedApplication).filter(ArchivedApplication.user_id == dave.id).count() == 0
+        assert dave.id not in _archived_owners(archive_service.archive_dir)
+        # Чужие архивные заявки читаются по новым смещениям
+        assert [archive_service.get_application(db, app_id).user_id for app_id in erin_ids] == [erin.id]
+        assert archive_service.purge_user(db, dave.id) == 0
+    finally:
+        db.close()
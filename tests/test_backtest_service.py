@@ -0,0 +1,120 @@
+"""
+Бэктест правила должен давать те же рейтинги, что и повторная оценка score_application
+с измененным набором правил, а снимок истории — следовать за удалением заявок.
+
+    python -m pytest tests
+"""
+import numpy as np
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app.core.shared_state import bump, stats_generation
+from app.models.database import Base
+from app.models.models import ApplicationData, CreditApplication
+from app.services.analysis_service import analysis_service
+from app.services.backtest_service import RATING_BINS, BacktestService
+from app.services.kb_service import CompiledRule
+
+
+def _rule(rule_id, field, op, val):
+    return CompiledRule(id=rule_id, risk_type="финансовый", rule_name=f"Правило {rule_id}", field=field,
+                        op=op, val=val, severity="средний", recommendation="")
+
+
+RULES = (
+    _rule(1, "current_ratio", "<", 1.5),
+    _rule(2, "debt_to_equity", ">", 2.0),
+    _rule(3, "net_profit_margin", "<", 0.0),
+    _rule(4, "company_age", "<", 1),
+    _rule(5, "current_ratio", "<", 0.8),
+    _rule(6, "industry", "==", "Строительство"),
+)
+NO_TEXT_RISK = {"score": 0.0, "reason": ""}
+
+
+def _score(application: ApplicationData, probability: float, rules) -> int:
+    return analysis_service.score_application(application, rules, probability, text_analysis=NO_TEXT_RISK)["rating"]
+
+
+@pytest.fixture
+def history():
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(bind=engine)
+    db = sessionmaker(bind=engine)()
+    rng = np.random.default_rng(1)
+    applications = []
+    for i in range(300):
+        financial = {
+            "current_ratio": round(float(rng.uniform(0.3, 3.0)), 3),
+            "debt_to_equity": round(float(rng.uniform(0.0, 3.5)), 3),
+            "net_profit_margin": round(float(rng.normal(0.05, 0.1)), 3),
+            "company_age": int(rng.integers(0, 15)),
+        }
+        application = ApplicationData(
+            company_name=f"ООО {i}", financial_data=financial, business_description="",
+            industry=str(rng.choice(["IT", "Строительство", "Торговля"])),
+        )
+        # Рейтинг остается в пределах 0..100 — обрезанный рейтинг бэктест восстановить не может
+        probability = float(rng.uniform(0.0, 0.15))
+        applications.append((application, probability))
+        db.add(CreditApplication(
+            user_id=1, company_name=application.company_name, industry=application.industry,
+            business_description="", financial_data={}, rating=_score(application, probability, RULES), **financial,
+        ))
+    db.commit()
+    yield db, applications
+    db.close()
+
+
+@pytest.mark.parametrize("condition, rule_id, rules_after", [
+    # Новое правило — в конец списка
+    ({"field": "debt_to_equity", "op": ">", "val": 1.2}, None,
+     RULES + (_rule(7, "debt_to_equity", ">", 1.2),)),
+    # Порог изменен, правило остается в своей группе на прежнем месте
+    ({"field": "current_ratio", "op": "<", "val": 2.0}, 1,
+     (_rule(1, "current_ratio", "<", 2.0),) + RULES[1:]),
+    # Правило перенесено на другое поле
+    ({"field": "net_profit_margin", "op": "<", "val": 0.05}, 5,
+     RULES[:4] + (_rule(5, "net_profit_margin", "<", 0.05),) + RULES[5:]),
+])
+def test_backtest_matches_score_application(history, condition, rule_id, rules_after):
+    db, applications = history
+    result = BacktestService().backtest(db, condition, RULES, rule_id=rule_id)
+
+    before = np.array([_score(a, p, RULES) for a, p in applications], dtype=np.float64)
+    after = np.array([_score(a, p, rules_after) for a, p in applications], dtype=np.float64)
+    assert result["total"] == len(applications)
+    assert result["changed"] == int((before != after).sum()) > 0
+    assert result["mean_rating_before"] == round(float(before.mean()), 2)
+    assert result["mean_rating_after"] == round(float(after.mean()), 2)
+    assert result["histogram_after"] == np.histogram(after, bins=RATING_BINS)[0].tolist()
+    assert result["crossed_below_50"] == int(((before >= 50) & (after < 50)).sum())
+    for example in result["examples"]:
+        assert example["rating_after"] == after[example["id"] - 1]
+
+
+def test_snapshot_drops_deleted_rows_without_reload(history):
+    db, _ = history
+    service = BacktestService()
+    first = service.get_snapshot(db)
+    assert len(first) == 300
+
+    # Удаление (в том числе перенос в архив) и новая заявка после него
+    db.query(CreditApplication).filter(CreditApplication.id.in_([1, 150, 300])).delete(synchronize_session=False)
+    db.add(CreditApplication(user_id=1, company_name="ООО новая", industry="IT", business_description="",
+                             financial_data={}, rating=70, current_ratio=2.5))
+    db.commit()
+    bump(stats_generation)
+
+    second = service.get_snapshot(db)
+    ids = [row[0] for row in db.query(CreditApplication.id).order_by(CreditApplication.id)]
+    assert second.ids.tolist() == ids
+    assert 300 not in second.ids and 301 in second.ids
+    # Показатели сохранившихся заявок остались на своих строках
+    position = second.ids.tolist().index(2)
+    assert second.column("current_ratio")[position] == db.get(CreditApplication, 2).current_ratio
+    assert second.column("current_ratio")[-1] == 2.5
+    # Уже выданный снимок не меняется
+    assert len(first) == 300
@@ -0,0 +1,73 @@
+"""
+Аналоги заявки: номер и точные показатели видны только владельцу заявки и администратору.
+
+    python -m pytest tests
+"""
+import numpy as np
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app.models.database import Base
+from app.models.models import FINANCIAL_COLUMNS, CreditApplication
+from app.services import comparables_service as comparables_module
+from app.services.comparables_service import ComparablesService
+
+# user_id, показатели
+HISTORY = [
+    (1, {"current_ratio": 1.234, "debt_to_equity": 0.871, "net_profit_margin": 0.0612, "company_age": 5}),
+    (2, {"current_ratio": 1.251, "debt_to_equity": 0.902, "net_profit_margin": 0.0588, "company_age": 5}),
+    (2, {"current_ratio": 1.198, "debt_to_equity": 0.845, "net_profit_margin": 0.0634, "company_age": 6}),
+]
+
+
+@pytest.fixture
+def service(monkeypatch):
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(bind=engine)
+    db = sessionmaker(bind=engine)()
+    for user_id, financial in HISTORY:
+        db.add(CreditApplication(user_id=user_id, company_name="ООО", industry="IT", business_description="",
+                                 financial_data={}, rating=70, **financial))
+    db.commit()
+
+    # Индекс строится синхронно по тестовой БД и без датасета
+    monkeypatch.setattr(comparables_module, "ReadSessionLocal", lambda: sessionmaker(bind=engine)())
+    monkeypatch.setattr(comparables_module, "_load_dataset",
+                        lambda: (np.empty((0, len(FINANCIAL_COLUMNS))), np.empty(0)))
+    service = ComparablesService(k=3)
+    service._build()
+    assert service.ready
+    yield service, db
+    db.close()
+
+
+def test_foreign_comparables_are_anonymized(service):
+    service, db = service
+    comparables = service.find(db, HISTORY[0][1], user_id=1)
+
+    assert len(comparables) == 3
+    own = [c for c in comparables if c["id"] is not None]
+    assert [c["id"] for c in own] == [1]
+    assert own[0]["financial_data"]["net_profit_margin"] == 0.0612
+    for c in comparables:
+        if c["id"] is None:
+            assert c["source"] == "история"
+            assert all(value == round(value, 1) for value in c["financial_data"].values())
+
+
+def test_admin_sees_all_comparables(service):
+    service, db = service
+    comparables = service.find(db, HISTORY[0][1], user_id=1, is_admin=True)
+
+    assert sorted(c["id"] for c in comparables) == [1, 2, 3]
+    assert {c["financial_data"]["net_profit_margin"] for c in comparables} == {0.0612, 0.0588, 0.0634}
+
+
+def test_exclude_id_and_anonymous_viewer(service):
+    service, db = service
+    comparables = service.find(db, HISTORY[1][1], exclude_id=2, user_id=None)
+
+    assert len(comparables) == 2
+    assert all(c["id"] is None for c in comparables)
@@ -0,0 +1,102 @@
+"""
+Мониторинг дрейфа: эталонные децили, PSI/KS и отчет по счетчикам окна.
+
+    python -m pytest tests
+"""
+import numpy as np
+
+from app.models.database import Base, engine
+from app.services.drift_service import (
+    DRIFT_BINS, PROBABILITY_FEATURE, PSI_MODERATE, PSI_SIGNIFICANT, DriftService, build_reference, ks, psi,
+    save_reference,
+)
+from app.models.models import FINANCIAL_COLUMNS
+
+
+def _sample(rng, n: int, shift: float = 0.0) -> tuple:
+    X = np.column_stack([
+        rng.lognormal(0.3 + shift, 0.4, n),       # current_ratio
+        rng.gamma(2.0, 0.6 + shift, n),           # debt_to_equity
+        rng.normal(0.05 - shift / 5, 0.1, n),     # net_profit_margin
+        rng.integers(0, 20, n).astype(float),     # company_age — дискретный
+    ])
+    return X, rng.beta(2, 5 + (-3 if shift else 0), n)
+
+
+def test_reference_bins_are_deciles():
+    rng = np.random.default_rng(0)
+    X, probabilities = _sample(rng, 5000)
+    X[:100, 0] = np.nan  # пропуски в эталон не попадают
+    reference = build_reference(X, probabilities)
+    assert reference["samples"] == 5000
+    assert set(reference["features"]) == set(FINANCIAL_COLUMNS) | {PROBABILITY_FEATURE}
+    for name, feature in reference["features"].items():
+        edges, counts = np.array(feature["edges"]), np.array(feature["counts"])
+        assert len(counts) == len(edges) + 1
+        assert (np.diff(edges) > 0).all()
+        if name != "company_age":
+            # Непрерывный признак: 9 внутренних границ, в каждой корзине 10% выборки
+            assert len(edges) == DRIFT_BINS - 1
+            expected = counts.sum() / DRIFT_BINS
+            assert np.abs(counts - expected).max() <= 1
+    assert sum(reference["features"]["current_ratio"]["counts"]) == 4900
+    # У дискретного признака совпадающие квантили склеиваются, но все примеры учтены
+    assert len(reference["features"]["company_age"]["edges"]) <= DRIFT_BINS - 1
+    assert sum(reference["features"]["company_age"]["counts"]) == 5000
+
+
+def test_psi_and_ks():
+    counts = np.array([100.0] * 10)
+    assert psi(counts, counts) == 0.0 and ks(counts, counts) == 0.0
+    # Масштаб не важен — сравниваются доли
+    assert psi(counts, counts * 3) == 0.0
+    shifted = np.array([0, 0, 0, 0, 0, 100, 200, 300, 200, 200], dtype=float)
+    assert psi(counts, shifted) > PSI_SIGNIFICANT
+    assert ks(counts, shifted) == 0.5
+
+
+def _service(tmp_path, X, probabilities) -> DriftService:
+    path = str(tmp_path / "drift_reference.json")
+    save_reference(build_reference(X, probabilities), path)
+    Base.metadata.create_all(bind=engine)  # отчет читает снимки других воркеров
+    return DriftService(reference_path=path)
+
+
+def test_identical_input_has_no_drift(tmp_path):
+    rng = np.random.default_rng(1)
+    X, probabilities = _sample(rng, 3000)
+    service = _service(tmp_path, X, probabilities)
+    rows = [dict(zip(FINANCIAL_COLUMNS, row)) for row in X]
+    service.observe_batch(rows, probabilities)
+    report = service.report()
+    assert report["samples"] == 3000
+    for feature in report["features"]:
+        # Те же данные попадают в те же корзины, что и при построении эталона
+        assert feature["psi"] == 0.0 and feature["ks"] == 0.0
+        assert feature["status"] == "нет"
+    assert not report["retrain_recommended"]
+
+
+def test_shifted_input_crosses_threshold(tmp_path):
+    rng = np.random.default_rng(2)
+    X, probabilities = _sample(rng, 3000)
+    service = _service(tmp_path, X, probabilities)
+
+    fresh_X, fresh_probabilities = _sample(rng, 2000)
+    for row, probability in zip(fresh_X[:1000], fresh_probabilities[:1000]):
+        service.observe(dict(zip(FINANCIAL_COLUMNS, row)), float(probability))
+    service.observe_batch([dict(zip(FINANCIAL_COLUMNS, row)) for row in fresh_X[1000:]], fresh_probabilities[1000:])
+    report = service.report()
+    assert report["samples"] == 2000
+    assert all(f["psi"] < PSI_MODERATE for f in report["features"])
+
+    shifted_X, shifted_probabilities = _sample(rng, 2000, shift=0.8)
+    service = _service(tmp_path, X, probabilities)
+    service.observe_batch([dict(zip(FINANCIAL_COLUMNS, row)) for row in shifted_X], shifted_probabilities)
+    report = service.report()
+    by_name = {f["name"]: f for f in report["features"]}
+    for name in ("current_ratio", "debt_to_equity", "net_profit_margin", PROBABILITY_FEATURE):
+        assert by_name[name]["psi"] > PSI_SIGNIFICANT
+        assert by_name[name]["status"] == "значительный"
+    assert by_name["company_age"]["psi"] < PSI_MODERATE
+    assert report["retrain_recommended"]
@@ -0,0 +1,46 @@
+"""
+FlatForest (плоские массивы вместо деревьев sklearn) должен давать те же вероятности,
+что и исходный RandomForestClassifier, а вклады признаков — складываться в вероятность.
+
+    python -m pytest tests
+"""
+import numpy as np
+from sklearn.ensemble import RandomForestClassifier
+
+from app.services.forest import FlatForest
+
+
+def _fixture():
+    rng = np.random.default_rng(0)
+    X = np.column_stack([
+        rng.uniform(0.2, 3.0, 600),    # current_ratio
+        rng.uniform(0.0, 5.0, 600),    # debt_to_equity
+        rng.normal(0.05, 0.15, 600),   # net_profit_margin
+        rng.integers(0, 30, 600),      # company_age
+    ])
+    y = ((X[:, 0] < 1.5) & (X[:, 1] > 2.0) | (X[:, 2] < -0.1)).astype(int)
+    y ^= rng.random(600) < 0.05  # шум, чтобы листья были не только чистыми
+    model = RandomForestClassifier(n_estimators=25, max_depth=8, random_state=0).fit(X, y)
+    return model, rng.uniform([0, -1, -0.5, 0], [4, 6, 0.5, 40], size=(300, 4))
+
+
+def test_predict_proba_matches_sklearn():
+    model, X = _fixture()
+    flat = FlatForest.from_sklearn(model)
+    np.testing.assert_allclose(flat.predict_proba(X), model.predict_proba(X), rtol=0, atol=1e-9)
+
+
+def test_predict_proba_survives_save_and_load(tmp_path):
+    model, X = _fixture()
+    path = str(tmp_path / "forest.npz")
+    FlatForest.from_sklearn(model).save(path)
+    np.testing.assert_allclose(FlatForest.load(path).predict_proba(X), model.predict_proba(X), rtol=0, atol=1e-9)
+
+
+def test_contributions_sum_to_probability():
+    model, X = _fixture()
+    flat = FlatForest.from_sklearn(model)
+    probability, contributions = flat.contributions(X)
+    assert contributions.shape == (len(X), 4)
+    np.testing.assert_allclose(probability, model.predict_proba(X)[:, 1], rtol=0, atol=1e-9)
+    np.testing.assert_allclose(flat.expected_value + contributions.sum(axis=1), probability, rtol=0, atol=1e-9)
@@ -0,0 +1,44 @@
+"""
+Логирование: импорт модуля не запускает потоков, после fork дочерний процесс пишет
+через собственный слушатель очереди.
+
+    python -m pytest tests
+"""
+import json
+import logging
+import os
+import subprocess
+import sys
+
+import pytest
+
+from app.core import deps
+
+
+def test_import_starts_no_threads():
+    code = "import threading, app.core.deps; print(threading.active_count())"
+    out = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True,
+                         cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    assert out.stdout.strip() == "1"
+
+
+@pytest.mark.skipif(not hasattr(os, "fork"), reason="нужен fork")
+def test_child_gets_its_own_listener():
+    deps.setup_logging()
+    deps.setup_logging()  # повторный вызов ничего не меняет
+    parent_listener = deps.log_listener
+    pid = os.fork()
+    if pid == 0:
+        code = 1
+        try:
+            if deps.log_listener is not None and deps.log_listener is not parent_listener:
+                logging.getLogger("fork-test").warning(f"из дочернего {os.getpid()}")
+                deps.log_listener.stop()
+                code = 0
+        finally:
+            os._exit(code)
+    _, status = os.waitpid(pid, 0)
+    assert os.waitstatus_to_exitcode(status) == 0
+    with open(deps.LOG_PATH, encoding="utf-8") as f:
+        messages = [json.loads(line)["msg"] for line in f]
+    assert f"из дочернего {pid}" in messages
@@ -0,0 +1,129 @@
+"""
+Миграции на БД в старой схеме: показатели переносятся из JSON в столбцы без потерь,
+повторный запуск ничего не меняет.
+
+    python -m pytest tests
+"""
+import json
+
+import pytest
+from sqlalchemy import create_engine, select, text
+from sqlalchemy.orm import sessionmaker
+
+from app.models.database import Base
+from app.models.migrations import (
+    _add_missing_columns, _backfill_typed_financials, _backfill_typed_financials_python, run_migrations,
+)
+from app.models.models import FINANCIAL_COLUMNS, CreditApplication, FoundRisk, KnowledgeRule
+
+# Схема до миграций: показатели только в JSON, у правил нет столбца field, id без AUTOINCREMENT
+OLD_SCHEMA = [
+    "CREATE TABLE users (id INTEGER PRIMARY KEY, username VARCHAR, hashed_password VARCHAR, role VARCHAR)",
+    "CREATE TABLE applications (id INTEGER PRIMARY KEY, company_name VARCHAR, industry VARCHAR, financial_data JSON, "
+    "business_description VARCHAR, user_id INTEGER REFERENCES users (id) ON DELETE CASCADE, rating INTEGER, "
+    "status VARCHAR, created_at DATETIME)",
+    "CREATE TABLE knowledge_rules (id INTEGER PRIMARY KEY, risk_type VARCHAR, rule_name VARCHAR, condition_json JSON, "
+    "severity VARCHAR, recommendation VARCHAR)",
+    "CREATE TABLE found_risks (id INTEGER PRIMARY KEY, application_id INTEGER REFERENCES applications (id) ON DELETE CASCADE, "
+    "risk_type VARCHAR, source VARCHAR, severity VARCHAR, recommendation VARCHAR)",
+]
+OLD_FINANCIALS = {
+    1: {"current_ratio": 1.2, "debt_to_equity": 2.5, "net_profit_margin": -0.1, "company_age": 3, "revenue": 1000},
+    2: {"current_ratio": "н/д", "company_age": 7, "note": "из отчета"},  # текст остается в JSON
+    3: None,
+    4: {},
+}
+
+
+def _old_engine(path):
+    engine = create_engine(f"sqlite:///{path}")
+    with engine.begin() as conn:
+        for statement in OLD_SCHEMA:
+            conn.execute(text(statement))
+        conn.execute(text("INSERT INTO users (id, username, hashed_password, role) VALUES (1, 'old', 'x', 'user')"))
+        for app_id, data in OLD_FINANCIALS.items():
+            conn.execute(
+                text("INSERT INTO applications (id, company_name, industry, financial_data, business_description, "
+                     "user_id, rating, status) VALUES (:id, :name, 'IT', :data, 'описание', 1, 60, 'Обработан')"),
+                {"id": app_id, "name": f"ООО {app_id}", "data": None if data is None else json.dumps(data)},
+            )
+        conn.execute(text("INSERT INTO found_risks (application_id, risk_type, source, severity) "
+                          "VALUES (1, 'финансовый', 'тест', 'средний')"))
+        conn.execute(text("INSERT INTO knowledge_rules (id, risk_type, rule_name, condition_json, severity) "
+                          "VALUES (1, 'финансовый', 'Ликвидность', :cond, 'критический')"),
+                     {"cond": json.dumps({"field": "current_ratio", "op": "<", "val": 1.5})})
+    return engine
+
+
+@pytest.fixture
+def old_engine(tmp_path):
+    engine = _old_engine(tmp_path / "old.db")
+    yield engine
+    engine.dispose()
+
+
+def _migrate(engine):
+    # Как init_db: сначала недостающие таблицы, затем миграции существующих
+    Base.metadata.create_all(bind=engine)
+    run_migrations(engine)
+
+
+def _dump(engine) -> dict:
+    with engine.connect() as conn:
+        return {
+            table: conn.execute(text(f"SELECT * FROM {table} ORDER BY 1")).all()
+            for table in ("applications", "found_risks", "knowledge_rules", "sqlite_sequence")
+        } | {"schema": conn.execute(text("SELECT type, name, sql FROM sqlite_master ORDER BY name")).all()}
+
+
+def test_migration_preserves_values(old_engine):
+    _migrate(old_engine)
+    db = sessionmaker(bind=old_engine)()
+    try:
+        for app_id, data in OLD_FINANCIALS.items():
+            application = db.get(CreditApplication, app_id)
+            assert application.full_financial_data == {k: v for k, v in (data or {}).items()}
+        first = db.get(CreditApplication, 1)
+        assert (first.current_ratio, first.debt_to_equity, first.net_profit_margin, first.company_age) == (1.2, 2.5, -0.1, 3)
+        assert first.financial_data == {"revenue": 1000}
+        second = db.get(CreditApplication, 2)
+        assert second.current_ratio is None and second.company_age == 7
+        assert second.financial_data == {"current_ratio": "н/д", "note": "из отчета"}
+        assert db.get(KnowledgeRule, 1).field == "current_ratio"
+        assert db.query(FoundRisk).filter(FoundRisk.application_id == 1).count() == 1
+
+        # После пересоздания с AUTOINCREMENT новые id продолжают счетчик
+        db.add(CreditApplication(user_id=1, company_name="ООО новая", financial_data={}))
+        db.commit()
+        assert db.query(CreditApplication).order_by(CreditApplication.id.desc()).first().id == 5
+    finally:
+        db.close()
+
+
+def test_second_run_is_noop(old_engine):
+    _migrate(old_engine)
+    before = _dump(old_engine)
+    _migrate(old_engine)
+    assert _dump(old_engine) == before
+
+
+def _applications(engine) -> list:
+    table = CreditApplication.__table__
+    with engine.connect() as conn:
+        return conn.execute(select(
+            table.c.id, *(table.c[name] for name in FINANCIAL_COLUMNS), table.c.financial_data
+        ).order_by(table.c.id)).all()
+
+
+def test_python_backfill_matches_sql(tmp_path):
+    """Перенос для прочих СУБД (по строкам в Python) дает тот же результат, что и SQL для SQLite"""
+    python_engine, sql_engine = _old_engine(tmp_path / "python.db"), _old_engine(tmp_path / "sql.db")
+    try:
+        _add_missing_columns(python_engine)
+        _backfill_typed_financials_python(python_engine)
+        _add_missing_columns(sql_engine)
+        _backfill_typed_financials(sql_engine)
+        assert _applications(python_engine) == _applications(sql_engine)
+    finally:
+        python_engine.dispose()
+        sql_engine.dispose()
@@ -0,0 +1,58 @@
+"""
+Профилирование запросов: в процессе одновременно снимается один профиль,
+параллельные запросы с флагом выполняются без него.
+
+    python -m pytest tests
+"""
+import asyncio
+import os
+
+from app.core import profiling
+from app.core.profiling import ProfilingMiddleware, list_profiles
+
+
+def _scope(mode: bytes):
+    return {"type": "http", "method": "GET", "path": "/slow", "query_string": b"",
+            "headers": [(b"x-profile", mode)], "client": ("127.0.0.1", 1)}
+
+
+async def _slow_app(scope, receive, send):
+    await asyncio.sleep(0.05)
+    await send({"type": "http.response.start", "status": 200, "headers": []})
+    await send({"type": "http.response.body", "body": b"ok"})
+
+
+def _run_concurrently(middleware, scopes):
+    async def one(scope):
+        sent = []
+
+        async def receive():
+            return {"type": "http.request", "body": b"", "more_body": False}
+
+        async def send(message):
+            sent.append(message)
+
+        await middleware(scope, receive, send)
+        return dict(sent[0]["headers"])
+
+    async def main():
+        return await asyncio.gather(*(one(scope) for scope in scopes))
+
+    return asyncio.run(main())
+
+
+def test_only_one_profile_at_a_time(tmp_path, monkeypatch):
+    monkeypatch.setattr(profiling, "_is_admin", lambda scope: True)
+    middleware = ProfilingMiddleware(_slow_app, profile_dir=str(tmp_path))
+
+    # Два cProfile в одном цикле событий: второй enable() не вызывается
+    headers = _run_concurrently(middleware, [_scope(b"1"), _scope(b"1"), _scope(b"sample")])
+    profiled = [h for h in headers if b"x-profile-id" in h]
+    skipped = [h for h in headers if h.get(b"x-profile-skipped") == b"busy"]
+    assert len(profiled) == 1 and len(skipped) == 2
+    assert [p["id"] for p in list_profiles(profile_dir=str(tmp_path))] == [profiled[0][b"x-profile-id"].decode()]
+
+    # Блокировка освобождается: следующий запрос снова профилируется
+    headers = _run_concurrently(middleware, [_scope(b"1")])
+    assert b"x-profile-id" in headers[0]
+    assert len([name for name in os.listdir(tmp_path) if name.endswith(".json")]) == 2
@@ -0,0 +1,72 @@
+"""
+Текстовая модель: хеширование слов и пар слов, форма и детерминированность прогноза,
+а также цель обучения (метки по финансовой вероятности, а не по рейтингу).
+
+    python -m pytest tests
+"""
+import numpy as np
+from sklearn.linear_model import SGDClassifier
+from scipy.sparse import csr_matrix
+
+from app.services.text_model import HashingTextModel, tokenize, vectorize
+from train_model import text_labels
+
+BITS = 12
+TEXTS = ["Судебные иски и просроченная задолженность", "Рост выручки, новые контракты", "", "суд суд суд"]
+
+
+def test_tokenize_uses_whole_words_and_stems():
+    assert tokenize("Задолженность, задолженности!") == ["задолж", "задолж"]
+    assert "суд" not in tokenize("Продаем судно")
+    assert tokenize("Ёлка") == tokenize("елка")
+
+
+def test_vectorize_is_deterministic_and_normalized():
+    indptr, indices, values = vectorize(TEXTS, bits=BITS)
+    assert indptr.tolist()[0] == 0 and len(indptr) == len(TEXTS) + 1
+    assert ((indices >= 0) & (indices < 1 << BITS)).all()
+    for row in range(len(TEXTS)):
+        row_values = values[indptr[row]:indptr[row + 1]]
+        if TEXTS[row]:
+            assert np.isclose(np.sqrt((row_values.astype(np.float64) ** 2).sum()), 1.0, atol=1e-6)
+        else:
+            assert row_values.size == 0
+    # Признаки — слова и пары соседних слов; повторы копятся в частоте, а не в числе признаков
+    assert indptr[2] - indptr[1] == 4 + 3  # "рост выруч новые контра" — 4 слова и 3 пары
+    assert indptr[4] - indptr[3] == 2  # "суд" и "суд суд"
+    again = vectorize(TEXTS, bits=BITS)
+    for first, second in zip((indptr, indices, values), again):
+        np.testing.assert_array_equal(first, second)
+
+
+def _model() -> HashingTextModel:
+    texts = ["суд иск долг просрочка", "банкротство и суд", "рост выручки", "новые контракты и рост"] * 10
+    indptr, indices, values = vectorize(texts, bits=BITS)
+    X = csr_matrix((values, indices, indptr), shape=(len(texts), 1 << BITS))
+    model = SGDClassifier(loss="log_loss", alpha=1e-4, random_state=0).fit(X, [1, 1, 0, 0] * 10)
+    return HashingTextModel.from_sklearn(model, prior=0.5, bits=BITS)
+
+
+def test_predict_shape_and_determinism(tmp_path):
+    model = _model()
+    probabilities = model.predict_proba(TEXTS)
+    assert probabilities.shape == (len(TEXTS),)
+    assert ((probabilities > 0) & (probabilities < 1)).all()
+    np.testing.assert_array_equal(probabilities, model.predict_proba(TEXTS))
+    assert model.predict_proba(["суд и долг"])[0] > 0.5 > model.predict_proba(["рост выручки"])[0]
+    assert model.risk_scores(["рост выручки"])[0] == 0.0
+
+    path = str(tmp_path / "text_model.npz")
+    model.save(path)
+    np.testing.assert_array_equal(HashingTextModel.load(path).predict_proba(TEXTS), probabilities)
+
+
+def test_text_labels_come_from_financial_probability():
+    ids = np.array([2, 5, 7, 9])
+    probabilities = np.array([0.9, 0.1, np.nan, 0.5])
+    rows, labels = text_labels(ids, probabilities, [1, 2, 5, 7, 9, 10])
+    # id 1 и 10 не участвовали в обучении, у 7 нет вероятности вне выборки
+    assert rows.tolist() == [1, 2, 4]
+    assert labels.tolist() == [1, 0, 1]
+    rows, labels = text_labels(np.empty(0, dtype=np.int64), np.empty(0), [1, 2])
+    assert rows.size == 0 and labels.size == 0
@@ -0,0 +1,28 @@
+"""
+Сопоставление колонок загружаемых таблиц с показателями.
+
+    python -m pytest tests
+"""
+from app.core.utils import FIELD_ALIASES, match_columns
+from app.services.data_service import data_service
+
+COLUMNS = ["Company", "Profit before tax", "Net profit margin", "Debt", "Current Ratio", "Age"]
+
+
+def test_portfolio_prefers_exact_alias():
+    matched = match_columns(COLUMNS, FIELD_ALIASES)
+    assert matched["net_profit_margin"] == ["net_profit_margin", "profit_before_tax"]
+    assert matched["current_ratio"][0] == "current_ratio"
+    assert matched["company_age"] == ["age"]
+
+
+def test_file_order_without_exact_first():
+    matched = match_columns(COLUMNS, FIELD_ALIASES, exact_first=False)
+    assert matched["net_profit_margin"] == ["profit_before_tax", "net_profit_margin"]
+
+
+def test_financial_document_keeps_leftmost_column():
+    contents = (",".join(COLUMNS) + "\nООО Тест,0.3,0.12,2.5,1.4,7\n").encode()
+    parsed = data_service.parse_financial_bytes(contents, "report.csv")
+    # Как до появления портфеля: берется первая колонка слева, содержащая синоним
+    assert parsed == {"current_ratio": 1.4, "debt_to_equity": 2.5, "net_profit_margin": 0.3, "company_age": 7.0}
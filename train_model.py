@@ -6,15 +6,28 @@ import os
 import sys
 
 sys.path.append(os.path.dirname(__file__))
-from app.models.database import SessionLocal
+from sqlalchemy import select
+from app.models.database import ReadSessionLocal
 from app.models.models import CreditApplication
+from app.services.drift_service import build_reference, save_reference
+from app.services.forest import FlatForest
+from app.services.text_model import TEXT_HASH_BITS, HashingTextModel, vectorize
 
 MODEL_PATH = os.path.join(os.path.dirname(__file__), "credit_model.pkl")
+MODEL_FLAT_PATH = os.path.join(os.path.dirname(__file__), "credit_model.npz")
 DATASET_PATH = os.path.join(os.path.dirname(__file__), "final_dataset.csv")
+TEXT_MODEL_PATH = os.path.join(os.path.dirname(__file__), "text_model.npz")
+DRIFT_REFERENCE_PATH = os.path.join(os.path.dirname(__file__), "drift_reference.json")
+# Текстовая модель: минимум описаний для обучения, проходов по истории и размер пачки
+TEXT_MIN_SAMPLES = 50
+TEXT_EPOCHS = 5
+TEXT_CHUNK_SIZE = 10000
 
 def train_credit_model():
     X_data = []
     y_data = []
+    # id заявок из БД в порядке их строк в X_data (идут сразу после строк датасета)
+    db_ids = []
 
     if os.path.exists(DATASET_PATH):
         print(f"Загрузка реального датасета: {DATASET_PATH}")
@@ -41,36 +54,39 @@ def train_credit_model():
         print(f"Файл {DATASET_PATH} не найден. Пропускаем загрузку файла.")
 
     # --- 2. Загрузка данных из Базы Данных (История заявок) ---
+    dataset_count = len(X_data)
     try:
-        db = SessionLocal()
-        apps = db.query(CreditApplication).all()
+        db = ReadSessionLocal()
+        # Только нужные столбцы и потоком (yield_per), без загрузки всей таблицы в ORM-объекты.
+        # Показатели лежат в типизированных колонках — JSON не разбираем
+        rows = db.query(
+            CreditApplication.id, CreditApplication.current_ratio, CreditApplication.debt_to_equity,
+            CreditApplication.net_profit_margin, CreditApplication.company_age,
+            CreditApplication.rating
+        ).execution_options(yield_per=5000)
         
         db_count = 0
-        for app in apps:
-            fin = app.financial_data
-            if not fin: continue
+        defaults = (1.0, 1.0, 0.05, 3)
+        for app_id, *values, rating in rows:
+            if all(v is None for v in values): continue
             
             # Собираем признаки
-            x_row = [
-                fin.get("current_ratio", 1.0),
-                fin.get("debt_to_equity", 1.0),
-                fin.get("net_profit_margin", 0.05),
-                fin.get("company_age", 3)
-            ]
+            x_row = [default if v is None else v for v, default in zip(values, defaults)]
             
             # Если рейтинг не был проставлен, считаем его на лету по правилам
-            # (или используем app.rating если он есть и корректен)
-            if app.rating is None or app.rating == 0:
+            # (или используем rating если он есть и корректен)
+            if rating is None or rating == 0:
                 calc_rating = 100
                 if x_row[0] < 1.5: calc_rating -= 40
                 if x_row[1] > 2.0: calc_rating -= 20
                 
                 target = 1 if calc_rating < 50 else 0
             else:
-                target = 1 if app.rating < 50 else 0
+                target = 1 if rating < 50 else 0
 
             X_data.append(x_row)
             y_data.append(target)
+            db_ids.append(app_id)
             db_count += 1
             
         print(f"Загружено строк из Базы Данных: {db_count}")
@@ -105,12 +121,15 @@ def train_credit_model():
 
     print(f"Начинаем обучение на {len(X_data)} примерах...")
     
-    model = RandomForestClassifier(n_estimators=100, random_state=42)
+    # oob_score: деревья те же, а вероятности "вне выборки" честнее для эталона дрейфа,
+    # чем предсказания на обучающих примерах
+    model = RandomForestClassifier(n_estimators=100, random_state=42, oob_score=True)
     model.fit(X_data, y_data)
     
     # Сохраняем модель
     joblib.dump(model, MODEL_PATH)
-    print(f"Модель сохранена в {MODEL_PATH}")
+    FlatForest.from_sklearn(model).save(MODEL_FLAT_PATH)
+    print(f"Модель сохранена в {MODEL_PATH} (плоская копия: {MODEL_FLAT_PATH})")
     
     # Проверка важности признаков (для информации)
     importances = model.feature_importances_
@@ -120,5 +139,84 @@ def train_credit_model():
     print(f"  Рентабельн.: {importances[2]:.2f}")
     print(f"  Возраст:     {importances[3]:.2f}")
 
+    save_drift_reference(model, X_data)
+
+    oob = getattr(model, "oob_decision_function_", None)
+    if db_ids and oob is not None and oob.shape[1] == 2:
+        train_text_model(np.array(db_ids, dtype=np.int64), oob[dataset_count:dataset_count + len(db_ids), 1])
+    else:
+        print("Текстовая модель не обучена: нет вероятностей вне выборки для заявок из БД.")
+
+def save_drift_reference(model, X_data):
+    """Эталонные гистограммы признаков и вероятности для мониторинга дрейфа (drift_service)"""
+    oob = getattr(model, "oob_decision_function_", None)
+    if oob is None or oob.shape[1] != 2:
+        print("Эталон дрейфа не сохранен: нет вероятностей вне выборки (один класс).")
+        return
+    reference = build_reference(np.asarray(X_data, dtype=np.float64), oob[:, 1])
+    save_reference(reference, DRIFT_REFERENCE_PATH)
+    print(f"Эталон дрейфа сохранен в {DRIFT_REFERENCE_PATH}")
+
+def text_labels(ids: np.ndarray, probabilities: np.ndarray, chunk_ids) -> tuple:
+    """
+    Цель текстовой модели для пачки заявок: позиции в пачке и метки (1 — вероятность дефолта
+    по финансовым показателям от 0.5). Заявки без вероятности пропускаются.
+    """
+    chunk_ids = np.asarray(chunk_ids, dtype=np.int64)
+    if not len(ids):
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    positions = np.minimum(np.searchsorted(ids, chunk_ids), len(ids) - 1)
+    found = (ids[positions] == chunk_ids) & ~np.isnan(probabilities[positions])
+    rows = np.nonzero(found)[0]
+    return rows, (probabilities[positions[rows]] >= 0.5).astype(np.int64)
+
+def train_text_model(ids: np.ndarray, probabilities: np.ndarray):
+    """
+    Модель риска по описанию бизнеса: хешированные слова и пары слов + логистическая регрессия.
+    История читается пачками (partial_fit), поэтому память не зависит от числа заявок.
+
+    Цель — не рейтинг < 50: в рейтинг уже входит штраф эвристики за текст, и модель училась бы
+    повторять эвристику. Вместо этого берется вероятность дефолта основной модели вне выборки
+    (oob) — она зависит только от финансовых показателей. ids — id заявок, probabilities — их вероятности.
+    """
+    from scipy.sparse import csr_matrix
+    from sklearn.linear_model import SGDClassifier
+
+    order = np.argsort(ids)
+    ids, probabilities = ids[order], np.asarray(probabilities, dtype=np.float64)[order]
+    condition = (
+        CreditApplication.business_description.isnot(None),
+        CreditApplication.business_description != "",
+    )
+    try:
+        db = ReadSessionLocal()
+        with_text = np.fromiter((row[0] for row in db.query(CreditApplication.id).filter(*condition)), dtype=np.int64)
+        _, labels = text_labels(ids, probabilities, with_text)
+        total, positives = len(labels), int(labels.sum())
+        if total < TEXT_MIN_SAMPLES or positives in (0, total):
+            print(f"Текстовая модель не обучена: мало описаний ({total}) или один класс. Используется эвристика.")
+            db.close()
+            return
+
+        print(f"Обучение текстовой модели на {total} описаниях...")
+        model = SGDClassifier(loss="log_loss", alpha=1e-6, random_state=42)
+        query = select(CreditApplication.id, CreditApplication.business_description).where(*condition).order_by(CreditApplication.id)
+        for _ in range(TEXT_EPOCHS):
+            for chunk in db.execute(query.execution_options(yield_per=TEXT_CHUNK_SIZE)).partitions():
+                rows, y = text_labels(ids, probabilities, [app_id for app_id, _ in chunk])
+                if not len(rows):
+                    continue
+                texts = [chunk[i][1] for i in rows]
+                indptr, indices, values = vectorize(texts)
+                X = csr_matrix((values, indices, indptr), shape=(len(texts), 1 << TEXT_HASH_BITS))
+                model.partial_fit(X, y, classes=np.array([0, 1]))
+        db.close()
+    except Exception as e:
+        print(f"Не удалось обучить текстовую модель: {e}")
+        return
+
+    HashingTextModel.from_sklearn(model, prior=positives / total).save(TEXT_MODEL_PATH)
+    print(f"Текстовая модель сохранена в {TEXT_MODEL_PATH}")
+
 if __name__ == "__main__":
     train_credit_model()
\ No newline at end of file